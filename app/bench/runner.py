@@ -0,0 +1,160 @@
+import argparse
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List, NamedTuple
+
+from app.bench.synthetic import SPECS, generate
+from app.util.scan import toscons
+
+BASELINE = Path(__file__).parent / "baseline.json"
+# file reading happens in scan_macros, the first phase asking for results
+PHASES = [
+    "scan_dir_and_file",
+    "search_c_cxx_file",
+    "scan_macros",
+    "scan_and_search_main",
+    "classify_dirs",
+    "search_includes",
+    "write_in_SConscript",
+]
+# allowed on top of the threshold, timings of short phases are mostly noise
+SLACK_SECONDS = 0.02
+
+
+class PhaseResult(NamedTuple):
+    """
+    best time in seconds over the repeats and peak of python memory in bytes
+    """
+
+    seconds: float
+    peak: int
+
+
+def run_once(src: Path, trace: bool, **kwargs) -> Dict[str, PhaseResult]:
+    """
+    run every phase of toscons on src, SConscripts are removed first
+    peak memory is only measured if trace is True, tracing slows python down
+    """
+    for p in src.rglob("SConscript"):
+        p.unlink()
+    T = toscons(src, **kwargs)
+    res: Dict[str, PhaseResult] = {}
+    for phase in PHASES:
+        if trace:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        getattr(T, phase)()
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else 0
+        res[phase] = PhaseResult(seconds, peak)
+    return res
+
+
+def run(src: Path, repeat: int = 3, **kwargs) -> Dict[str, PhaseResult]:
+    """
+    best time of each phase over repeat runs and peak memory of a traced run
+    """
+    runs = [run_once(src, False, **kwargs) for _ in range(repeat)]
+    tracemalloc.start()
+    try:
+        traced = run_once(src, True, **kwargs)
+    finally:
+        tracemalloc.stop()
+    return {
+        phase: PhaseResult(min(r[phase].seconds for r in runs), traced[phase].peak)
+        for phase in PHASES
+    }
+
+
+def compare(
+    res: Dict[str, PhaseResult], baseline: Dict[str, Dict], threshold: float
+) -> List[str]:
+    """
+    return a message for each phase slower than its baseline by more than
+    threshold, e.g. 0.2 for 20%, plus SLACK_SECONDS
+    """
+    failures: List[str] = []
+    for phase, (seconds, _) in res.items():
+        if phase not in baseline:
+            continue
+        ref = baseline[phase]["seconds"]
+        if seconds > ref * (1 + threshold) + SLACK_SECONDS:
+            failures.append(
+                "{} took {:.3f}s, baseline is {:.3f}s (+{:.0%})".format(
+                    phase, seconds, ref, seconds / ref - 1 if ref else 1
+                )
+            )
+    return failures
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="time each scan phase on a synthetic source tree"
+    )
+    parser.add_argument("--spec", choices=sorted(SPECS), default="small")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-j", "--jobs", type=int, default=1)
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="measure a run with a warm scan cache instead of a cold one",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        default=BASELINE,
+        help="json file of reference timings, by spec name",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="fail when a phase is slower than baseline by this ratio",
+    )
+    parser.add_argument(
+        "--save", action="store_true", help="store results as the new baseline"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    key = args.spec + ("-cache" if args.cache else "")
+    root = Path(tempfile.mkdtemp())
+    try:
+        src = generate(root, SPECS[args.spec])
+        if args.cache:
+            # fill the cache, then measure runs reusing it
+            toscons(src).scan()
+        res = run(src, args.repeat, jobs=args.jobs, use_cache=args.cache)
+    finally:
+        shutil.rmtree(root)
+    for phase, (seconds, peak) in res.items():
+        print("{:<22} {:>9.4f}s {:>10.1f} KiB".format(phase, seconds, peak / 1024))
+    baselines: Dict[str, Dict] = {}
+    if args.baseline.exists():
+        baselines = json.loads(args.baseline.read_text())
+    if args.save:
+        baselines[key] = {
+            p: {"seconds": round(r.seconds, 4), "peak": r.peak} for p, r in res.items()
+        }
+        args.baseline.write_text(json.dumps(baselines, indent=2) + "\n")
+        return 0
+    if key not in baselines:
+        print(f"no baseline for {key}, use --save to store one")
+        return 0
+    failures = compare(res, baselines[key], args.threshold)
+    for msg in failures:
+        print(msg)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    logging.disable(logging.WARNING)
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from app.bench.runner import BASELINE, PhaseResult, compare
+from app.bench.synthetic import SPECS, generate
+
+# run in a fresh interpreter, prints the timings as json
+PROBE = """
+import json, sys, time
+from pathlib import Path
+start = time.perf_counter()
+import app.util.scan
+imported = time.perf_counter()
+T = app.util.scan.toscons(Path(sys.argv[1]), use_cache=False)
+T.scan()
+scanned = time.perf_counter()
+T.render_SConscripts()
+rendered = time.perf_counter()
+print(json.dumps({"import": imported - start, "render": rendered - scanned}))
+"""
+
+
+def probe(src: Path, cache_dir: Path) -> Dict[str, float]:
+    """
+    import and first render times of a new process using cache_dir as
+    template cache, and the wall time of the whole process
+    """
+    env = dict(os.environ, TOSCONS_TEMPLATE_CACHE=str(cache_dir))
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE, str(src)],
+        check=True,
+        capture_output=True,
+        env=env,
+        cwd=Path(__file__).parents[2],
+    ).stdout
+    res = json.loads(out)
+    res["process"] = time.perf_counter() - start
+    return res
+
+
+def run(src: Path, repeat: int = 5) -> Dict[str, PhaseResult]:
+    """
+    best times over repeat processes, render_cold is the first render with
+    an empty template cache, render_warm the following ones
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold = probe(src, Path(cache_dir))
+        warm: List[Dict[str, float]] = [
+            probe(src, Path(cache_dir)) for _ in range(repeat)
+        ]
+    return {
+        "import": PhaseResult(min(r["import"] for r in warm + [cold]), 0),
+        "render_cold": PhaseResult(cold["render"], 0),
+        "render_warm": PhaseResult(min(r["render"] for r in warm), 0),
+        "process": PhaseResult(min(r["process"] for r in warm), 0),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="time the import of the scanner and the first render"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--save", action="store_true")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as root:
+        res = run(generate(Path(root), SPECS["tiny"]), args.repeat)
+    for name, (seconds, _) in res.items():
+        print("{:<22} {:>9.4f}s".format(name, seconds))
+    baselines: Dict[str, Dict] = {}
+    if args.baseline.exists():
+        baselines = json.loads(args.baseline.read_text())
+    if args.save:
+        baselines["startup"] = {
+            name: {"seconds": round(r.seconds, 4), "peak": r.peak}
+            for name, r in res.items()
+        }
+        args.baseline.write_text(json.dumps(baselines, indent=2) + "\n")
+        return 0
+    if "startup" not in baselines:
+        print("no startup baseline, use --save to store one")
+        return 0
+    failures = compare(res, baselines["startup"], args.threshold)
+    for msg in failures:
+        print(msg)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
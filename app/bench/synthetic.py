@@ -0,0 +1,130 @@
+import os
+import random
+from pathlib import Path
+from typing import List, NamedTuple
+
+C_SUFFIXES = [".c", ".cpp", ".cxx"]
+H_SUFFIXES = [".h", ".hxx", ".hpp"]
+
+
+class TreeSpec(NamedTuple):
+    """
+    shape of a synthetic source tree
+    dirs: number of directories holding sources
+    files: number of source files per directory, each with a header
+    lines: number of lines of a source file
+    density: part of the lines which are preprocessor directives
+    depth: directories are nested up to this depth below src
+    outliers: number of huge sources, each outlier_lines long
+    mains: part of the sources holding a main
+    seed: the same spec always gives the same tree
+    """
+
+    dirs: int = 50
+    files: int = 10
+    lines: int = 300
+    density: float = 0.05
+    depth: int = 3
+    outliers: int = 2
+    outlier_lines: int = 100000
+    mains: float = 0.05
+    seed: int = 0
+
+
+# mtime given to every entry, old enough for the scan cache to keep them
+MTIME_NS = 10 ** 18
+
+SPECS = {
+    "tiny": TreeSpec(dirs=5, files=3, lines=50, outliers=1, outlier_lines=2000),
+    "small": TreeSpec(),
+    "large": TreeSpec(dirs=400, files=20, lines=500, outliers=10),
+}
+
+
+def dir_names(spec: TreeSpec, rnd: random.Random) -> List[Path]:
+    """
+    relative paths of the source directories, a directory may be nested in
+    any directory created before it while the depth allows it
+    """
+    res: List[Path] = []
+    for i in range(spec.dirs):
+        parents = [p for p in res if len(p.parts) < spec.depth]
+        if parents and rnd.random() < 0.5:
+            res.append(rnd.choice(parents) / f"dir{i}")
+        else:
+            res.append(Path(f"dir{i}"))
+    return res
+
+
+def source_text(
+    spec: TreeSpec, rnd: random.Random, lines: int, headers: List[str], main: bool
+) -> str:
+    """
+    body of a source or header with lines lines, about spec.density of them
+    being directives
+    """
+    out: List[str] = []
+    depth = 0
+    for n in range(lines):
+        if rnd.random() >= spec.density:
+            out.append(f"    x{n} = f(x{n - 1}, {n}); /* plain code line */")
+            continue
+        kind = rnd.randrange(6)
+        macro = f"MACRO_{rnd.randrange(spec.dirs * 4)}"
+        if kind == 0 and headers:
+            out.append('#include "{}"'.format(rnd.choice(headers)))
+        elif kind == 1:
+            out.append(f"#define {macro} {n}")
+        elif kind == 2:
+            out.append(f"#ifdef {macro}")
+            depth += 1
+        elif kind == 3:
+            out.append(f"#if defined({macro}) && !defined {macro}_OFF")
+            depth += 1
+        elif kind == 4 and depth:
+            out.append("#endif")
+            depth -= 1
+        else:
+            out.append("#include <stdio.h>")
+    out.extend(["#endif"] * depth)
+    if main:
+        out.append("int main(int argc, char **argv)")
+        out.append("{")
+        out.append("    return 0;")
+        out.append("}")
+    return "\n".join(out) + "\n"
+
+
+def generate(root: Path, spec: TreeSpec) -> Path:
+    """
+    write a synthetic tree in root / 'src' and return its path
+    all entries get the same mtime so that runs are comparable
+    """
+    rnd = random.Random(spec.seed)
+    src = root / "src"
+    dirs = dir_names(spec, rnd)
+    headers = [
+        f"{d.name}_{i}{H_SUFFIXES[i % len(H_SUFFIXES)]}"
+        for d in dirs
+        for i in range(spec.files)
+    ]
+    sources: List[Path] = []
+    for d in dirs:
+        (src / d).mkdir(parents=True, exist_ok=True)
+        for i in range(spec.files):
+            header = src / d / headers[len(sources)]
+            header.write_text(
+                source_text(spec, rnd, spec.lines // 5, headers, False)
+            )
+            source = src / d / f"{d.name}_{i}{rnd.choice(C_SUFFIXES)}"
+            source.write_text(
+                source_text(spec, rnd, spec.lines, headers, rnd.random() < spec.mains)
+            )
+            sources.append(source)
+    for source in rnd.sample(sources, min(spec.outliers, len(sources))):
+        source.write_text(
+            source_text(spec, rnd, spec.outlier_lines, headers, False)
+        )
+    for p in [src] + list(src.rglob("*")):
+        os.utime(p, ns=(MTIME_NS, MTIME_NS))
+    return src
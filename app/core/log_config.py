@@ -1,4 +1,6 @@
 import logging
+import logging.handlers
+import queue
 
 # create console handler and set level to debug
 ch = logging.StreamHandler()
@@ -10,6 +12,24 @@ formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(messag
 # add formatter to ch
 ch.setFormatter(formatter)
 
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    queue handler leaving the formatting of records to the listener thread,
+    records never leave the process so they are queued as they are
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+# between start_listener and stop_listener records are queued by the scanning
+# thread and written to ch by a listener thread, so that console output never
+# blocks the scan, otherwise they are written to ch at once
+log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+qh = LazyQueueHandler(log_queue)
+listener = logging.handlers.QueueListener(log_queue, ch, respect_handler_level=True)
+
 app_logger = logging.getLogger("app")
 app_logger.addHandler(ch)
 app_logger.setLevel(logging.INFO)
@@ -17,3 +37,33 @@ app_logger.setLevel(logging.INFO)
 main_logger = logging.getLogger("__main__")
 main_logger.addHandler(ch)
 main_logger.setLevel(logging.INFO)
+
+
+def start_listener() -> None:
+    """
+    start the listener thread and queue the records of the loggers to it
+    """
+    listener.start()
+    for log in (app_logger, main_logger):
+        log.removeHandler(ch)
+        log.addHandler(qh)
+
+
+def stop_listener() -> None:
+    """
+    write the records still queued, stop the listener thread and write the
+    next records at once again
+    """
+    for log in (app_logger, main_logger):
+        log.removeHandler(qh)
+        log.addHandler(ch)
+    listener.stop()
+
+
+def set_quiet(quiet: bool = True) -> None:
+    """
+    only log warnings and errors, or info messages again if quiet is False
+    """
+    level = logging.WARNING if quiet else logging.INFO
+    app_logger.setLevel(level)
+    main_logger.setLevel(level)
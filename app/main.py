@@ -1,15 +1,469 @@
+import argparse
+import cProfile
+import json
 import logging
+import os
+import sys
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 import app.core.log_config
 import app.util.scan
+import app.util.watch
+from app.util.cache import ScanCache
+from app.util.condition import parse_defines
+from app.util.ignore import GITIGNORE_NAME, IGNORE_NAME
+from app.util.project import (
+    export_index,
+    load_index,
+    merge_indexes,
+    read_index,
+    write_index,
+)
+from app.util.stats import RunStats
+from app.util.store import DEFAULT_MAX_BYTES, ResultStore
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
-if __name__ == "__main__":
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    (k, n) of a 'K/N' shard argument
+    """
+    try:
+        k, n = (int(i) for i in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not K/N")
+    if not 0 <= k < n:
+        raise argparse.ArgumentTypeError(f"shard {k} not in 0 to {n - 1}")
+    return k, n
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="create SConscript files in C/C++ source directories"
+    )
+    parser.add_argument(
+        "src_path",
+        nargs="*",
+        type=Path,
+        help="directories where sources are stored",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="file listing source directories, one per line, '#' for comments",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of workers analysing files, 0 means one per cpu",
+    )
+    parser.add_argument(
+        "--threads",
+        action="store_true",
+        help="use threads instead of processes, for sources on network mounts",
+    )
+    parser.add_argument(
+        "--async",
+        dest="concurrent_io",
+        type=int,
+        default=0,
+        metavar="N",
+        help="overlap up to N directory listings, stats and reads with asyncio,"
+        " for sources on network file systems",
+    )
+    parser.add_argument(
+        "--git-index",
+        action="store_true",
+        help="take the files from the git index instead of walking directories,"
+        " untracked files such as build outputs are ignored",
+    )
+    parser.add_argument(
+        "--gitignore",
+        action="store_true",
+        help="skip what the .gitignore files of the tree ignore too, not only"
+        " what its .tosconsignore files do",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="read every file again and do not write the scan cache",
+    )
+    parser.add_argument(
+        "--cache-file",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="one scan cache for all source directories instead of one in each",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=None,
+        metavar="DIR",
+        help="directory of file results keyed on content, shared by source"
+        " trees, worktrees and processes",
+    )
+    parser.add_argument(
+        "--store-size",
+        type=int,
+        default=DEFAULT_MAX_BYTES >> 20,
+        metavar="MB",
+        help="size above which the least recently used results are removed",
+    )
+    parser.add_argument(
+        "--export-index",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="write the scan results in FILE, as json if FILE ends with .json,"
+        " as msgpack otherwise",
+    )
+    parser.add_argument(
+        "--from-index",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="take the scan results from FILE written by --export-index instead"
+        " of scanning",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        metavar="K/N",
+        help="scan only the directories of shard K of N and write the results"
+        " given by --export-index instead of SConscripts",
+    )
+    parser.add_argument(
+        "--merge",
+        type=Path,
+        nargs="+",
+        default=None,
+        metavar="PART",
+        help="take the scan results from the indexes of all the shards instead"
+        " of scanning",
+    )
+    parser.add_argument(
+        "--global-cpppath",
+        dest="minimal_cpppath",
+        action="store_false",
+        help="add every directory to CPPPATH instead of the ones each needs",
+    )
+    parser.add_argument(
+        "--precompute-paths",
+        action="store_true",
+        help="resolve include paths when generating and add them with one"
+        " AppendUnique instead of at each scons run",
+    )
+    parser.add_argument(
+        "--decider",
+        default=None,
+        metavar="NAME",
+        help="decider of the generated environment, such as MD5-timestamp",
+    )
+    parser.add_argument(
+        "--scons-cache-dir",
+        default=None,
+        metavar="DIR",
+        help="CacheDir of the generated SConscript, derived files are shared"
+        " by builds",
+    )
+    parser.add_argument(
+        "--implicit-cache",
+        action="store_true",
+        help="set the implicit_cache option of scons in the generated SConscript",
+    )
+    parser.add_argument(
+        "--max-drift",
+        type=int,
+        default=None,
+        metavar="SECONDS",
+        help="set the max_drift option of scons in the generated SConscript",
+    )
+    parser.add_argument(
+        "--keep-existing",
+        dest="update",
+        action="store_false",
+        help="do not replace existing SConscripts, only log how they differ",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and update SConscripts when sources change",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=0.5,
+        help="seconds without change before an update in watch mode",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="in watch mode, poll the tree every SECONDS instead of inotify",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="log only warnings, counted by file instead of one line each",
+    )
+    parser.add_argument(
+        "--stats",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="write timers and counters of the run as json in FILE",
+    )
+    parser.add_argument(
+        "--profile",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="run under cProfile and write pstats data in FILE",
+    )
+    parser.add_argument(
+        "--configs",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="build configurations, one per line: a name then its -D flags",
+    )
+    parser.add_argument(
+        "--config-report",
+        type=Path,
+        default=None,
+        metavar="FILE",
+        help="write as json the sources holding code in each configuration",
+    )
+    args = parser.parse_args(argv)
+    if args.manifest is not None:
+        args.src_path.extend(read_manifest(args.manifest))
+    if not args.src_path:
+        parser.error("no source directory given")
+    if args.watch and len(args.src_path) > 1:
+        parser.error("--watch needs a single source directory")
+    if len(args.src_path) > 1 and (args.export_index or args.from_index):
+        parser.error("--export-index and --from-index need a single source directory")
+    if len(args.src_path) > 1 and (args.shard or args.merge):
+        parser.error("--shard and --merge need a single source directory")
+    if args.shard is not None and args.export_index is None:
+        parser.error("--shard needs --export-index")
+    if args.shard is not None and (args.watch or args.merge or args.from_index):
+        parser.error("--shard can not be used with --watch, --merge or --from-index")
+    if args.merge is not None and args.from_index is not None:
+        parser.error("--merge can not be used with --from-index")
+    if args.config_report is not None and args.configs is None:
+        parser.error("--config-report needs --configs")
+    return args
+
+
+def read_manifest(manifest: Path) -> List[Path]:
+    """
+    source directories listed in manifest, relative ones are taken from the
+    manifest directory
+    """
+    res: List[Path] = []
+    with open(manifest, "r") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                res.append(manifest.parent / line)
+    return res
+
+
+def read_configs(path: Path) -> Dict[str, Dict[bytes, int]]:
+    """
+    build configurations listed in path, one per line: a name followed by
+    its '-DNAME' or '-DNAME=VALUE' flags, '#' starts a comment
+    """
+    res: Dict[str, Dict[bytes, int]] = {}
+    with open(path, "r") as f:
+        for line in f:
+            words = line.split("#", 1)[0].split()
+            if words:
+                res[words[0]] = parse_defines(words[1:])
+    return res
+
+
+def make_pool(jobs: int, threads: bool) -> Optional[Executor]:
+    """
+    worker pool shared by all source directories, None for a serial run
+    """
+    if jobs == 1:
+        return None
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    from concurrent.futures import ProcessPoolExecutor
+
+    pool_class = ThreadPoolExecutor if threads else ProcessPoolExecutor
+    return pool_class(max_workers=jobs)
+
+
+def convert_root(args: argparse.Namespace, T: app.util.scan.toscons) -> None:
+    """
+    fill T from the index given by --from-index, from the shards given by
+    --merge or by scanning its tree, then write its SConscripts and its index
+    """
+    if args.from_index is not None:
+        load_index(T, read_index(args.from_index))
+    elif args.merge is not None:
+        load_index(T, merge_indexes([read_index(p) for p in args.merge]))
+    else:
+        T.scan()
+    # a shard only holds part of the tree, SConscripts are written by the merge
+    if args.shard is None:
+        T.write_in_SConscript(update=args.update)
+    if args.export_index is not None:
+        write_index(export_index(T), args.export_index)
+
+
+def convert(args: argparse.Namespace) -> Dict[Path, app.util.scan.toscons]:
+    """
+    scan each source directory and write its SConscript, the jinja
+    environment, the worker pool, the cache given by --cache-file and the
+    store given by --store are shared by all directories
+    the jinja environment is only made by the first directory rendering
+    SConscripts, a shard never renders any
+    a directory which can not be converted is logged and skipped
+    """
+    cache = None
+    if args.cache_file is not None:
+        cache = ScanCache(args.cache_file, args.use_cache)
+    store = None
+    if args.store is not None:
+        store = ResultStore(args.store, args.store_size << 20)
+    scons = app.util.scan.SConsSettings(
+        precomputed=args.precompute_paths,
+        decider=args.decider,
+        cache_dir=args.scons_cache_dir,
+        implicit_cache=args.implicit_cache,
+        max_drift=args.max_drift,
+    )
+    # rules of the tool file come last and win over the ones of .gitignore
+    ignore_files = (GITIGNORE_NAME, IGNORE_NAME) if args.gitignore else (IGNORE_NAME,)
+    res: Dict[Path, app.util.scan.toscons] = {}
+    env = None
+    pool = make_pool(args.jobs, args.threads)
+    try:
+        for src_path in args.src_path:
+            start = time.perf_counter()
+            try:
+                T = app.util.scan.toscons(
+                    src_path.resolve(),
+                    jobs=args.jobs,
+                    threads=args.threads,
+                    use_cache=args.use_cache,
+                    minimal_cpppath=args.minimal_cpppath,
+                    env=env,
+                    pool=pool,
+                    cache=cache,
+                    aggregate_warnings=args.quiet,
+                    concurrent_io=args.concurrent_io,
+                    git_index=args.git_index,
+                    store=store,
+                    shard=args.shard,
+                    scons=scons,
+                    ignore_files=ignore_files,
+                )
+                convert_root(args, T)
+            except (OSError, ValueError) as e:
+                logger.error(f"{src_path} not converted: {e}")
+                continue
+            if args.shard is None:
+                # made by the rendering, the next directories reuse it
+                env = T.env
+            res[src_path] = T
+            logger.info(
+                "{} converted in {:.3f}s".format(src_path, time.perf_counter() - start)
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    if cache is not None:
+        cache.save()
+    if store is not None:
+        store.trim()
+    return res
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    app.core.log_config.start_listener()
+    try:
+        return run(args)
+    finally:
+        app.core.log_config.stop_listener()
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    convert the source directories of args, logging through the listener
+    thread started by main
+    """
+    if args.quiet:
+        app.core.log_config.set_quiet()
     logger.info("start of main")
-    src_path = Path("C:\\Users\\src")
-    T = app.util.scan.toscons(src_path)
-    T.scan()
-    T.write_in_SconsScript()
+    start = time.perf_counter()
+    profiler = cProfile.Profile() if args.profile is not None else None
+    if profiler is not None:
+        profiler.enable()
+    converted = convert(args)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        logger.info(f"profile written in {args.profile}")
+    if args.configs is not None:
+        configs = read_configs(args.configs)
+        report = {
+            str(p): {
+                name: [T.rel_name(f) for f in files]
+                for name, files in T.active_sources(configs).items()
+            }
+            for p, T in converted.items()
+        }
+        if args.config_report is not None:
+            with open(args.config_report, "w") as f:
+                json.dump(report, f, indent=2)
+                f.write("\n")
+    total = RunStats()
+    for T in converted.values():
+        total.add(T.stats)
+    logger.info(
+        "{} of {} source directories converted in {:.3f}s".format(
+            len(converted), len(args.src_path), time.perf_counter() - start
+        )
+    )
+    logger.info(f"phases: {total.summary()}")
+    if args.stats is not None:
+        total.dump(args.stats, {str(p): T.stats for p, T in converted.items()})
+    if args.watch and converted:
+        T = next(iter(converted.values()))
+        # the shared pool is shut down, updates start their own if needed
+        T.pool = None
+        watcher = app.util.watch.make_watcher(
+            poll=args.poll is not None, interval=args.poll or 1.0, tree=T.git
+        )
+        try:
+            app.util.watch.watch(
+                T, debounce=args.debounce, watcher=watcher, update=args.update
+            )
+        except KeyboardInterrupt:
+            logger.info("end of watch")
+    return 0 if len(converted) == len(args.src_path) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
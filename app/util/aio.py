@@ -0,0 +1,113 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.util.cache import ScanCache
+
+Run = Callable[..., Awaitable[Any]]
+
+
+def _runner(executor: ThreadPoolExecutor, limit: int) -> Run:
+    """
+    return a coroutine function calling a blocking function in executor,
+    at most limit calls are in flight
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(f: Callable, *args: Any) -> Any:
+        async with semaphore:
+            return await loop.run_in_executor(executor, f, *args)
+
+    return run
+
+
+def _loop_running() -> bool:
+    """
+    True if an event loop is running in this thread, asyncio.run cannot be
+    called from it
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _run(concurrency: int, main: Callable[[Run], Awaitable[Any]]) -> Any:
+    """
+    run main in a new event loop with a runner of concurrency threads
+    when called from a running event loop, e.g. from a coroutine, the new
+    loop runs in a thread of its own, the calling loop is blocked until it
+    is done as with any blocking call
+    """
+
+    async def start() -> Any:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return await main(_runner(executor, concurrency))
+
+    if _loop_running():
+        with ThreadPoolExecutor(max_workers=1) as loop_thread:
+            return loop_thread.submit(asyncio.run, start()).result()
+    return asyncio.run(start())
+
+
+async def _list_dir(cache: ScanCache, p: Path, run: Run) -> List[Tuple[str, bool]]:
+    """
+    same as cache.list_dir, file system calls going through run
+    """
+    if not cache.enabled:
+        return await run(cache.fs.list_dir, p)
+    mtime = (await run(cache.fs.stat, p)).st_mtime_ns
+    entries = cache.lookup_dir(p, mtime)
+    if entries is None:
+        entries = await run(cache.fs.list_dir, p)
+    cache.store_dir(p, mtime, entries)
+    return entries
+
+
+def list_tree(
+    cache: ScanCache,
+    tops: List[Path],
+    concurrency: int,
+    prune: Optional[Callable[[Path, List[Tuple[str, bool]]], Any]] = None,
+) -> Dict[Path, List[Tuple[str, bool]]]:
+    """
+    entries of tops and of every directory below them, entries starting with
+    '.' aside, listing a directory as soon as its parent is listed
+    prune gives the entries kept from the entries of a directory, it is
+    called in the event loop, a directory after its parent
+    """
+    res: Dict[Path, List[Tuple[str, bool]]] = {}
+
+    async def visit(p: Path, run: Run) -> None:
+        entries = await _list_dir(cache, p, run)
+        if prune is not None:
+            entries = prune(p, entries)
+        res[p] = entries
+        await asyncio.gather(
+            *(
+                visit(p / name, run)
+                for name, is_dir in entries
+                if is_dir and not name.startswith(".")
+            )
+        )
+
+    async def main(run: Run) -> None:
+        await asyncio.gather(*(visit(p, run) for p in tops))
+
+    _run(concurrency, main)
+    return res
+
+
+def map_concurrent(f: Callable, items: List[Any], concurrency: int) -> List[Any]:
+    """
+    results of f for each of items, in order, f being a blocking function
+    such as a stat or a read followed by the analysis of the file read
+    """
+
+    async def main(run: Run) -> List[Any]:
+        return await asyncio.gather(*(run(f, item) for item in items))
+
+    return _run(concurrency, main)
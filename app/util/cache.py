@@ -0,0 +1,222 @@
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from app import __version__
+from app.util.pack import packb, unpackb
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = ".toscons_cache"
+CACHE_FORMAT = 8
+# entries modified this close to the end of a run may change again within the
+# same mtime tick, they are not kept (same idea as git "racily clean" entries)
+RACY_NS = 2 * 10 ** 9
+
+Signature = Tuple[int, int, int]
+
+
+def file_signature(st: os.stat_result) -> Signature:
+    """
+    (size, mtime_ns, inode) of a stat result
+    """
+    return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def scan_dir(dir_path: Path) -> List[Tuple[str, bool]]:
+    """
+    return sorted (name, is_dir) entries of dir_path
+    is_dir comes from the directory entry, no stat is needed on most systems
+    symbolic links to directories are left out as git does, a link to a
+    directory above would be walked forever
+    """
+    entries: List[Tuple[str, bool]] = []
+    with os.scandir(dir_path) as it:
+        for e in it:
+            if e.name.startswith(CACHE_NAME):
+                continue
+            is_dir = e.is_dir(follow_symlinks=False)
+            if not is_dir and e.is_symlink() and e.is_dir():
+                logger.info(f"symbolic link {e.path} to a directory not followed")
+                continue
+            entries.append((e.name, is_dir))
+    return sorted(entries)
+
+
+def _check(kind: type, value: Any) -> Any:
+    """
+    value if it is of type kind, bool not being taken as an int
+    raise TypeError otherwise
+    """
+    if type(value) is not kind:
+        raise TypeError(f"{value!r} is not of type {kind.__name__}")
+    return value
+
+
+class LocalFS:
+    """
+    file system calls made by a scan, another implementation, e.g. adding
+    the latency of a network file system, can be given to ScanCache
+    """
+
+    def list_dir(self, dir_path: Path) -> List[Tuple[str, bool]]:
+        return scan_dir(dir_path)
+
+    def stat(self, p: Path) -> os.stat_result:
+        return os.stat(p)
+
+    def open(self, p: Path) -> BinaryIO:
+        return open(p, "rb")
+
+
+class ScanCache:
+    """
+    on disk cache of directory listings and per file analysis results
+    directories are keyed on their mtime, files on their stat signature
+    the cache is dropped when the tool version or the cache format changes
+    the file is msgpack data, a cache committed in the tree converted is
+    read as data only, file results are plain data too, see
+    app.util.project.dump_analysis
+    """
+
+    def __init__(
+        self, path: Path, enabled: bool = True, fs: Optional[LocalFS] = None
+    ) -> None:
+        """
+        path is the cache file, usually src_path / CACHE_NAME
+        fs makes the file system calls of the scans using the cache
+        """
+        self.path = path
+        self.enabled = enabled
+        self.fs = LocalFS() if fs is None else fs
+        self.key = (CACHE_FORMAT, __version__)
+        self.dirs: Dict[str, Tuple[int, List[Tuple[str, bool]]]] = {}
+        self.files: Dict[str, Tuple[Signature, Any, Any]] = {}
+        self.new_dirs: Dict[str, Tuple[int, List[Tuple[str, bool]]]] = {}
+        self.new_files: Dict[str, Tuple[Signature, Any, Any]] = {}
+        if enabled:
+            self.load()
+
+    def load(self) -> None:
+        """
+        read the cache file, a missing, outdated or malformed file gives an
+        empty cache
+        """
+        try:
+            with open(self.path, "rb") as f:
+                key, dirs, files = unpackb(f.read())
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"cache {self.path} unreadable, ignored ({e})")
+            return
+        if key != list(self.key):
+            logger.info(f"cache {self.path} outdated, ignored")
+            return
+        try:
+            self.dirs = {
+                _check(str, k): (
+                    _check(int, mtime),
+                    [(_check(str, name), _check(bool, is_dir)) for name, is_dir in v],
+                )
+                for k, (mtime, v) in dirs.items()
+            }
+            self.files = {
+                _check(str, k): (
+                    tuple(_check(int, i) for i in sig),
+                    tuple(_check(bool, i) for i in flags),
+                    result,
+                )
+                for k, (sig, flags, result) in files.items()
+            }
+        except (TypeError, ValueError, AttributeError) as e:
+            logger.warning(f"cache {self.path} malformed, ignored ({e})")
+            self.dirs = {}
+            self.files = {}
+
+    def lookup_dir(
+        self, dir_path: Path, mtime: int
+    ) -> Optional[List[Tuple[str, bool]]]:
+        """
+        cached entries of dir_path if its mtime is unchanged, None otherwise
+        no file system call is made
+        """
+        cached = self.dirs.get(str(dir_path))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        return None
+
+    def store_dir(
+        self, dir_path: Path, mtime: int, entries: List[Tuple[str, bool]]
+    ) -> None:
+        self.new_dirs[str(dir_path)] = (mtime, entries)
+
+    def list_dir(self, dir_path: Path) -> List[Tuple[str, bool]]:
+        """
+        return sorted (name, is_dir) entries of dir_path
+        the cached listing is reused while the directory mtime is unchanged
+        """
+        if not self.enabled:
+            return self.fs.list_dir(dir_path)
+        mtime = self.fs.stat(dir_path).st_mtime_ns
+        entries = self.lookup_dir(dir_path, mtime)
+        if entries is None:
+            entries = self.fs.list_dir(dir_path)
+        self.store_dir(dir_path, mtime, entries)
+        return entries
+
+    def get_file(
+        self, fsource: Path, flags: Any, st: Optional[os.stat_result] = None
+    ) -> Optional[Any]:
+        """
+        return the cached result of fsource if its signature and the flags
+        used to compute it are unchanged, None otherwise
+        st is the stat of fsource if it is already known
+        """
+        if not self.enabled:
+            return None
+        key = str(fsource)
+        sig = file_signature(self.fs.stat(fsource) if st is None else st)
+        cached = self.files.get(key)
+        if cached is not None and cached[0] == sig and cached[1] == flags:
+            self.new_files[key] = cached
+            return cached[2]
+        self.new_files[key] = (sig, flags, None)
+        return None
+
+    def put_file(self, fsource: Path, result: Any) -> None:
+        """
+        store the result of fsource, get_file must have been called before
+        """
+        if not self.enabled:
+            return
+        key = str(fsource)
+        sig, flags, _ = self.new_files[key]
+        self.new_files[key] = (sig, flags, result)
+
+    def save(self) -> None:
+        """
+        atomically write entries seen during this run, entries of files or
+        directories modified too recently are dropped
+        """
+        if not self.enabled:
+            return
+        limit = time.time_ns() - RACY_NS
+        dirs = {k: v for k, v in self.new_dirs.items() if v[0] < limit}
+        files = {
+            k: v
+            for k, v in self.new_files.items()
+            if v[2] is not None and v[0][1] < limit
+        }
+        fd, tmp_name = tempfile.mkstemp(dir=self.path.parent, prefix=CACHE_NAME)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(packb((self.key, dirs, files)))
+            os.replace(tmp_name, self.path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        logger.info(f"cache {self.path} writen")
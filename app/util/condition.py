@@ -0,0 +1,449 @@
+import re
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from app.util.directive import Buffer
+
+# a condition is an int constant or a tuple (operator, operands...), leaves
+# are ("defined", name) and ("macro", name), the value of name or 0
+# trees are plain tuples so that they are cached and shared as they are
+Expr = Union[int, Tuple]
+# a condition which could not be read or depends on a macro whose value is
+# not known, it is taken as true in every configuration
+UNKNOWN: Expr = ("unknown",)
+
+TOKEN_RE = re.compile(
+    rb"[ \t]*(?:"
+    rb"(0[xX][0-9a-fA-F]+|[0-9]+)[uUlL]*"
+    rb"|'(\\.|[^'\\])'"
+    rb"|([A-Za-z_]\w*)"
+    rb"|(&&|\|\||<<|>>|<=|>=|==|!=|[-+*/%<>&^|!~?:(),])"
+    rb")"
+)
+CHAR_ESCAPES = {b"n": 10, b"t": 9, b"r": 13, b"0": 0, b"\\": 92, b"'": 39}
+BINARY = {
+    b"||": 1,
+    b"&&": 2,
+    b"|": 3,
+    b"^": 4,
+    b"&": 5,
+    b"==": 6,
+    b"!=": 6,
+    b"<": 7,
+    b">": 7,
+    b"<=": 7,
+    b">=": 7,
+    b"<<": 8,
+    b">>": 8,
+    b"+": 9,
+    b"-": 9,
+    b"*": 10,
+    b"/": 10,
+    b"%": 10,
+}
+# operators whose value is already 0 or 1
+BOOLEAN = frozenset(("defined", "!", "&&", "||", "==", "!=", "<", ">", "<=", ">="))
+# cpp words which are not macros
+CONSTANTS = {b"true": 1, b"false": 0}
+# comments and blanks, what follows them in a region is code
+BLANK_RE = re.compile(rb"(?:[ \t\r\n\f\v]+|/\*[^*]*\*+(?:[^/*][^*]*\*+)*/|//[^\n]*)*")
+
+
+def _div(x: int, y: int) -> int:
+    if y == 0:
+        return 0
+    q = abs(x) // abs(y)
+    return q if (x < 0) == (y < 0) else -q
+
+
+def _mod(x: int, y: int) -> int:
+    return 0 if y == 0 else x - y * _div(x, y)
+
+
+def _shift(x: int, y: int) -> int:
+    # out of range shifts are undefined, 0 keeps values bounded
+    return x << y if 0 <= y < 64 else 0
+
+
+OPERATIONS = {
+    "*": lambda x, y: x * y,
+    "/": _div,
+    "%": _mod,
+    "+": lambda x, y: x + y,
+    "-": lambda x, y: x - y,
+    "<<": _shift,
+    ">>": lambda x, y: x >> y if 0 <= y < 64 else 0,
+    "<": lambda x, y: int(x < y),
+    ">": lambda x, y: int(x > y),
+    "<=": lambda x, y: int(x <= y),
+    ">=": lambda x, y: int(x >= y),
+    "==": lambda x, y: int(x == y),
+    "!=": lambda x, y: int(x != y),
+    "&": lambda x, y: x & y,
+    "^": lambda x, y: x ^ y,
+    "|": lambda x, y: x | y,
+    "&&": lambda x, y: int(bool(x) and bool(y)),
+    "||": lambda x, y: int(bool(x) or bool(y)),
+}
+UNARY = {
+    "!": lambda x: int(not x),
+    "~": lambda x: ~x,
+    "-": lambda x: -x,
+    "+": lambda x: x,
+}
+
+
+def truth(e: Expr) -> Expr:
+    """
+    e as a 0 or 1 value
+    """
+    if isinstance(e, int):
+        return int(e != 0)
+    if e == UNKNOWN or e[0] in BOOLEAN:
+        return e
+    return ("!=", e, 0)
+
+
+def unary(op: str, a: Expr) -> Expr:
+    """
+    op applied to a, folded when a is constant
+    """
+    if a == UNKNOWN:
+        return a
+    if isinstance(a, int):
+        return UNARY[op](a)
+    if op == "!" and a[0] == "!":
+        return truth(a[1])
+    if op == "!" and a[0] == "!=" and a[2] == 0:
+        return (op, a[1])
+    return (op, a)
+
+
+def binary(op: str, a: Expr, b: Expr) -> Expr:
+    """
+    op applied to a and b, folded when they are constant and for '&&' and
+    '||' when one of them decides the result
+    """
+    if op == "&&" or op == "||":
+        absorbing = 0 if op == "&&" else 1
+        for x, y in ((a, b), (b, a)):
+            if isinstance(x, int):
+                return absorbing if truth(x) == absorbing else truth(y)
+    if a == UNKNOWN or b == UNKNOWN:
+        return UNKNOWN
+    if isinstance(a, int) and isinstance(b, int):
+        return OPERATIONS[op](a, b)
+    return (op, a, b)
+
+
+def conditional(c: Expr, a: Expr, b: Expr) -> Expr:
+    if isinstance(c, int):
+        return a if c else b
+    if UNKNOWN in (c, a, b):
+        return UNKNOWN
+    return ("?", c, a, b)
+
+
+class _Parser:
+    """
+    precedence climbing parser of a '#if' expression
+    defined and values map macros defined or undefined earlier in the file
+    to what 'defined(name)' and 'name' are replaced with
+    """
+
+    def __init__(
+        self,
+        expr: bytes,
+        defined: Mapping[bytes, Expr],
+        values: Mapping[bytes, Expr],
+    ) -> None:
+        self.tokens: List[Tuple[int, bytes]] = []
+        pos = 0
+        expr = expr.rstrip()
+        while pos < len(expr):
+            m = TOKEN_RE.match(expr, pos)
+            if m is None or m.end() == pos:
+                raise ValueError(expr)
+            kind = m.lastindex
+            assert kind is not None
+            self.tokens.append((kind, m.group(kind)))
+            pos = m.end()
+        self.pos = 0
+        self.defined = defined
+        self.values = values
+
+    def peek(self) -> Optional[bytes]:
+        if self.pos < len(self.tokens) and self.tokens[self.pos][0] == 4:
+            return self.tokens[self.pos][1]
+        return None
+
+    def next(self) -> Tuple[int, bytes]:
+        if self.pos >= len(self.tokens):
+            raise ValueError("unexpected end")
+        self.pos += 1
+        return self.tokens[self.pos - 1]
+
+    def expect(self, op: bytes) -> None:
+        if self.next() != (4, op):
+            raise ValueError(op)
+
+    def parse(self) -> Expr:
+        res = self.expression()
+        if self.pos != len(self.tokens):
+            raise ValueError("trailing tokens")
+        return res
+
+    def expression(self) -> Expr:
+        c = self.binary(1)
+        if self.peek() != b"?":
+            return c
+        self.pos += 1
+        a = self.expression()
+        self.expect(b":")
+        return conditional(c, a, self.expression())
+
+    def binary(self, min_prec: int) -> Expr:
+        left = self.unary()
+        while True:
+            op = self.peek()
+            if op is None or BINARY.get(op, 0) < min_prec:
+                return left
+            prec = BINARY[op]
+            self.pos += 1
+            left = binary(op.decode(), left, self.binary(prec + 1))
+
+    def unary(self) -> Expr:
+        kind, value = self.next()
+        if kind == 1:
+            if value[:2] in (b"0x", b"0X"):
+                return int(value, 16)
+            return int(value, 8 if len(value) > 1 and value[0:1] == b"0" else 10)
+        if kind == 2:
+            if value[0:1] == b"\\":
+                return CHAR_ESCAPES.get(value[1:], value[1])
+            return value[0]
+        if kind == 3:
+            return self.identifier(value)
+        if value == b"(":
+            res = self.expression()
+            self.expect(b")")
+            return res
+        if value in (b"!", b"~", b"-", b"+"):
+            return unary(value.decode(), self.unary())
+        raise ValueError(value)
+
+    def identifier(self, name: bytes) -> Expr:
+        if name == b"defined":
+            parenthesis = self.peek() == b"("
+            if parenthesis:
+                self.pos += 1
+            kind, macro = self.next()
+            if kind != 3:
+                raise ValueError(macro)
+            if parenthesis:
+                self.expect(b")")
+            return self.defined.get(macro, ("defined", macro))
+        if name in CONSTANTS:
+            return CONSTANTS[name]
+        if self.peek() == b"(":
+            # function like macro, its expansion is not known
+            depth = 0
+            while True:
+                _, value = self.next()
+                depth += {b"(": 1, b")": -1}.get(value, 0)
+                if depth == 0:
+                    return UNKNOWN
+        return self.values.get(name, ("macro", name))
+
+
+def parse_condition(
+    expr: bytes,
+    defined: Mapping[bytes, Expr] = {},
+    values: Mapping[bytes, Expr] = {},
+) -> Expr:
+    """
+    compile the expression of a '#if' or '#elif' into a tree, UNKNOWN if it
+    can not be read
+    defined and values give what 'defined(X)' and 'X' stand for when X was
+    defined or undefined before in the file
+
+    >>> parse_condition(b"defined(A) && (B > 2 || C)")
+    ('&&', ('defined', b'A'), ('||', ('>', ('macro', b'B'), 2), ('macro', b'C')))
+    >>> parse_condition(b"defined A || 1 << 2 == 4", {b"A": 0})
+    1
+    """
+    try:
+        return _Parser(expr, defined, values).parse()
+    except (ValueError, IndexError):
+        return UNKNOWN
+
+
+class GuardBuilder:
+    """
+    follow the conditional blocks of a file, fed with its directives in
+    order and told where code is found, and collect the guards, the
+    conditions under which code of the file is compiled
+    macros defined or undefined outside of any block are applied to the
+    conditions following them, the ones changed inside a block become
+    unknown
+    """
+
+    def __init__(self) -> None:
+        # per open block: guard outside of it, condition of no branch
+        # taken so far, guard of the current branch
+        self.stack: List[List[Expr]] = []
+        self.guards: Dict[Expr, None] = {}
+        self.defined: Dict[bytes, Expr] = {}
+        self.values: Dict[bytes, Expr] = {}
+
+    def guard(self) -> Expr:
+        return self.stack[-1][2] if self.stack else 1
+
+    def code(self) -> None:
+        """
+        code is found at the current point of the file
+        """
+        guard = self.guard()
+        if guard != 0:
+            self.guards[guard] = None
+
+    def _branch(self, c: Expr) -> None:
+        outer, not_taken, _ = self.stack[-1]
+        self.stack[-1][2] = binary("&&", outer, binary("&&", not_taken, c))
+        self.stack[-1][1] = binary("&&", not_taken, unary("!", c))
+
+    def _condition(self, name: bytes, args: bytes, macro: bytes) -> Expr:
+        if name.endswith(b"ifdef") or name.endswith(b"ifndef"):
+            if not macro:
+                return UNKNOWN
+            c = self.defined.get(macro, ("defined", macro))
+            return unary("!", c) if name.endswith(b"ifndef") else c
+        return parse_condition(args, self.defined, self.values)
+
+    def directive(self, name: bytes, args: bytes, macro: bytes) -> None:
+        if name in (b"if", b"ifdef", b"ifndef"):
+            self.stack.append([self.guard(), 1, 0])
+            self._branch(self._condition(name, args, macro))
+        elif not self.stack:
+            if name in (b"define", b"undef") and macro:
+                self._define(name, args, macro)
+            # '#elif', '#else' or '#endif' without '#if' are ignored
+        elif name in (b"elif", b"elifdef", b"elifndef"):
+            self._branch(self._condition(name, args, macro))
+        elif name == b"else":
+            self._branch(1)
+        elif name == b"endif":
+            self.stack.pop()
+        elif name in (b"define", b"undef") and macro:
+            self._define(name, args, macro)
+
+    def _define(self, name: bytes, args: bytes, macro: bytes) -> None:
+        if self.guard() != 1:
+            self.defined[macro] = self.values[macro] = UNKNOWN
+        elif name == b"undef":
+            self.defined[macro] = self.values[macro] = 0
+        else:
+            self.defined[macro] = 1
+            body = args[len(macro) :]
+            value: Expr = UNKNOWN
+            if not body.startswith(b"("):
+                value = parse_condition(body, self.defined, self.values)
+            self.values[macro] = value if isinstance(value, int) else UNKNOWN
+
+    def result(self) -> List[Expr]:
+        """
+        guards of the code of the file, [1] when some code is always
+        compiled and [] when none can be
+        """
+        if any(isinstance(g, int) for g in self.guards):
+            return [1]
+        return list(self.guards)
+
+
+def has_code(buf: Buffer, start: int, end: int) -> bool:
+    """
+    tell if buf[start:end] holds something else than blanks and comments
+    """
+    m = BLANK_RE.match(buf, start, end)
+    return m is not None and m.end() < end
+
+
+def parse_defines(flags: Iterable[str]) -> Dict[bytes, int]:
+    """
+    macros of compiler flags '-DNAME' or '-DNAME=VALUE', the '-D' may be
+    left out, values which are not integers count as 0
+
+    >>> parse_defines(["-DA", "-DB=0x10", "C=abc"])
+    {b'A': 1, b'B': 16, b'C': 0}
+    """
+    res: Dict[bytes, int] = {}
+    for flag in flags:
+        if flag.startswith("-D"):
+            flag = flag[2:]
+        name, sep, value = flag.partition("=")
+        try:
+            res[name.encode()] = int(value, 0) if sep else 1
+        except ValueError:
+            res[name.encode()] = 0
+    return res
+
+
+def evaluate(
+    e: Expr,
+    configs: Sequence[Mapping[bytes, int]],
+    memo: Dict[Expr, List[int]],
+) -> List[int]:
+    """
+    value of e in each configuration, a configuration maps the macros
+    defined to their value
+    values of subtrees are kept in memo, so that a tree shared by many
+    guards is evaluated once for all configurations
+    """
+    res = memo.get(e)
+    if res is not None:
+        return res
+    if isinstance(e, int):
+        res = [e] * len(configs)
+    elif e == UNKNOWN:
+        res = [1] * len(configs)
+    elif e[0] == "defined":
+        res = [int(e[1] in c) for c in configs]
+    elif e[0] == "macro":
+        res = [c.get(e[1], 0) for c in configs]
+    elif e[0] == "?":
+        c, a, b = (evaluate(x, configs, memo) for x in e[1:])
+        res = [y if x else z for x, y, z in zip(c, a, b)]
+    elif len(e) == 2:
+        unary = UNARY[e[0]]
+        res = [unary(x) for x in evaluate(e[1], configs, memo)]
+    else:
+        binary = OPERATIONS[e[0]]
+        res = list(
+            map(binary, evaluate(e[1], configs, memo), evaluate(e[2], configs, memo))
+        )
+    memo[e] = res
+    return res
+
+
+def active_mask(
+    guards: List[Expr],
+    configs: Sequence[Mapping[bytes, int]],
+    memo: Dict[Expr, List[int]],
+) -> int:
+    """
+    bit i is set when one of guards is true in configuration i
+    """
+    mask = 0
+    for g in guards:
+        for i, value in enumerate(evaluate(g, configs, memo)):
+            if value:
+                mask |= 1 << i
+    return mask
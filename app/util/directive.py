@@ -0,0 +1,155 @@
+import mmap
+import re
+from itertools import chain
+from typing import Callable, Iterator, List, NamedTuple, Optional, Union
+
+Buffer = Union[bytes, mmap.mmap]
+
+# a directive line: blanks, '#', blanks, name, blanks and arguments starting
+# with an identifier, the macro name for define, ifdef, ifndef or undef
+# the pattern starting with b"\n" lets the regex engine jump from one line
+# to the next without going back to python
+LINE_PATTERN = rb"([ \t]*#[ \t]*(\w*)[ \t]*((\w*)[^\r\n]*))"
+DIRECTIVE_RE = re.compile(rb"\n" + LINE_PATTERN)
+FIRST_DIRECTIVE_RE = re.compile(LINE_PATTERN)
+# comments inside the arguments of a directive
+COMMENT_RE = re.compile(rb"/\*.*?\*/|//.*", re.S)
+CONTINUATION_RE = re.compile(rb"\\\r?\n")
+DEFINED_RE = re.compile(rb"\bdefined\b[ \t]*(\()?[ \t]*([A-Za-z_]\w*)?[ \t]*(\))?")
+BACKSLASH = ord("\\")
+CR = ord("\r")
+
+
+class Directive(NamedTuple):
+    """
+    preprocessor directive found by iter_directives
+    text: the directive as written, with its continuation lines
+    name: directive name, e.g. b"ifdef", empty for a null directive '#'
+    args: what follows the name, comments removed and lines joined, it may
+    end with blanks
+    macro: identifier starting args, empty if args does not start with one
+    start: position of text in the buffer
+    fields are in the order of the groups of DIRECTIVE_RE, then start
+    """
+
+    text: bytes
+    name: bytes
+    args: bytes
+    macro: bytes
+    start: int
+
+
+def _line_end(buf: Buffer, pos: int) -> int:
+    """
+    position of the b"\\n" ending the logical line holding pos, backslash
+    continuations included, or len(buf)
+    """
+    end = buf.find(b"\n", pos)
+    while end > 0 and (
+        buf[end - 1] == BACKSLASH
+        or (buf[end - 1] == CR and end > 1 and buf[end - 2] == BACKSLASH)
+    ):
+        end = buf.find(b"\n", end + 1)
+    return len(buf) if end == -1 else end
+
+
+def _in_comment_or_string(buf: Buffer, pos: int) -> bool:
+    """
+    tell if pos follows a '//' comment or is inside a string literal opened
+    on its line
+    """
+    prefix = buf[buf.rfind(b"\n", 0, pos) + 1 : pos]
+    if b"//" in prefix:
+        return True
+    return (prefix.count(b'"') - prefix.count(b'\\"')) % 2 == 1
+
+
+def _comment_start(buf: Buffer, start: int, pos: int) -> int:
+    """
+    position of the last block comment opened in buf[start:pos], -1 if none
+    openings inside a '//' comment or a string literal are not counted
+    """
+    opening = buf.rfind(b"/*", start, pos)
+    while opening != -1 and _in_comment_or_string(buf, opening):
+        opening = buf.rfind(b"/*", start, opening)
+    return opening
+
+
+def iter_directives(buf: Buffer) -> Iterator[Directive]:
+    """
+    yield the directives of buf in order, only directive lines are copied
+    a directive is a '#' preceded on its line by blanks only, outside of a
+    block comment
+
+    >>> [d.name for d in iter_directives(b"  #  if A\\n/*\\n#if B\\n*/\\n#endif")]
+    [b'if', b'endif']
+    """
+    first = FIRST_DIRECTIVE_RE.match(buf)
+    matches = DIRECTIVE_RE.finditer(buf)
+    # only the last comment opened before a directive can hold it, so
+    # comments are looked for with rfind when a directive is past the next
+    # opening, whatever the number of comments in between
+    search_from = 0
+    next_comment = buf.find(b"/*")
+    last_end = 0
+    for m in chain((first,) if first is not None else (), matches):
+        start = m.start(1)
+        if start < last_end:
+            # continuation line of the previous directive
+            continue
+        if next_comment != -1 and next_comment < start:
+            opening = _comment_start(buf, search_from, start)
+            if opening != -1:
+                closing = buf.find(b"*/", opening + 2)
+                if closing == -1:
+                    return
+                if closing > start:
+                    search_from = opening
+                    next_comment = opening
+                    continue
+            next_comment = buf.find(b"/*", start)
+        groups = m.groups()
+        text = groups[0]
+        if text.endswith(b"\\"):
+            last_end = _line_end(buf, start)
+            text = buf[start:last_end].rstrip(b"\r")
+            joined = FIRST_DIRECTIVE_RE.match(CONTINUATION_RE.sub(b"", text))
+            assert joined is not None
+            groups = (text,) + joined.groups()[1:]
+        if b"/" in groups[2]:
+            args = COMMENT_RE.sub(b" ", groups[2]).strip()
+            groups = groups[:2] + (args,) + groups[3:]
+        # the next comment may be opened by this directive
+        search_from = start
+        # same as Directive(*groups, start) without the python level __new__
+        yield tuple.__new__(Directive, groups + (start,))
+
+
+def defined_in_expr(
+    expr: bytes, warn: Optional[Callable[[str], None]] = None
+) -> List[bytes]:
+    """
+    return macros tested with 'defined(X)' or 'defined X' in a condition
+
+    >>> defined_in_expr(b"defined(A) && (defined B || C)")
+    [b'A', b'B']
+    """
+    res: List[bytes] = []
+    if b"defined" not in expr:
+        return res
+    for m in DEFINED_RE.finditer(expr):
+        opening, kword, closing = m.groups()
+        if kword is None:
+            if warn is not None:
+                warn(
+                    "error no macro keyword after 'defined' in '{}'".format(
+                        expr.decode(errors="replace")
+                    )
+                )
+        elif opening is not None and closing is None:
+            if warn is not None:
+                warn("in '{}'".format(expr.decode(errors="replace")))
+                warn("error closing ')' is missing")
+        else:
+            res.append(kword)
+    return res
@@ -0,0 +1,300 @@
+import os
+import re
+import stat
+import struct
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from app.util.cache import CACHE_NAME
+
+HEADER = struct.Struct(">4sII")
+EXTENSION = struct.Struct(">4sI")
+FLAG_EXTENDED = 0x4000
+FLAG_STAGE = 0x3000
+FLAG_NAME = 0x0FFF
+EXT_SKIP_WORKTREE = 0x4000
+# regular files, symbolic links are left out as a walk leaves out the ones to
+# directories, gitlinks (submodules) and the directories of a sparse index are
+# not files of the work tree
+FILE_MODES = (0o100644, 0o100755)
+OBJECT_FORMAT_RE = re.compile(rb"^\s*objectformat\s*=\s*sha256\s*$", re.I | re.M)
+MASK32 = 0xFFFFFFFF
+
+# stat data compared by refresh: mtime seconds, mtime nanoseconds, inode,
+# size, truncated to 32 bits as git does
+StatData = Tuple[int, int, int, int]
+
+
+class IndexEntry(NamedTuple):
+    """
+    fixed part of a file entry of the index, the stat data of the file when
+    it was last staged or refreshed, the object id of its staged content and
+    its flags
+    """
+
+    ctime: int
+    ctime_ns: int
+    mtime: int
+    mtime_ns: int
+    dev: int
+    ino: int
+    mode: int
+    uid: int
+    gid: int
+    size: int
+    sha: bytes
+    flags: int
+
+    @property
+    def stat(self) -> StatData:
+        return (self.mtime, self.mtime_ns, self.ino, self.size)
+
+
+def stat_data(st: os.stat_result) -> StatData:
+    return (
+        int(st.st_mtime) & MASK32,
+        st.st_mtime_ns % 10 ** 9,
+        st.st_ino & MASK32,
+        st.st_size & MASK32,
+    )
+
+
+def stat_matches(entry: IndexEntry, st: os.stat_result) -> bool:
+    """
+    tell if st is the stat of the file of entry unchanged since it was
+    staged, the nanoseconds are ignored when git did not record them
+    """
+    data = stat_data(st)
+    if entry.mtime_ns == 0:
+        return entry.mtime == data[0] and entry.stat[2:] == data[2:]
+    return entry.stat == data
+
+
+def find_git_dir(path: Path) -> Optional[Tuple[Path, Path]]:
+    """
+    (work tree, git directory) of the repository holding path, None when
+    path is not in a git work tree
+    a '.git' file, as in linked work trees and submodules, gives the git
+    directory after 'gitdir:'
+    """
+    for work_tree in [path] + list(path.parents):
+        dot_git = work_tree / ".git"
+        if dot_git.is_dir():
+            return work_tree, dot_git
+        if dot_git.is_file():
+            with open(dot_git, "r") as f:
+                line = f.readline().strip()
+            if not line.startswith("gitdir:"):
+                return None
+            git_dir = Path(line[len("gitdir:") :].strip())
+            return work_tree, work_tree / git_dir
+    return None
+
+
+def _varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """
+    offset encoded integer of the path compression of index version 4
+    """
+    c = data[pos]
+    pos += 1
+    value = c & 0x7F
+    while c & 0x80:
+        c = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (c & 0x7F)
+    return value, pos
+
+
+def parse_index(
+    data: bytes, hash_size: int = 20, prefix: str = ""
+) -> Dict[str, IndexEntry]:
+    """
+    entries of a git index file of version 2, 3 or 4 keyed on their path
+    relative to the work tree, conflicted paths once
+    prefix, e.g. 'src/', keeps the entries below it, keyed on their path
+    relative to it
+    raise ValueError if data is not an index this parser understands
+    """
+    if len(data) < HEADER.size + hash_size:
+        raise ValueError("index truncated")
+    signature, version, count = HEADER.unpack_from(data)
+    if signature != b"DIRC":
+        raise ValueError("not a git index")
+    if version not in (2, 3, 4):
+        raise ValueError(f"index version {version} not supported")
+    end = len(data) - hash_size
+    entry = struct.Struct(f">10I{hash_size}sH")
+    unpack = entry.unpack_from
+    new = tuple.__new__
+    find = data.find
+    bprefix = os.fsencode(prefix)
+    skip = len(bprefix)
+    entries: Dict[str, IndexEntry] = {}
+    pos = HEADER.size
+    path = b""
+    for _ in range(count):
+        start = pos
+        fields = unpack(data, pos)
+        pos += entry.size
+        flags = fields[-1]
+        ext_flags = 0
+        if flags & FLAG_EXTENDED:
+            if version < 3:
+                raise ValueError("extended flags in a version 2 index")
+            (ext_flags,) = struct.unpack_from(">H", data, pos)
+            pos += 2
+        if version == 4:
+            strip, pos = _varint(data, pos)
+            nul = find(b"\0", pos)
+            path = path[: len(path) - strip] + data[pos:nul]
+            pos = nul + 1
+        else:
+            length = flags & FLAG_NAME
+            nul = pos + length if length < FLAG_NAME else find(b"\0", pos)
+            path = data[pos:nul]
+            # entries are padded with 1 to 8 NUL to a multiple of 8 bytes
+            pos = start + ((nul - start + 8) & ~7)
+        if nul < 0 or pos > end:
+            raise ValueError("index truncated")
+        if fields[6] not in FILE_MODES or ext_flags & EXT_SKIP_WORKTREE:
+            continue
+        if skip and not path.startswith(bprefix):
+            continue
+        name = path[skip:].decode("utf-8", "surrogateescape")
+        if flags & FLAG_STAGE and name in entries:
+            continue
+        # built from the unpacked fields without the python level __new__
+        entries[name] = new(IndexEntry, fields)
+    while pos + EXTENSION.size <= end:
+        ext, size = EXTENSION.unpack_from(data, pos)
+        if ext == b"link":
+            # entries of a split index are completed by the shared index
+            raise ValueError("split index not supported")
+        pos += EXTENSION.size + size
+    return entries
+
+
+class GitTree:
+    """
+    files of a source directory taken from the index of the git work tree
+    holding it instead of walking the directories, so untracked files such
+    as build outputs are not seen
+    the stat data of the index tells which files changed, see refresh
+    """
+
+    def __init__(self, src_path: Path, work_tree: Path, git_dir: Path) -> None:
+        self.src_path = src_path
+        self.work_tree = work_tree
+        self.git_dir = git_dir
+        self.index_path = git_dir / "index"
+        rel = src_path.relative_to(work_tree).as_posix()
+        self.prefix = "" if rel == "." else rel + "/"
+        self.hash_size = 20
+        config = git_dir / "config"
+        if config.is_file() and OBJECT_FORMAT_RE.search(config.read_bytes()):
+            self.hash_size = 32
+        self.index_sig: Optional[Tuple[int, int]] = None
+        self.entries: Dict[str, IndexEntry] = {}
+        # stat of files found different from their entry by refresh
+        self.dirty: Dict[str, StatData] = {}
+        self.load()
+
+    @classmethod
+    def open(cls, src_path: Path) -> Optional["GitTree"]:
+        """
+        GitTree of src_path, None when src_path is not in a git work tree
+        raise ValueError or OSError when the index can not be read
+        """
+        found = find_git_dir(src_path)
+        if found is None:
+            return None
+        return cls(src_path, *found)
+
+    def load(self) -> bool:
+        """
+        read the index again if it changed, return True if it was read
+        entries below src_path only are kept
+        """
+        st = os.stat(self.index_path)
+        sig = (st.st_mtime_ns, st.st_size)
+        if sig == self.index_sig:
+            return False
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        self.entries = parse_index(data, self.hash_size, self.prefix)
+        self.index_sig = sig
+        return True
+
+    def listings(self) -> Dict[Path, List[Tuple[str, bool]]]:
+        """
+        sorted (name, is_dir) entries of src_path and of every directory
+        below it holding tracked files, as given by a directory listing
+        every tracked file is lstat, the ones deleted or no longer regular
+        files in the work tree are left out, as 'git status' reports them
+        """
+        dirs: Dict[str, List[Tuple[str, bool]]] = {"": []}
+        last = ""
+        entries = dirs[""]
+        # entries are sorted on their path, the files of a directory mostly
+        # follow each other
+        for name in self.entries:
+            try:
+                st = os.lstat(self.src_path / name)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            parent, _, base = name.rpartition("/")
+            if parent != last:
+                last = parent
+                entries = dirs.get(parent)  # type: ignore
+                if entries is None:
+                    entries = dirs[parent] = []
+                    # add the directories not seen yet to their parent
+                    rel = parent
+                    while rel:
+                        up, _, part = rel.rpartition("/")
+                        up_entries = dirs.get(up)
+                        dirs.setdefault(up, []).append((part, True))
+                        if up_entries is not None:
+                            break
+                        rel = up
+            if not base.startswith(CACHE_NAME):
+                entries.append((base, False))
+        return {
+            self.src_path / rel if rel else self.src_path: sorted(entries)
+            for rel, entries in dirs.items()
+        }
+
+    def refresh(self) -> Set[Path]:
+        """
+        paths below src_path changed since the previous refresh, or since
+        the index was loaded the first time: files added, removed or
+        modified in the index, e.g. by a checkout, and files whose stat is
+        no longer the one of their entry, as 'git status' finds them
+        every tracked file is stat but no directory is listed
+        """
+        old = self.entries
+        changed: Set[str] = set()
+        if self.load():
+            changed.update(
+                name
+                for name in old.keys() | self.entries.keys()
+                if old.get(name) != self.entries.get(name)
+            )
+        dirty: Dict[str, StatData] = {}
+        for name, entry in self.entries.items():
+            try:
+                st = os.lstat(self.src_path / name)
+            except OSError:
+                dirty[name] = (0, 0, 0, 0)
+            else:
+                if not stat_matches(entry, st):
+                    dirty[name] = stat_data(st)
+        changed.update(
+            name
+            for name in dirty.keys() | self.dirty.keys()
+            if dirty.get(name) != self.dirty.get(name)
+        )
+        self.dirty = dirty
+        return {self.src_path / name for name in changed}
@@ -0,0 +1,247 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# ignore file of toscons, read in every directory of a tree like .gitignore
+IGNORE_NAME = ".tosconsignore"
+GITIGNORE_NAME = ".gitignore"
+
+GLOB_CHARS = re.compile(r"[*?\[\\]")
+# trailing spaces are dropped unless escaped with a backslash
+TRAILING_SPACES = re.compile(r"(?<!\\) +$")
+
+
+class Rule(NamedTuple):
+    """
+    a line of an ignore file, with the syntax of .gitignore
+    pattern: glob without its '!' and its leading and trailing '/'
+    base: directory of the ignore file relative to the source directory, ''
+    for the source directory itself
+    negated: a '!' rule includes again what earlier rules ignore
+    dir_only: a rule ending with '/' only matches directories
+    anchored: a rule holding a '/' matches paths relative to base, others
+    match names at any depth below base
+    """
+
+    pattern: str
+    base: str
+    negated: bool
+    dir_only: bool
+    anchored: bool
+
+
+def parse_rules(text: str, base: str = "") -> List[Rule]:
+    """
+    rules of the ignore file of directory base whose content is text
+
+    >>> [tuple(r) for r in parse_rules("# out\\n/build/\\n!keep.c\\n*.o", "a")]
+    [('build', 'a', False, True, True), ('keep.c', 'a', True, False, False), \
+('*.o', 'a', False, False, False)]
+    """
+    rules: List[Rule] = []
+    for line in text.splitlines():
+        line = TRAILING_SPACES.sub("", line)
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        elif line.startswith(("\\!", "\\#")):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        anchored = "/" in line
+        line = line.lstrip("/")
+        if line.startswith("**/") and "/" not in line[3:]:
+            # '**/name' is 'name' at any depth
+            line = line[3:]
+            anchored = False
+        if line:
+            rules.append(Rule(line, base, negated, dir_only, anchored))
+    return rules
+
+
+def translate(pattern: str) -> str:
+    """
+    regex matching the same paths as the glob pattern, '*', '?' and '[...]'
+    never match a '/', '**/' matches any directories and a trailing '/**'
+    anything below
+
+    >>> translate("a/**/*.[!o]")
+    'a/(?:.*/)?[^/]*\\\\.[^o]'
+    """
+    res: List[str] = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**", i) and (i == 0 or pattern[i - 1] == "/"):
+            if pattern.startswith("/", i + 2):
+                res.append("(?:.*/)?")
+                i += 3
+                continue
+            if i + 2 == n:
+                res.append(".*")
+                break
+        if c == "*":
+            while pattern.startswith("*", i + 1):
+                i += 1
+            res.append("[^/]*")
+        elif c == "?":
+            res.append("[^/]")
+        elif c == "[" and pattern.find("]", i + 2) != -1:
+            end = pattern.find("]", i + 2)
+            body = pattern[i + 1 : end]
+            head = "^" if body[0] in "!^" else re.escape(body[0])
+            res.append(
+                "[{}{}]".format(
+                    head, "".join(ch if ch == "-" else re.escape(ch) for ch in body[1:])
+                )
+            )
+            i = end
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            res.append(re.escape(pattern[i]))
+        else:
+            res.append(re.escape(c))
+        i += 1
+    return "".join(res)
+
+
+def _combine(globs: List[Tuple[int, str]]) -> Tuple[Optional["re.Pattern"], List[int]]:
+    """
+    one regex for all the globs, the last ones first, and the index of the
+    rule of each of its groups: the group matching is the one of the last
+    rule matching
+    """
+    if not globs:
+        return None, []
+    globs = globs[::-1]
+    regex = re.compile("|".join("({})".format(rx) for _, rx in globs), re.DOTALL)
+    return regex, [i for i, _ in globs]
+
+
+class _Matcher:
+    """
+    rules for either files or directories, compiled: literal names in a
+    dict, literal paths in a trie of their components, the other names and
+    paths in a regex each
+    """
+
+    def __init__(self, rules: List[Tuple[int, Rule]]) -> None:
+        self.names: Dict[str, int] = {}
+        # a node of the trie of literal paths is the index of the last rule
+        # naming its path, -1 if none, and the nodes of the names below it
+        self.trie: list = [-1, {}]
+        name_globs: List[Tuple[int, str]] = []
+        path_globs: List[Tuple[int, str]] = []
+        for i, rule in rules:
+            literal = GLOB_CHARS.search(rule.pattern) is None
+            if not rule.anchored:
+                if literal:
+                    self.names[rule.pattern] = i
+                else:
+                    name_globs.append((i, translate(rule.pattern)))
+            elif literal:
+                node = self.trie
+                path = rule.base + "/" + rule.pattern if rule.base else rule.pattern
+                for part in path.split("/"):
+                    node = node[1].setdefault(part, [-1, {}])
+                node[0] = i
+            else:
+                prefix = re.escape(rule.base + "/") if rule.base else ""
+                path_globs.append((i, prefix + translate(rule.pattern)))
+        self.name_re, self.name_rules = _combine(name_globs)
+        self.path_re, self.path_rules = _combine(path_globs)
+
+    def below(self, rel: str) -> Dict[str, list]:
+        """
+        trie nodes of the entries of directory rel
+        """
+        node = self.trie
+        if rel:
+            for part in rel.split("/"):
+                node = node[1].get(part)
+                if node is None:
+                    return {}
+        return node[1]
+
+    def last(self, below: Dict[str, list], path: str, name: str) -> int:
+        """
+        index of the last rule matching the entry name at path, -1 if none
+        below is the trie nodes of its directory
+        """
+        best = self.names.get(name, -1)
+        node = below.get(name)
+        if node is not None and node[0] > best:
+            best = node[0]
+        if self.name_re is not None:
+            m = self.name_re.fullmatch(name)
+            if m is not None:
+                # every alternative is a group, so one of them matched
+                assert m.lastindex is not None
+                best = max(best, self.name_rules[m.lastindex - 1])
+        if self.path_re is not None:
+            m = self.path_re.fullmatch(path)
+            if m is not None:
+                assert m.lastindex is not None
+                best = max(best, self.path_rules[m.lastindex - 1])
+        return best
+
+
+class IgnoreRules:
+    """
+    rules of the ignore files of a directory and of the directories above
+    it, compiled once, the last rule matching an entry decides as in git
+    an ignored directory is not listed, so nothing below it can be
+    included again
+    """
+
+    def __init__(self, rules: List[Rule]) -> None:
+        self.rules = rules
+        self.files = _Matcher([(i, r) for i, r in enumerate(rules) if not r.dir_only])
+        self.dirs = _Matcher(list(enumerate(rules)))
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def extend(self, rules: List[Rule]) -> "IgnoreRules":
+        """
+        rules of a directory below, whose ignore files hold rules
+        """
+        return IgnoreRules(self.rules + rules)
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        """
+        whether the entry at path, relative to the source directory, is
+        ignored, its directory not being ignored
+        """
+        rel, _, name = path.rpartition("/")
+        matcher = self.dirs if is_dir else self.files
+        i = matcher.last(matcher.below(rel), path, name)
+        return i >= 0 and not self.rules[i].negated
+
+    def filter(
+        self, rel: str, entries: List[Tuple[str, bool]]
+    ) -> Tuple[List[Tuple[str, bool]], int, int]:
+        """
+        (name, is_dir) entries of directory rel not ignored, with the number
+        of directories and of files ignored
+        """
+        below_dirs = self.dirs.below(rel)
+        below_files = self.files.below(rel)
+        prefix = rel + "/" if rel else ""
+        kept: List[Tuple[str, bool]] = []
+        dirs = files = 0
+        for entry in entries:
+            name, is_dir = entry
+            if is_dir:
+                i = self.dirs.last(below_dirs, prefix + name, name)
+            else:
+                i = self.files.last(below_files, prefix + name, name)
+            if i < 0 or self.rules[i].negated:
+                kept.append(entry)
+            elif is_dir:
+                dirs += 1
+            else:
+                files += 1
+        return kept, dirs, files
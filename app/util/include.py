@@ -0,0 +1,130 @@
+import logging
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+from typing import DefaultDict, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+HEADER_SUFFIXES = (".h", ".hpp", ".hxx", ".hh", ".h++", ".H", ".inl", ".tcc")
+INCLUDE_RE = re.compile(rb'[ \t]*(?:"([^"]+)"|<([^>]+)>)')
+
+# an include found in a file: header name as written and True for <...>
+Include = Tuple[bytes, bool]
+
+
+def include_name(args: bytes) -> Optional[Include]:
+    """
+    return the header name of an include directive and whether it is
+    written with angle brackets, None for a computed include
+
+    >>> include_name(b'"rep2/src_2_1.hxx"')
+    (b'rep2/src_2_1.hxx', False)
+    >>> include_name(b"HEADER_MACRO") is None
+    True
+    """
+    m = INCLUDE_RE.match(args)
+    if m is None:
+        return None
+    if m.group(1) is not None:
+        return (m.group(1), False)
+    return (m.group(2), True)
+
+
+class HeaderIndex:
+    """
+    index of the headers found below src_path, built in one pass over the
+    directory contents, giving the directories holding a header name
+    root is src_path, directories found for an include are never above it
+    """
+
+    def __init__(
+        self, dir_content: Mapping[Path, List[Path]], root: Optional[Path] = None
+    ) -> None:
+        self.by_name: DefaultDict[str, List[Path]] = defaultdict(list)
+        # number of parts of root, a directory with fewer is above it
+        self.min_parts = len(root.parts) if root is not None else 1
+        self._add(
+            (rep, (fsource.name for fsource in files))
+            for rep, files in dir_content.items()
+        )
+
+    @classmethod
+    def from_names(
+        cls,
+        dir_names: Iterable[Tuple[Path, Iterable[str]]],
+        root: Optional[Path] = None,
+    ) -> "HeaderIndex":
+        """
+        index built from (directory, file names) pairs, no path is built for
+        the files
+        """
+        index = cls({}, root)
+        index._add(dir_names)
+        return index
+
+    def _add(self, dir_names: Iterable[Tuple[Path, Iterable[str]]]) -> None:
+        for rep, names in dir_names:
+            for name in names:
+                if os.path.splitext(name)[1] in HEADER_SUFFIXES:
+                    self.by_name[name].append(rep)
+
+    def resolve(self, name: bytes) -> List[Path]:
+        """
+        return the directories where name can be found, an include such as
+        'sub/a.h' matches the directories ending with 'sub' holding 'a.h'
+        headers unknown in the tree, e.g. system ones, give []
+        an include naming the directories of root itself, e.g. 'src/a.h'
+        for the header a.h of root 'src', would need the parent of root and
+        gives no directory
+        """
+        parts = name.decode(errors="replace").replace("\\", "/").split("/")
+        dirs = self.by_name.get(parts[-1], [])
+        if len(parts) == 1 or not dirs:
+            return dirs
+        prefix = tuple(parts[:-1])
+        return [
+            rep.parents[len(prefix) - 1]
+            for rep in dirs
+            if len(rep.parts) - len(prefix) >= self.min_parts
+            and rep.parts[-len(prefix) :] == prefix
+        ]
+
+
+def include_graph(
+    includes: Iterable[Tuple[Path, List[Include]]], index: HeaderIndex
+) -> Dict[Path, Set[Path]]:
+    """
+    return the directory level include graph: for each directory, the
+    directories that must be searched for the headers its files include
+    a quoted include of a header of the same directory needs no search path
+    """
+    graph: DefaultDict[Path, Set[Path]] = defaultdict(set)
+    for fsource, file_includes in includes:
+        rep = fsource.parent
+        for name, angle in file_includes:
+            for inc_dir in index.resolve(name):
+                if inc_dir != rep or angle:
+                    graph[rep].add(inc_dir)
+    return graph
+
+
+def minimal_include_dirs(
+    graph: Dict[Path, Set[Path]], reps: Iterable[Path]
+) -> Dict[Path, List[Path]]:
+    """
+    return, for each directory of reps, the sorted directories reachable in
+    graph, i.e. the include paths needed to compile its files
+    """
+    res: Dict[Path, List[Path]] = {}
+    for rep in reps:
+        seen: Set[Path] = set()
+        stack = list(graph.get(rep, ()))
+        while stack:
+            inc_dir = stack.pop()
+            if inc_dir not in seen:
+                seen.add(inc_dir)
+                stack.extend(graph.get(inc_dir, ()))
+        res[rep] = sorted(seen)
+    return res
@@ -0,0 +1,175 @@
+import struct
+from typing import Any, Callable, List, Tuple
+
+# a subset of msgpack: nil, booleans, integers, strings, binaries, arrays and
+# maps, enough for the project index, see app.util.project
+# the msgpack package is used instead when it is installed, files written by
+# one are read by the other
+
+
+def _pack(obj: Any, out: List[bytes]) -> None:
+    if obj is None:
+        out.append(b"\xc0")
+    elif obj is True:
+        out.append(b"\xc3")
+    elif obj is False:
+        out.append(b"\xc2")
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(bytes((obj,)))
+        elif -0x20 <= obj < 0:
+            out.append(struct.pack("b", obj))
+        elif 0 <= obj < 1 << 16:
+            out.append(struct.pack(">BH", 0xCD, obj))
+        elif 0 <= obj < 1 << 32:
+            out.append(struct.pack(">BI", 0xCE, obj))
+        elif 0 <= obj < 1 << 64:
+            out.append(struct.pack(">BQ", 0xCF, obj))
+        elif -(1 << 63) <= obj < 0:
+            out.append(struct.pack(">Bq", 0xD3, obj))
+        else:
+            raise ValueError(f"integer {obj} out of range")
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8", "surrogatepass")
+        n = len(data)
+        if n < 32:
+            out.append(bytes((0xA0 | n,)))
+        elif n < 256:
+            out.append(bytes((0xD9, n)))
+        else:
+            out.append(struct.pack(">BI", 0xDB, n))
+        out.append(data)
+    elif isinstance(obj, (bytes, bytearray)):
+        out.append(struct.pack(">BI", 0xC6, len(obj)))
+        out.append(bytes(obj))
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        out.append(bytes((0x90 | n,)) if n < 16 else struct.pack(">BI", 0xDD, n))
+        for item in obj:
+            _pack(item, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        out.append(bytes((0x80 | n,)) if n < 16 else struct.pack(">BI", 0xDF, n))
+        for key, value in obj.items():
+            _pack(key, out)
+            _pack(value, out)
+    else:
+        raise TypeError(f"can not pack {type(obj).__name__}")
+
+
+def _unpack(data: bytes, pos: int) -> Tuple[Any, int]:
+    c = data[pos]
+    pos += 1
+    if c < 0x80:
+        return c, pos
+    if c >= 0xE0:
+        return c - 0x100, pos
+    if 0xA0 <= c < 0xC0:
+        end = pos + (c & 0x1F)
+        return data[pos:end].decode("utf-8", "surrogatepass"), end
+    if 0x90 <= c < 0xA0:
+        return _unpack_array(data, pos, c & 0x0F)
+    if 0x80 <= c < 0x90:
+        return _unpack_map(data, pos, c & 0x0F)
+    reader = READERS.get(c)
+    if reader is None:
+        raise ValueError(f"msgpack type 0x{c:02x} not supported")
+    return reader(data, pos)
+
+
+def _unpack_array(data: bytes, pos: int, n: int) -> Tuple[List[Any], int]:
+    res = []
+    for _ in range(n):
+        item, pos = _unpack(data, pos)
+        res.append(item)
+    return res, pos
+
+
+def _unpack_map(data: bytes, pos: int, n: int) -> Tuple[dict, int]:
+    res = {}
+    for _ in range(n):
+        key, pos = _unpack(data, pos)
+        res[key], pos = _unpack(data, pos)
+    return res, pos
+
+
+def _sized(fmt: str, then: Callable[[bytes, int, int], Tuple[Any, int]]):
+    s = struct.Struct(fmt)
+
+    def read(data: bytes, pos: int) -> Tuple[Any, int]:
+        (n,) = s.unpack_from(data, pos)
+        return then(data, pos + s.size, n)
+
+    return read
+
+
+def _str(data: bytes, pos: int, n: int) -> Tuple[str, int]:
+    return data[pos : pos + n].decode("utf-8", "surrogatepass"), pos + n
+
+
+def _bin(data: bytes, pos: int, n: int) -> Tuple[bytes, int]:
+    return data[pos : pos + n], pos + n
+
+
+def _value(data: bytes, pos: int, n: int) -> Tuple[int, int]:
+    return n, pos
+
+
+READERS = {
+    0xC0: lambda data, pos: (None, pos),
+    0xC2: lambda data, pos: (False, pos),
+    0xC3: lambda data, pos: (True, pos),
+    0xC4: _sized(">B", _bin),
+    0xC5: _sized(">H", _bin),
+    0xC6: _sized(">I", _bin),
+    0xCC: _sized(">B", _value),
+    0xCD: _sized(">H", _value),
+    0xCE: _sized(">I", _value),
+    0xCF: _sized(">Q", _value),
+    0xD0: _sized(">b", _value),
+    0xD1: _sized(">h", _value),
+    0xD2: _sized(">i", _value),
+    0xD3: _sized(">q", _value),
+    0xD9: _sized(">B", _str),
+    0xDA: _sized(">H", _str),
+    0xDB: _sized(">I", _str),
+    0xDC: _sized(">H", _unpack_array),
+    0xDD: _sized(">I", _unpack_array),
+    0xDE: _sized(">H", _unpack_map),
+    0xDF: _sized(">I", _unpack_map),
+}
+
+
+def packb(obj: Any) -> bytes:
+    """
+    msgpack encoding of obj, tuples are packed as arrays
+    """
+    try:
+        import msgpack  # type: ignore
+    except ImportError:
+        out: List[bytes] = []
+        _pack(obj, out)
+        return b"".join(out)
+    return msgpack.packb(obj, use_bin_type=True, unicode_errors="surrogatepass")
+
+
+def unpackb(data: bytes) -> Any:
+    """
+    object encoded by packb, arrays are lists
+    raise ValueError if data is not a single msgpack object
+    """
+    try:
+        import msgpack  # type: ignore
+    except ImportError:
+        try:
+            obj, pos = _unpack(data, 0)
+        except (IndexError, struct.error) as e:
+            raise ValueError(f"truncated msgpack data ({e})")
+        if pos > len(data):
+            raise ValueError("truncated msgpack data")
+        if pos < len(data):
+            raise ValueError("extra data after msgpack object")
+        return obj
+    return msgpack.unpackb(
+        data, raw=False, strict_map_key=False, unicode_errors="surrogatepass"
+    )
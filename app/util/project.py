@@ -0,0 +1,330 @@
+import json
+import logging
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List
+
+from app import __version__
+from app.util.condition import OPERATIONS, UNARY, UNKNOWN, Expr
+from app.util.pack import packb, unpackb
+from app.util.tree import name_suffix
+from app.util.write import write_atomic
+
+if TYPE_CHECKING:
+    from app.util.scan import FileAnalysis, toscons
+
+logger = logging.getLogger(__name__)
+
+# bumped when the layout of the index changes, an index of another format is
+# refused by load_index
+INDEX_FORMAT = 1
+INDEX_MAGIC = "toscons-index"
+
+
+def _text(name: bytes) -> str:
+    # macro names are bytes, names which are not utf-8 survive the round trip
+    return name.decode("utf-8", "surrogateescape")
+
+
+def _bytes(name: str) -> bytes:
+    return name.encode("utf-8", "surrogateescape")
+
+
+def _dump_expr(e: Expr) -> Any:
+    if isinstance(e, int):
+        return e
+    if e[0] == "defined" or e[0] == "macro":
+        return [e[0], _text(e[1])]
+    return [e[0]] + [_dump_expr(i) for i in e[1:]]
+
+
+def _load_expr(e: Any) -> Expr:
+    if isinstance(e, int) and not isinstance(e, bool):
+        return e
+    if not isinstance(e, list) or not e:
+        raise ValueError(f"{e!r} is not a condition")
+    op = e[0]
+    if op in ("defined", "macro") and len(e) == 2:
+        return (op, _bytes(e[1]))
+    if not (
+        (len(e) == 1 and (op,) == UNKNOWN)
+        or (op == "?" and len(e) == 4)
+        or (op in UNARY and len(e) == 2)
+        or (op in OPERATIONS and len(e) == 3)
+    ):
+        raise ValueError(f"{e!r} is not a condition")
+    return (op,) + tuple(_load_expr(i) for i in e[1:])
+
+
+def _texts(names: Any) -> List[str]:
+    if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+        raise ValueError(f"{names!r} is not a list of names")
+    return names
+
+
+def dump_analysis(res: "FileAnalysis") -> Dict[str, Any]:
+    """
+    result of the analysis of a file as json compatible data, which
+    load_analysis reads back
+    """
+    return {
+        "defines": [_text(m) for m in res.defines],
+        "tested": [_text(m) for m in res.tested],
+        "mains": [[no, _text(line)] for no, line in res.mains],
+        "warnings": res.warnings,
+        "includes": [[_text(name), angle] for name, angle in res.includes],
+        "symbols": [_text(s) for s in res.symbols],
+        "guards": [_dump_expr(g) for g in res.guards],
+    }
+
+
+def load_analysis(data: Any) -> "FileAnalysis":
+    """
+    result of the analysis of a file from data given by dump_analysis, read
+    back as json or msgpack
+    raise ValueError if data does not have that layout, it may come from a
+    file anyone could write, nothing in it is run
+    """
+    from app.util.scan import FileAnalysis
+
+    try:
+        mains = [(no, _bytes(line)) for no, line in data["mains"]]
+        includes = [(_bytes(name), angle) for name, angle in data["includes"]]
+        if not all(isinstance(no, int) for no, _ in mains) or not all(
+            isinstance(angle, bool) for _, angle in includes
+        ):
+            raise ValueError("line numbers or include kinds of another type")
+        return FileAnalysis(
+            [_bytes(m) for m in _texts(data["defines"])],
+            [_bytes(m) for m in _texts(data["tested"])],
+            mains,
+            _texts(data["warnings"]),
+            includes,
+            [_bytes(s) for s in _texts(data["symbols"])],
+            [_load_expr(g) for g in data["guards"]],
+        )
+    except (TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f"not the result of a file analysis ({e!r})")
+
+
+def export_index(T: "toscons") -> Dict[str, Any]:
+    """
+    model of T, which must have been scanned, as json compatible data: the
+    directories and files listed, the classification of directories, the
+    results of each file analysed and the results derived from them
+    paths are relative to the source directory
+    """
+    rel = T.rel_name
+    files: Dict[str, Any] = {}
+    for fsource, res in T.file_analysis.items():
+        macros, main = T.file_flags[fsource]
+        files[rel(fsource)] = {"macros": macros, "main": main, **dump_analysis(res)}
+    return {
+        "magic": INDEX_MAGIC,
+        "format": INDEX_FORMAT,
+        "version": __version__,
+        "src_path": str(T.src_path),
+        # [k, n] for the results of shard k of n, see merge_indexes
+        "shard": list(T.shard) if T.shard is not None else None,
+        # directories in the order they were walked, with their files and
+        # the directories below them
+        "dirs": [
+            [
+                rel(rep),
+                T.file_table.names_of(rep),
+                [q.name for q in T.dir_dir.get(rep, [])],
+            ]
+            for rep in T.file_table.listed()
+        ],
+        "tops": [q.name for q in T.dir_dir.get(T.src_path, [])],
+        "suffixes": dict(T.file_table.suffix_counts()),
+        "cxx_dir": [rel(rep) for rep in T.cxx_dir],
+        "c_dir": [rel(rep) for rep in T.c_dir],
+        "hxx_only_dir": [rel(rep) for rep in T.hxx_only_dir],
+        "files": files,
+        "main_pathes": T.main_pathes,
+        "undefined_tested_kword": T.undefined_tested_kword,
+        "program_dirs": [rel(rep) for rep in T.program_dirs],
+        "library_dirs": [rel(rep) for rep in T.library_dirs],
+        "include_graph": {
+            rel(rep): sorted(rel(i) for i in inc_dirs)
+            for rep, inc_dirs in sorted(T.include_graph.items())
+        },
+        "include_dirs": {
+            rel(rep): [rel(i) for i in inc_dirs]
+            for rep, inc_dirs in sorted(T.include_dirs.items())
+        },
+    }
+
+
+def load_index(T: "toscons", data: Dict[str, Any]) -> None:
+    """
+    fill T, which must not have been scanned, from data given by
+    export_index, no file or directory is read
+    results derived from the files (main_pathes, lib_pathes, ...) are
+    computed again from the file results, except the include paths, whose
+    closure is the slowest part of a scan, they are only searched again if
+    data has none as a merge of shards
+    raise ValueError if data is not an index of this format
+    """
+    if data.get("magic") != INDEX_MAGIC or data.get("format") != INDEX_FORMAT:
+        raise ValueError("not a toscons index of format {}".format(INDEX_FORMAT))
+    src = T.src_path
+    # directories are named many times by the include paths, each Path is
+    # built once
+    paths: Dict[str, Path] = {".": src}
+
+    def path(rel: str) -> Path:
+        p = paths.get(rel)
+        if p is None:
+            p = paths[rel] = src / rel
+        return p
+
+    T._reset_results()
+    for name in data["tops"]:
+        T.dir_dir[src].append(src / name)
+    for rel, names, subdirs in data["dirs"]:
+        rep = path(rel)
+        T.file_table.add_dir(rep, names)
+        if subdirs:
+            T.dir_dir[rep] = [rep / name for name in subdirs]
+    T.cxx_dir = [path(rel) for rel in data["cxx_dir"]]
+    T.c_dir = [path(rel) for rel in data["c_dir"]]
+    T.hxx_only_dir = [path(rel) for rel in data["hxx_only_dir"]]
+    T.cxx_dir_name = sorted(data["cxx_dir"])
+    T.c_dir_name = sorted(data["c_dir"])
+    T.hxx_only_dir_name0 = sorted(data["hxx_only_dir"])
+    T.file_analysis = {}
+    T.file_flags = {}
+    old_src = data["src_path"]
+    for rel, res in data["files"].items():
+        fsource = path(rel)
+        T.file_flags[fsource] = (res["macros"], res["main"])
+        analysis = load_analysis(res)
+        # warnings name the files of the tree exported
+        T.file_analysis[fsource] = analysis._replace(
+            warnings=[w.replace(old_src, str(src)) for w in analysis.warnings]
+        )
+    T.analysed = True
+    T.scan_macros()
+    T.scan_and_search_main()
+    T.classify_dirs()
+    if "include_graph" not in data:
+        T.search_includes()
+        return
+    T.include_graph = {
+        path(rel): {path(i) for i in inc_dirs}
+        for rel, inc_dirs in data["include_graph"].items()
+    }
+    T.include_dirs = {
+        path(rel): [path(i) for i in inc_dirs]
+        for rel, inc_dirs in data["include_dirs"].items()
+    }
+
+
+def _dir_key(rel: str) -> List[str]:
+    # directories are ordered as sorted paths are
+    return rel.split("/")
+
+
+def merge_indexes(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    index of the whole tree from the indexes of its n shards, each written
+    by export_index for one k of 0 to n-1, in any order
+    a shard holds whole directories of the source directory, directories
+    and files are put in the order of a scan of the whole tree, the macros
+    tested and never defined, the mains and the classification are derived
+    from all the files, so loading the merge gives the SConscripts of a
+    single scan
+    include paths are left out, headers of a shard are included by others,
+    load_index searches them again
+    raise ValueError if parts are not all the shards of one split
+    """
+    for data in parts:
+        if data.get("magic") != INDEX_MAGIC or data.get("format") != INDEX_FORMAT:
+            raise ValueError("not a toscons index of format {}".format(INDEX_FORMAT))
+        if data.get("shard") is None:
+            raise ValueError(f"index of {data['src_path']} is not a shard")
+    count = parts[0]["shard"][1] if parts else 0
+    shards = sorted(data["shard"][0] for data in parts)
+    if any(data["shard"][1] != count for data in parts) or shards != list(
+        range(count)
+    ):
+        names = ", ".join("{}/{}".format(*data["shard"]) for data in parts)
+        raise ValueError(f"shards {names} are not all the shards of one split")
+    by_top: Dict[str, List[List[Any]]] = {}
+    for data in parts:
+        found: Dict[str, List[List[Any]]] = {}
+        for entry in data["dirs"]:
+            found.setdefault(entry[0].split("/", 1)[0], []).append(entry)
+        for top, entries in found.items():
+            if top in by_top:
+                raise ValueError(f"directory {top} found in two shards")
+            by_top[top] = entries
+    # shards hold whole top directories walked depth first, so the listing
+    # of the tree is the listing of each top directory in sorted order
+    dirs = [entry for top in sorted(by_top) for entry in by_top[top]]
+    suffixes: "Counter[str]" = Counter()
+    for _, names, _ in dirs:
+        suffixes.update(name_suffix(name) for name in names)
+
+    def listed(key: str) -> List[str]:
+        found = {rel for data in parts for rel in data[key]}
+        return [rel for rel, _, _ in dirs if rel in found]
+
+    files: Dict[str, Any] = {}
+    for data in parts:
+        files.update(data["files"])
+    files = {
+        rel: files[rel]
+        for rel in sorted(files, key=lambda rel: _dir_key(rel.rpartition("/")[0]))
+    }
+    tested = {m for res in files.values() for m in res["tested"]}
+    defined = {m for res in files.values() for m in res["defines"]}
+    return {
+        "magic": INDEX_MAGIC,
+        "format": INDEX_FORMAT,
+        "version": parts[0]["version"],
+        "src_path": parts[0]["src_path"],
+        "shard": None,
+        "dirs": dirs,
+        "tops": sorted({top for data in parts for top in data["tops"]}),
+        "suffixes": dict(suffixes),
+        "cxx_dir": listed("cxx_dir"),
+        "c_dir": listed("c_dir"),
+        "hxx_only_dir": listed("hxx_only_dir"),
+        "files": files,
+        "main_pathes": [rel for rel, res in files.items() if res["mains"]],
+        "undefined_tested_kword": sorted(tested - defined),
+        "program_dirs": sorted(
+            {rel for data in parts for rel in data["program_dirs"]}, key=_dir_key
+        ),
+        "library_dirs": sorted(
+            {rel for data in parts for rel in data["library_dirs"]}, key=_dir_key
+        ),
+    }
+
+
+def write_index(data: Dict[str, Any], path: Path) -> None:
+    """
+    write data atomically in path, as json if path ends with '.json', as
+    msgpack otherwise
+    """
+    if path.suffix == ".json":
+        raw = json.dumps(data, separators=(",", ":")).encode()
+    else:
+        raw = packb(data)
+    write_atomic(path, raw)
+    logger.info(f"index of {data['src_path']} written in {path}, {len(raw)} bytes")
+
+
+def read_index(path: Path) -> Dict[str, Any]:
+    """
+    data written by write_index in path, json or msgpack
+    raise ValueError if path holds neither
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw[:1] == b"{":
+        return json.loads(raw)
+    return unpackb(raw)
@@ -1,15 +1,63 @@
-import difflib
+import functools
+import itertools
 import logging
+import mmap
+import os
 import textwrap
-import typing
-from collections import Counter, defaultdict
+from bisect import bisect_left
+from collections import defaultdict
+from concurrent.futures import Executor, ThreadPoolExecutor
 from pathlib import Path
-from typing import DefaultDict, Dict, List, Set, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
-from jinja2 import Environment, PackageLoader, select_autoescape
+from app.util.cache import CACHE_NAME, LocalFS, ScanCache
+from app.util.condition import (
+    Expr,
+    GuardBuilder,
+    active_mask,
+    has_code,
+)
+from app.util.directive import Buffer, defined_in_expr, iter_directives
+from app.util.ignore import IGNORE_NAME, IgnoreRules, Rule, parse_rules
+from app.util.include import (
+    HeaderIndex,
+    Include,
+    include_graph,
+    include_name,
+    minimal_include_dirs,
+)
+from app.util.project import dump_analysis, load_analysis
+from app.util.stats import RunStats, timed
+from app.util.store import ResultStore
+from app.util.symbol import Definition, defined_functions
+from app.util.tree import DirContentView, DirSuffixesView, FileTable, shard_of
+from app.util.write import WriteResult, write_if_changed
+
+if TYPE_CHECKING:
+    # jinja2 is only imported when SConscripts are rendered, see template_env
+    from jinja2 import Environment, Template
+
+    from app.util.gitindex import GitTree
 
 logger = logging.getLogger(__name__)
 
+# files listed when warnings are aggregated, see toscons.__init__
+MAX_WARNED_FILES = 10
+
 
 def search_defined_in_if(line: bytes) -> List[bytes]:
     """
@@ -32,7 +80,9 @@ def search_defined_in_if(line: bytes) -> List[bytes]:
             return res
         kword = line[next_start + 8 : parent_end].strip()
         if len(kword.split()) != 1:
-            logger.warning("error '{}' is not a macro keyword".format(kword.decode()))
+            logger.warning(
+                "error '{}' is not a macro keyword".format(kword.decode())
+            )
             return res
         else:
             res.append(kword)
@@ -40,61 +90,641 @@ def search_defined_in_if(line: bytes) -> List[bytes]:
     return res
 
 
+MACRO_SUFFIXES = (".c", ".h", ".cpp", ".hpp", ".cxx", ".hxx", ".c++", ".C++", ".C")
+MAIN_SUFFIXES = (".c", ".cpp", ".cxx", ".c++", "C++", ".C")
+# sources compiled by the SConscript of their directory
+SOURCE_SUFFIXES = (".c", ".cpp", ".cxx", ".c++", ".C")
+# SConscripts are written by threads when there are more than this, they
+# are all rendered before in the calling thread
+PARALLEL_WRITE_MIN = 16
+# directives without effect on the macros, b"" is the null directive '#'
+IGNORED_DIRECTIVES = frozenset(
+    (
+        b"",
+        b"import",
+        b"endif",
+        b"else",
+        b"undef",
+        b"pragma",
+        b"error",
+        b"warning",
+        b"line",
+        b"ident",
+    )
+)
+# below this size a plain read is cheaper than setting up a mapping
+MMAP_THRESHOLD = 1 << 16
+COUNT_CHUNK = 1 << 20
+
+
+class FileAnalysis(NamedTuple):
+    """
+    result of the single pass over a source file
+    defines: macro names found in '#define' lines
+    tested: macro names tested in '#if', '#elif', '#ifdef', '#ifndef' lines
+    mains: (line number, line) of each main definition
+    warnings: messages to be logged when the result is merged, so that
+    results computed in a worker are reported in the same order as serially
+    includes: (header name, angle brackets) of each '#include'
+    symbols: names of the functions defined and visible to other files
+    guards: conditions under which some code of a source is compiled, see
+    GuardBuilder, empty when none is
+    """
+
+    defines: List[bytes]
+    tested: List[bytes]
+    mains: List[Tuple[int, bytes]]
+    warnings: List[str]
+    includes: List[Include]
+    symbols: List[bytes]
+    guards: List[Expr]
+
+
+class DirectoryRecord(NamedTuple):
+    """
+    a directory yielded by toscons.iter_directories once its files are analysed
+    kind: 'c++' or 'c' for a directory holding sources, 'header' for one
+    holding headers only
+    role: 'program' or 'library' for a c/c++ directory classified as one,
+    see toscons.classify_dirs, '' otherwise
+    analysis: result of each file of the directory read
+    include_dirs: directories holding the headers its files include directly
+    """
+
+    path: Path
+    kind: str
+    role: str
+    analysis: Dict[Path, FileAnalysis]
+    include_dirs: List[Path]
+
+
+class SConsSettings(NamedTuple):
+    """
+    how the SConscript of src_path is generated, for large trees where the
+    startup and up to date checks of scons dominate a build
+    precomputed: include paths are resolved when generating instead of at
+    each scons run, added with one AppendUnique, directories including
+    nothing share env instead of a clone of it, programs are linked with
+    the objects they depend on only, see main_objects, and the targets are
+    returned as one list
+    decider: given to env.Decider, 'MD5-timestamp' only hashes files whose
+    timestamp changed
+    cache_dir: given to CacheDir, derived files are shared by builds
+    implicit_cache: scons keeps the dependencies found by its scanners
+    max_drift: seconds after which the content signature of a file is trusted
+    """
+
+    precomputed: bool = False
+    decider: Optional[str] = None
+    cache_dir: Optional[str] = None
+    implicit_cache: bool = False
+    max_drift: Optional[int] = None
+
+
+def count_newlines(buf: Buffer, start: int, end: int) -> int:
+    """
+    count b"\\n" in buf[start:end], mmap buffers are counted by chunks so
+    that the region is never copied at once
+    """
+    if isinstance(buf, bytes):
+        return buf.count(b"\n", start, end)
+    count = 0
+    for chunk_start in range(start, end, COUNT_CHUNK):
+        count += buf[chunk_start : min(chunk_start + COUNT_CHUNK, end)].count(b"\n")
+    return count
+
+
+def main_lines(
+    buf: Buffer, definitions: List[Definition]
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    yield (line number, line) of the definitions of main among definitions,
+    found in buf
+    only lines defining main are copied
+
+    >>> buf = b"// int main() {}\\n\\nint main() {\\n}\\n"
+    >>> list(main_lines(buf, defined_functions(buf)))
+    [(3, b'int main() {')]
+    """
+    no = 1
+    counted = 0
+    for d in definitions:
+        if d.name != b"main" or d.static or buf[d.pos - 2 : d.pos] == b"::":
+            continue
+        start = buf.rfind(b"\n", 0, d.pos) + 1
+        end = buf.find(b"\n", d.pos)
+        if end == -1:
+            end = len(buf)
+        no += count_newlines(buf, counted, start)
+        counted = start
+        yield no, buf[start:end].rstrip(b"\r")
+
+
+def _analyse_buffer(
+    fsource: Path, buf: Buffer, macros: bool, main: bool
+) -> Tuple[FileAnalysis, int]:
+    """
+    analyse_buffer also returning the number of directives parsed
+    """
+    res = FileAnalysis([], [], [], [], [], [], [])
+    count = 0
+    # conditions of the code of sources, code is looked for between
+    # directives
+    guards = GuardBuilder() if macros and main else None
+    pos = 0
+    if macros:
+        # most frequent directives are tested first
+        for count, (text, name, args, macro, start) in enumerate(
+            iter_directives(buf), 1
+        ):
+            if guards is not None:
+                if has_code(buf, pos, start):
+                    guards.code()
+                pos = start + len(text)
+                guards.directive(name, args, macro)
+            if name == b"define":
+                if macro:
+                    res.defines.append(macro)
+            elif name == b"include" or name == b"include_next":
+                inc = include_name(args)
+                if inc is not None:
+                    res.includes.append(inc)
+            elif name in IGNORED_DIRECTIVES:
+                pass
+            elif name == b"ifdef" or name == b"ifndef":
+                if macro:
+                    res.tested.append(macro)
+            elif name == b"if" or name == b"elif":
+                res.tested.extend(defined_in_expr(args, res.warnings.append))
+            else:
+                res.warnings.append("macro unrecognized in file :'{}'".format(fsource))
+                res.warnings.append("'{}'".format(text.decode(errors="replace")))
+    if guards is not None:
+        if has_code(buf, pos, len(buf)):
+            guards.code()
+        res.guards.extend(guards.result())
+    if main:
+        definitions = defined_functions(buf)
+        res.mains.extend(main_lines(buf, definitions))
+        res.symbols.extend(d.name for d in definitions if not d.static)
+    return res, count
+
+
+def analyse_buffer(
+    fsource: Path, buf: Buffer, macros: bool = True, main: bool = True
+) -> FileAnalysis:
+    """
+    collect directives (if macros) and main definitions (if main) of buf
+    which is the content of fsource
+    """
+    return _analyse_buffer(fsource, buf, macros, main)[0]
+
+
+def _analyse_stored(
+    fsource: Path, buf: Buffer, macros: bool, main: bool, store: ResultStore
+) -> Tuple[FileAnalysis, int, bool]:
+    """
+    _analyse_buffer through store, also telling if the result was stored
+    a stored result may come from a file with the same content at another
+    path, its warnings are given the path of fsource
+    """
+    key = store.key(buf, (macros, main))
+    hit = store.get(key)
+    if hit is not None:
+        try:
+            name, stored = hit
+            if not isinstance(name, str):
+                raise ValueError(f"{name!r} is not a path")
+            res = load_analysis(stored)
+        except (TypeError, ValueError) as e:
+            # analysed again and replaced below
+            logger.info(f"stored result of {fsource} unreadable ({e})")
+        else:
+            if name != str(fsource):
+                res = res._replace(
+                    warnings=[w.replace(name, str(fsource)) for w in res.warnings]
+                )
+            return res, 0, True
+    res, count = _analyse_buffer(fsource, buf, macros, main)
+    store.put(key, (str(fsource), dump_analysis(res)))
+    return res, count, False
+
+
+def _analyse_source(
+    fsource: Path,
+    macros: bool,
+    main: bool,
+    fs: Optional[LocalFS] = None,
+    store: Optional[ResultStore] = None,
+) -> Tuple[FileAnalysis, int, int, bool]:
+    """
+    analyse_source also returning the size of fsource, the number of
+    directives parsed and if the result was taken from store
+    fsource is opened through fs if given
+    """
+    stored = False
+    with open(fsource, "rb") if fs is None else fs.open(fsource) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_THRESHOLD:
+            buf: Buffer = f.read()
+            if store is None:
+                res, count = _analyse_buffer(fsource, buf, macros, main)
+            else:
+                res, count, stored = _analyse_stored(fsource, buf, macros, main, store)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                if store is None:
+                    res, count = _analyse_buffer(fsource, buf, macros, main)
+                else:
+                    res, count, stored = _analyse_stored(
+                        fsource, buf, macros, main, store
+                    )
+    return res, size, count, stored
+
+
+def analyse_source(
+    fsource: Path, macros: bool = True, main: bool = True
+) -> FileAnalysis:
+    """
+    read fsource once to collect directives (if macros) and main definitions
+    (if main)
+    files of at least MMAP_THRESHOLD bytes are memory mapped, so peak memory
+    depends on the number of directive lines and not on the file size
+    """
+    return _analyse_source(fsource, macros, main)[0]
+
+
+def _analyse_task(
+    task: Tuple[Path, bool, bool],
+    fs: Optional[LocalFS] = None,
+    store: Optional[ResultStore] = None,
+) -> Tuple[FileAnalysis, int, int, bool]:
+    """
+    pool entry point for analyse_source, sizes, directive counts and store
+    hits are returned for stats
+    """
+    return _analyse_source(*task, fs=fs, store=store)
+
+
+def template_cache_dir() -> Optional[Path]:
+    """
+    directory of compiled templates, TOSCONS_TEMPLATE_CACHE or toscons in the
+    user cache directory, $XDG_CACHE_HOME or ~/.cache, None if it can not be
+    created or if TOSCONS_TEMPLATE_CACHE is set but empty
+    """
+    path = os.environ.get("TOSCONS_TEMPLATE_CACHE")
+    if path == "":
+        return None
+    if path is None:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        path = os.path.join(base, "toscons")
+    try:
+        os.makedirs(path, exist_ok=True)
+    except OSError:
+        return None
+    return Path(path)
+
+
+def template_env() -> "Environment":
+    """
+    jinja environment loading the templates of the package, it can be
+    shared by all toscons objects of a process
+    templates compiled by a previous run are loaded from template_cache_dir
+    instead of being parsed again
+    the repr filter writes a value as a python literal in a SConscript
+    """
+    from jinja2 import (
+        Environment,
+        FileSystemBytecodeCache,
+        PackageLoader,
+        select_autoescape,
+    )
+
+    cache_dir = template_cache_dir()
+    env = Environment(
+        loader=PackageLoader("app"),
+        autoescape=select_autoescape(),
+        bytecode_cache=(
+            FileSystemBytecodeCache(str(cache_dir)) if cache_dir is not None else None
+        ),
+    )
+    env.filters["repr"] = repr
+    return env
+
+
 class toscons:
     """
     main class for dealing with conversion to scons
     """
 
-    def __init__(self, src_path: Path) -> None:
+    def __init__(
+        self,
+        src_path: Path,
+        jobs: int = 1,
+        threads: bool = False,
+        use_cache: bool = True,
+        minimal_cpppath: bool = True,
+        env: Optional["Environment"] = None,
+        pool: Optional[Executor] = None,
+        cache: Optional[ScanCache] = None,
+        aggregate_warnings: bool = False,
+        fs: Optional[LocalFS] = None,
+        concurrent_io: int = 0,
+        git_index: bool = False,
+        store: Optional[ResultStore] = None,
+        shard: Optional[Tuple[int, int]] = None,
+        scons: SConsSettings = SConsSettings(),
+        ignore_files: Sequence[str] = (IGNORE_NAME,),
+    ) -> None:
         """
         src_path must be the directory where sources are stored
+        jobs is the number of workers used to analyse files, 1 means serial
+        and 0 or less means one per cpu
+        threads selects a thread pool instead of a process pool, which is
+        better suited to sources on slow network mounts
+        use_cache keeps directory listings and file results in
+        src_path / CACHE_NAME so that unchanged files are not read again
+        minimal_cpppath gives each directory only the include paths its files
+        need, instead of every directory for the whole build
+        env, pool and cache let several toscons objects share a jinja
+        environment, a worker pool used when jobs > 1 and a scan cache, a
+        cache given here is not saved by scan, its owner saves it
+        aggregate_warnings logs a count of warnings per file instead of each
+        warning, for large trees with many unrecognized directives
+        fs makes the file system calls, the one of cache when cache is given
+        concurrent_io above 0 scans with asyncio, keeping up to that many
+        directory listings, stats and reads in flight, which hides the
+        latency of network file systems, see app.util.aio
+        git_index takes the files from the index of the git work tree holding
+        src_path instead of walking its directories, untracked files are not
+        seen, see app.util.gitindex, the directories are walked when src_path
+        is not in a work tree
+        store shares the results of files with other trees and processes,
+        keyed on the content of files, files missing from the cache are
+        read but only analysed if their content is not in store, see
+        app.util.store, its owner trims it
+        shard (k, n) scans only the directories of src_path given to shard k
+        of n by shard_of, the results of the n shards are put together by
+        app.util.project.merge_indexes
+        scons tunes the SConscript of src_path, see SConsSettings
+        ignore_files are the names of the files holding .gitignore rules in
+        the directories of the tree, ignored directories are not listed and
+        ignored files neither classified nor read, see app.util.ignore
         """
         self.src_path = src_path
-        self.dir_content: DefaultDict[Path, List[Path]] = defaultdict(list)
+        self.jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
+        self.threads = threads
+        # files are kept in a compact table, dir_content and dir_suffixes
+        # are views of it
+        self.file_table = FileTable()
         self.dir_dir: DefaultDict[Path, List[Path]] = defaultdict(list)
-        self.dir_suffixes: Dict[Path, DefaultDict[str, List[Path]]] = defaultdict(
-            lambda: defaultdict(list)
-        )
         self.cxx_dir: List[Path] = []
         self.cxx_dir_name: List[str] = []
         self.c_dir: List[Path] = []
         self.c_dir_name: List[str] = []
         self.hxx_only_dir: List[Path] = []
         self.hxx_only_dir_name0: List[str] = []
-        self.env = Environment(
-            loader=PackageLoader("app"), autoescape=select_autoescape()
-        )
+        self._env = env
+        self.pool = pool
         self.all_define: Set[bytes] = set()
         self.tested_define: Set[bytes] = set()
         self.main_pathes: List[str] = []
         self.lib_pathes: List[Tuple[str, str]] = []
+        self.program_dirs: List[Path] = []
+        self.library_dirs: List[Path] = []
+        self.file_analysis: Dict[Path, FileAnalysis] = {}
+        self.file_flags: Dict[Path, Tuple[bool, bool]] = {}
+        self.analysed = False
+        self.shard = shard
+        self.own_cache = cache is None
+        if cache is None:
+            # shards scanning the same tree at once each keep their cache
+            name = CACHE_NAME
+            if shard is not None:
+                name = "{}.{}-{}".format(CACHE_NAME, *shard)
+            cache = ScanCache(src_path / name, use_cache, fs)
+        self.cache = cache
+        self.fs = cache.fs
+        self.concurrent_io = concurrent_io
+        self.git_index = git_index
+        self.store = store
+        self.git: Optional["GitTree"] = None
+        # listings taken from the git index, None when directories are walked
+        self.listings: Optional[Dict[Path, List[Tuple[str, bool]]]] = None
+        self.ignore_files = ignore_files
+        # rules applying to the entries of each directory, directories
+        # without rules are left out
+        self.ignore_rules: Dict[Path, IgnoreRules] = {}
+        self.minimal_cpppath = minimal_cpppath
+        self.scons = scons
+        self.include_graph: Dict[Path, Set[Path]] = {}
+        self.include_dirs: Dict[Path, List[Path]] = {}
+        self.stats = RunStats()
+        self.aggregate_warnings = aggregate_warnings
+
+    @property
+    def env(self) -> "Environment":
+        """
+        jinja environment, created when SConscripts are first rendered
+        """
+        if self._env is None:
+            self._env = template_env()
+        return self._env
+
+    @property
+    def dir_content(self) -> Mapping[Path, List[Path]]:
+        """
+        files of each directory below src_path, as paths built on access
+        """
+        return DirContentView(self.file_table)
+
+    @property
+    def dir_suffixes(self) -> Mapping[Path, Dict[str, List[Path]]]:
+        """
+        files of each directory holding files, grouped by suffix
+        """
+        return DirSuffixesView(self.file_table)
+
+    def rel_name(self, p: Path) -> str:
+        """
+        name of p relative to src_path as used in SConscripts, e.g. 'rep2/a.c'
+        """
+        return p.relative_to(self.src_path).as_posix()
+
+    def _list_dir(self, p: Path) -> List[Tuple[str, bool]]:
+        """
+        entries of directory p, from the git index when it is used, from
+        the cache otherwise
+        """
+        if self.listings is not None:
+            return self.listings.get(p, [])
+        return self.cache.list_dir(p)
+
+    def _read_rules(
+        self, p: Path, rel: str, entries: List[Tuple[str, bool]]
+    ) -> List[Rule]:
+        """
+        rules of the ignore files among the sorted entries of directory p,
+        whose relative name is rel
+        """
+        rules: List[Rule] = []
+        for name in self.ignore_files:
+            i = bisect_left(entries, (name, False))
+            if i == len(entries) or entries[i] != (name, False):
+                continue
+            try:
+                with self.fs.open(p / name) as f:
+                    text = f.read().decode("utf-8", "surrogateescape")
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.warning(f"{p / name} not read, its rules are ignored ({e})")
+                continue
+            rules.extend(parse_rules(text, rel))
+        return rules
+
+    def _prune(
+        self, p: Path, entries: List[Tuple[str, bool]]
+    ) -> List[Tuple[str, bool]]:
+        """
+        entries of directory p not ignored by the rules of its ignore files
+        and of the ones of the directories above it
+        """
+        rules = self.ignore_rules.get(p.parent) if p != self.src_path else None
+        rel = "" if p == self.src_path else self.rel_name(p)
+        found = self._read_rules(p, rel, entries)
+        if found:
+            rules = rules.extend(found) if rules else IgnoreRules(found)
+        if not rules:
+            self.ignore_rules.pop(p, None)
+            return entries
+        self.ignore_rules[p] = rules
+        kept, dirs, files = rules.filter(rel, entries)
+        if dirs or files:
+            self.stats.dirs_pruned += dirs
+            self.stats.files_pruned += files
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"{dirs} directories and {files} files ignored in {p}")
+        return kept
+
+    def _list_kept(self, p: Path) -> List[Tuple[str, bool]]:
+        return self._prune(p, self._list_dir(p))
+
+    def _is_file(self, p: Path) -> bool:
+        if self.listings is None:
+            return p.is_file()
+        return (p.name, False) in self.listings.get(p.parent, ())
 
+    def _open_git(self) -> None:
+        """
+        read the git index of src_path if git_index is set, self.listings
+        stays None when the directories must be walked
+        """
+        self.listings = None
+        if not self.git_index:
+            return
+        from app.util.gitindex import GitTree
+
+        try:
+            if self.git is None:
+                self.git = GitTree.open(self.src_path)
+            else:
+                self.git.load()
+        except (OSError, ValueError) as e:
+            logger.warning(f"git index of {self.src_path} not read ({e}), walking")
+            self.git = None
+            return
+        if self.git is None:
+            logger.info(f"{self.src_path} not in a git work tree, walking")
+            return
+        self.listings = self.git.listings()
+        logger.info(
+            "{} files of {} taken from {}".format(
+                len(self.git.entries), self.src_path, self.git.index_path
+            )
+        )
+
+    def _walk(
+        self,
+        tops: List[Path],
+        list_dir: Optional[Callable[[Path], List[Tuple[str, bool]]]] = None,
+    ) -> int:
+        """
+        fill file_table and dir_dir for tops and every directory below them
+        and return the number of directories walked
+        list_dir gives the entries of a directory, the ones of _list_dir
+        which are not ignored by default
+        """
+        if list_dir is None:
+            list_dir = self._list_kept
+        dir_count = 0
+        # depth first, directories are visited in sorted order
+        stack = list(reversed(tops))
+        info = logger.isEnabledFor(logging.INFO)
+        while stack:
+            p = stack.pop()
+            dir_count += 1
+            self.stats.dirs_listed += 1
+            names: List[str] = []
+            for q_name, q_is_dir in list_dir(p):
+                if q_name.startswith("."):
+                    if info:
+                        logger.info("{} ignored".format(q_name))
+                    continue
+                if q_is_dir:
+                    self.dir_dir[p].append(p / q_name)
+                else:
+                    names.append(q_name)
+            self.file_table.add_dir(p, names)
+            stack.extend(reversed(self.dir_dir.get(p, [])))
+        return dir_count
+
+    @timed
     def scan_dir_and_file(self) -> None:
         """
-        scan src directory and fill:
-        dir_dir which is directory path at second level
-        dir_content which is path at first level
-        dir_suffixes which is a dict of dict of path, first key is directory
-        secong key is suffixe.
+        scan src directory recursively and fill:
+        dir_dir which gives the directories nested in each directory
+        file_table which holds the files of each directory below src_path,
+        seen as paths through dir_content and grouped by suffixe through
+        dir_suffixes
+        files directly in src_path, entries starting with '.' and entries
+        matching the rules of ignore_files are ignored
         """
         count = 0
         dir_count = 0
-        suffixes: typing.Counter[str] = Counter()
-        for p in self.src_path.iterdir():
+        stack: List[Path] = []
+        self._open_git()
+        self.stats.dirs_listed += 1
+        for name, is_dir in self._list_kept(self.src_path):
             count += 1
-            if p.is_dir():
-                dir_count += 1
-                self.dir_content[p] = []
-                for q in p.iterdir():
-                    if q.is_dir():
-                        self.dir_dir[p].append(q)
-                    elif not q.name.startswith("."):
-                        self.dir_content[p].append(q)
-                        suf = "".join(q.suffixes)
-                        self.dir_suffixes[p][suf].append(q)
-                        suffixes[suf] += 1
-                    else:
-                        logger.info("{} ignored".format(q.name))
+            if is_dir and not name.startswith("."):
+                stack.append(self.src_path / name)
+            elif is_dir:
+                logger.info("{} ignored".format(name))
+        if self.shard is not None:
+            k, n = self.shard
+            stack = [p for p in stack if shard_of(p.name, n) == k]
+            logger.info(f"{len(stack)} directories of {self.src_path} in shard {k}/{n}")
+        if self.concurrent_io and self.listings is None:
+            from app.util import aio
+
+            # directories are listed concurrently, then walked in the same
+            # order as a serial scan
+            listings = aio.list_tree(
+                self.cache, stack, self.concurrent_io, self._prune
+            )
+            dir_count = self._walk(stack, listings.__getitem__)
+        else:
+            dir_count = self._walk(stack)
+        # summaries are only built if they are logged
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        if self.stats.dirs_pruned or self.stats.files_pruned:
+            logger.info(
+                "{} directories and {} files ignored in {}".format(
+                    self.stats.dirs_pruned, self.stats.files_pruned, self.src_path.name
+                )
+            )
         logger.info("python program directory is {}".format(Path.cwd()))
         logger.info(f"{count} entries found in {self.src_path.name}")
         logger.info(f"{dir_count} directories found in {self.src_path.name}")
@@ -102,17 +732,17 @@ class toscons:
             ", ".join(
                 (
                     "'{}' appears {} times".format(su, cnt)
-                    for su, cnt in suffixes.most_common()
+                    for su, cnt in self.file_table.suffix_counts().most_common()
                 )
             )
         )
         logger.info(f"{suf_str} in {self.src_path.name}")
         for rep1, rep2 in self.dir_dir.items():
-            if len(rep2) != 0:
-                logger.warning(
-                    "directory {} contains {} nested directory".format(rep1, len(rep2))
-                )
+            logger.info(
+                "directory {} contains {} nested directory".format(rep1, len(rep2))
+            )
 
+    @timed
     def search_c_cxx_file(self) -> None:
         """
         this fonction should be run after scan_dir_and_file was run
@@ -123,8 +753,8 @@ class toscons:
                  self.cxx_dir_name,
                  self.hxx_only_dir_name0,
         """
-        for rep1, suf_dct in self.dir_suffixes.items():
-            suf1 = set(suf_dct.keys())
+        for rep1 in self.file_table.with_files():
+            suf1 = self.file_table.suffix_set(rep1)
             is_c = len(suf1 & set((".c",))) != 0
             is_cxx = len(suf1 & set((".cpp", ".cxx", ".c++", "C++", ".C"))) != 0
             is_hxx_only = (
@@ -138,9 +768,13 @@ class toscons:
                 self.hxx_only_dir.append(rep1)
             if is_c:
                 self.c_dir.append(rep1)
-        self.cxx_dir_name = sorted([rep1.parts[-1] for rep1 in self.cxx_dir])
-        self.hxx_only_dir_name0 = sorted([rep1.parts[-1] for rep1 in self.hxx_only_dir])
-        self.c_dir_name = sorted([rep1.parts[-1] for rep1 in self.c_dir])
+        self.cxx_dir_name = sorted([self.rel_name(rep1) for rep1 in self.cxx_dir])
+        self.hxx_only_dir_name0 = sorted(
+            [self.rel_name(rep1) for rep1 in self.hxx_only_dir]
+        )
+        self.c_dir_name = sorted([self.rel_name(rep1) for rep1 in self.c_dir])
+        if not logger.isEnabledFor(logging.INFO):
+            return
         cxx_dir_msg = textwrap.fill(", ".join(self.cxx_dir_name))
         hxx_only_dir_msg = textwrap.fill(", ".join(self.hxx_only_dir_name0))
         c_dir_msg = textwrap.fill(", ".join(self.c_dir_name))
@@ -176,61 +810,166 @@ class toscons:
             ", ".join(map(lambda i: "'{}'".format(i), sorted(self.hxx_only_dir_name0),))
         )
 
+    def _file_tasks(self, rep: Path) -> List[Tuple[Path, bool, bool]]:
+        """
+        (file, macros, main) of the files of rep to analyse, macros tells if
+        its directives are collected and main if its definitions are
+        """
+        main_dir = rep in self.cxx_dir or rep in self.c_dir
+        tasks: List[Tuple[Path, bool, bool]] = []
+        for name, suf in self.file_table.entries(rep):
+            macros = suf in MACRO_SUFFIXES
+            main = main_dir and suf in MAIN_SUFFIXES
+            if macros or main:
+                tasks.append((rep / name, macros, main))
+        return tasks
+
+    def _analysed_dirs(self) -> List[Path]:
+        """
+        directories whose files are analysed, in the order they are read
+        """
+        return sorted(set(self.cxx_dir) | set(self.c_dir) | set(self.hxx_only_dir))
+
+    @timed
+    def analyse_files(self) -> None:
+        """
+        this fonction should be called after search_c_cxx_file was run
+        it reads every c/c++ source or header once and fills self.file_analysis
+        with the directives and main results used by scan_macros and
+        scan_and_search_main
+        files already in self.file_analysis are not read again, see update
+        """
+        if self.analysed:
+            return
+        tasks = [t for rep in self._analysed_dirs() for t in self._file_tasks(rep)]
+        hits, misses = self.stats.cache_hits, self.stats.cache_misses
+        warned: List[Tuple[Path, int]] = []
+        self.file_analysis = self._read_files(tasks, warned)
+        self.file_flags = {task[0]: (task[1], task[2]) for task in tasks}
+        self.analysed = True
+        self._log_read(len(tasks), hits, misses, warned)
+
+    def _read_files(
+        self, tasks: List[Tuple[Path, bool, bool]], warned: List[Tuple[Path, int]]
+    ) -> Dict[Path, FileAnalysis]:
+        """
+        return the analysis of the files of tasks, in task order, taken from
+        self.file_analysis, from the cache or read with the pool, asyncio or
+        serially
+        the warnings of the files are logged, or appended to warned with their
+        count when they are aggregated
+        """
+        to_check = [task for task in tasks if self.file_flags.get(task[0]) != task[1:]]
+        stats: Iterable[Optional[os.stat_result]] = itertools.repeat(None)
+        if self.concurrent_io:
+            from app.util import aio
+        if self.concurrent_io and self.cache.enabled:
+            stats = aio.map_concurrent(
+                self.fs.stat, [task[0] for task in to_check], self.concurrent_io
+            )
+        cached: Dict[Path, FileAnalysis] = {}
+        for (fsource, macros, main), st in zip(to_check, stats):
+            hit = self.cache.get_file(fsource, (macros, main), st)
+            if hit is not None:
+                try:
+                    cached[fsource] = load_analysis(hit)
+                except ValueError as e:
+                    logger.info(f"cached result of {fsource} unreadable ({e})")
+        to_read = [task for task in to_check if task[0] not in cached]
+        analyse = functools.partial(_analyse_task, fs=self.fs, store=self.store)
+        results: Iterable[Tuple[FileAnalysis, int, int, bool]]
+        if self.concurrent_io and len(to_read) > 1:
+            results = aio.map_concurrent(analyse, to_read, self.concurrent_io)
+        elif self.jobs > 1 and len(to_read) > 1:
+            chunksize = max(1, len(to_read) // (self.jobs * 4))
+            if self.pool is not None:
+                results = self.pool.map(analyse, to_read, chunksize=chunksize)
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+
+                pool_class = ThreadPoolExecutor if self.threads else ProcessPoolExecutor
+                with pool_class(max_workers=self.jobs) as pool:
+                    results = list(pool.map(analyse, to_read, chunksize=chunksize))
+        else:
+            results = map(analyse, to_read)
+        self.stats.cache_hits += len(cached)
+        self.stats.cache_misses += len(to_read)
+        for task, (res, size, count, stored) in zip(to_read, results):
+            cached[task[0]] = res
+            self.cache.put_file(task[0], dump_analysis(res))
+            self.stats.files_opened += 1
+            self.stats.bytes_read += size
+            self.stats.directives_parsed += count
+            self.stats.store_hits += stored
+        # results are merged in task order whatever the pool or the cache,
+        # which keeps logs and main_pathes identical to the serial run
+        file_analysis: Dict[Path, FileAnalysis] = {}
+        for task in tasks:
+            res = cached.get(task[0])
+            if res is None:
+                res = self.file_analysis[task[0]]
+            elif self.aggregate_warnings:
+                if res.warnings:
+                    warned.append((task[0], len(res.warnings)))
+            else:
+                for msg in res.warnings:
+                    logger.warning(msg)
+            file_analysis[task[0]] = res
+        return file_analysis
+
+    def _log_read(
+        self, total: int, hits: int, misses: int, warned: List[Tuple[Path, int]]
+    ) -> None:
+        """
+        log the number of files analysed, the cache counters being hits and
+        misses before they were read, and the warnings aggregated
+        """
+        logger.info(
+            "{} files analysed, {} read and {} from cache".format(
+                total, self.stats.cache_misses - misses, self.stats.cache_hits - hits
+            )
+        )
+        if warned:
+            self._log_warning_counts(warned)
+
+    def _log_warning_counts(self, warned: List[Tuple[Path, int]]) -> None:
+        """
+        log the number of warnings of each file, files with most warnings
+        first and at most MAX_WARNED_FILES of them
+        """
+        logger.warning(
+            "{} warnings in {} files".format(sum(n for _, n in warned), len(warned))
+        )
+        warned = sorted(warned, key=lambda i: -i[1])
+        for fsource, n in warned[:MAX_WARNED_FILES]:
+            logger.warning(f"{n} warnings in '{self.rel_name(fsource)}'")
+        if len(warned) > MAX_WARNED_FILES:
+            logger.warning(f"and {len(warned) - MAX_WARNED_FILES} more files")
+
+    @timed
     def scan_macros(self) -> None:
         """
         this fonction should be called after search_c_cxx_file was run
         it fills self.undefined_tested_kword, self.tested_define, self.all_define
         """
-        for rep3 in set(self.cxx_dir) | set(self.c_dir) | set(self.hxx_only_dir):
-            for fsource in self.dir_content[rep3]:
-                suf = "".join(fsource.suffixes)
-                if suf in (
-                    ".c",
-                    ".h",
-                    ".cpp",
-                    ".hpp",
-                    ".cxx",
-                    ".hxx",
-                    ".c++",
-                    ".C++",
-                    ".C",
-                ):
-                    with open(fsource, "rb") as f:
-                        for l in filter(
-                            lambda i: i.startswith(b"#"), f.read().splitlines()
-                        ):
-                            l1: bytes = l[1:].strip()
-                            if l1.startswith(b"define"):
-                                self.all_define.add(l.split()[1])
-                            elif (
-                                l1.startswith(b"if ")
-                                or l1.startswith(b"elif ")
-                                or l1.startswith(b"elif(")
-                                or l1.startswith(b"if(")
-                            ):
-                                self.tested_define |= set(search_defined_in_if(l))
-                            elif l1.startswith(b"ifdef "):
-                                self.tested_define.add(l1.split()[1])
-                            elif l1.startswith(b"ifndef "):
-                                self.tested_define.add(l1.split()[1])
-                            elif (
-                                l1.startswith(b"include")
-                                or l1.startswith(b"endif")
-                                or l1.startswith(b"else")
-                                or l1.startswith(b"undef")
-                                or l1.startswith(b"pragma")
-                                or l1.startswith(b"error")
-                                or l1.startswith(b"//")
-                            ):
-                                pass
-                            else:
-                                logger.warning(
-                                    "macro unrecognized in file :'{}'".format(fsource)
-                                )
-                                logger.warning("'{}'".format(l.decode()))
+        self.analyse_files()
+        for res in self.file_analysis.values():
+            self._merge_macros(res)
+        self._finish_macros()
+
+    def _merge_macros(self, res: FileAnalysis) -> None:
+        self.all_define.update(res.defines)
+        self.tested_define.update(res.tested)
+
+    def _finish_macros(self) -> None:
+        """
+        fill self.undefined_tested_kword once every file is merged
+        """
         self.undefined_tested_kword = sorted(
             map(lambda i: i.decode(), self.tested_define - self.all_define)
         )
+        if not logger.isEnabledFor(logging.INFO):
+            return
         und_test_kword_msg = textwrap.fill(
             ", ".join(map(lambda i: "'{}'".format(i), self.undefined_tested_kword))
         )
@@ -239,46 +978,221 @@ class toscons:
         logger.info("predefined kwords can be found with command")
         logger.info("touch foo.h; cpp -dM foo.h")
 
+    @timed
     def scan_and_search_main(self) -> None:
         """
         search for main in sources
         """
-        for rep3 in set(self.cxx_dir) | set(self.c_dir):
-            for fsource in self.dir_content[rep3]:
-                suf = "".join(fsource.suffixes)
-                if suf in (".c", ".cpp", ".cxx", ".c++", "C++", ".C"):
-                    with open(fsource, "rb") as f:
-                        for l2, l, no in list(
-                            filter(
-                                lambda k: len(k[0]) >= 2,
-                                map(
-                                    lambda j: (j[1].split(), j[1], j[0]),
-                                    filter(
-                                        lambda i: (b"main" in i[1]),
-                                        enumerate(f.read().splitlines(), start=1),
-                                    ),
-                                ),
-                            )
-                        ):
-                            if l2[1].startswith(b"main(") and (
-                                l2[0].startswith(b"int")
-                                or l2[0].startswith(b"*int")
-                                or l2[0].startswith(b"void")
-                                or l2[0].startswith(b"*void")
-                            ):
-                                res = "{}/{}".format(*fsource.parts[-2:])
-                                if res in self.main_pathes[-1:]:
-                                    logger.warning(
-                                        f"main found at least 2 times in '{res}'"
-                                    )
-                                    logger.warning(f"surnumerous main found in '{res}'")
-                                    logger.warning(
-                                        f"at line {no} which is '{l.decode()}'"
-                                    )
-                                else:
-                                    self.main_pathes.append(res)
-                                    logger.info(f"main found in '{res}'")
-                                    logger.info(f"at line {no} which is '{l.decode()}'")
+        self.analyse_files()
+        for fsource, analysis in self.file_analysis.items():
+            self._merge_mains(fsource, analysis)
+
+    def _merge_mains(self, fsource: Path, analysis: FileAnalysis) -> None:
+        for no, l in analysis.mains:
+            res = self.rel_name(fsource)
+            # arguments are only formatted if the record is written, by the
+            # listener thread of app.core.log_config
+            if res in self.main_pathes[-1:]:
+                logger.warning("main found at least 2 times in '%s'", res)
+                logger.warning("surnumerous main found in '%s'", res)
+                logger.warning("at line %s which is '%s'", no, l.decode())
+            else:
+                self.main_pathes.append(res)
+                logger.info("main found in '%s'", res)
+                logger.info("at line %s which is '%s'", no, l.decode())
+
+    @timed
+    def classify_dirs(self) -> None:
+        """
+        this fonction should be called after search_c_cxx_file was run
+        a c/c++ directory with a source defining main is a program one, one
+        without main whose sources define functions visible to others is a
+        library one, it fills self.program_dirs, self.library_dirs and
+        self.lib_pathes with a library named after each library directory
+        """
+        self.analyse_files()
+        by_dir: DefaultDict[Path, List[FileAnalysis]] = defaultdict(list)
+        for fsource, analysis in self.file_analysis.items():
+            by_dir[fsource.parent].append(analysis)
+        self.program_dirs = []
+        self.library_dirs = []
+        self.lib_pathes = []
+        for rep in sorted(set(self.cxx_dir) | set(self.c_dir)):
+            self._classify_dir(rep, by_dir[rep])
+        self._log_classified()
+
+    def _classify_dir(self, rep: Path, analyses: List[FileAnalysis]) -> None:
+        """
+        add the c/c++ directory rep, whose files have analyses, to the program
+        or library directories, in the order directories are classified
+        """
+        if any(analysis.mains for analysis in analyses):
+            self.program_dirs.append(rep)
+        elif any(analysis.symbols for analysis in analyses):
+            self.library_dirs.append(rep)
+            rel = self.rel_name(rep)
+            self.lib_pathes.append((rel.replace("/", "_"), rel))
+
+    def _log_classified(self) -> None:
+        logger.info(
+            "{} program and {} library directories".format(
+                len(self.program_dirs), len(self.library_dirs)
+            )
+        )
+
+    @timed
+    def active_sources(
+        self, configs: Mapping[str, Mapping[bytes, int]]
+    ) -> Dict[str, List[Path]]:
+        """
+        this fonction should be called after scan was run
+        return for each configuration, given by the macros it defines, the
+        sources holding code compiled in it, the others are empty once
+        preprocessed
+        the conditions compiled during the scan are evaluated for all the
+        configurations at once, no file is read again
+        """
+        self.analyse_files()
+        names = list(configs)
+        values = [configs[name] for name in names]
+        memo: Dict[Expr, List[int]] = {}
+        res: Dict[str, List[Path]] = {name: [] for name in names}
+        total = 0
+        for fsource, analysis in self.file_analysis.items():
+            macros, main = self.file_flags[fsource]
+            if not main:
+                continue
+            total += 1
+            mask = (1 << len(names)) - 1
+            if macros:
+                mask = active_mask(analysis.guards, values, memo)
+            for i, name in enumerate(names):
+                if mask >> i & 1:
+                    res[name].append(fsource)
+        for name in names:
+            logger.info(
+                "configuration {}: {} of {} sources hold code".format(
+                    name, len(res[name]), total
+                )
+            )
+        return res
+
+    @timed
+    def search_includes(self) -> None:
+        """
+        this fonction should be called after search_c_cxx_file was run
+        it fills self.include_graph with the directories whose headers are
+        included by each directory and self.include_dirs with the include
+        paths needed by each c/c++ directory
+        """
+        self.analyse_files()
+        index = self._header_index()
+        self.include_graph = include_graph(
+            ((fsource, res.includes) for fsource, res in self.file_analysis.items()),
+            index,
+        )
+        self._finish_includes(index)
+
+    def _header_index(self) -> HeaderIndex:
+        return HeaderIndex.from_names(
+            ((rep, self.file_table.names_of(rep)) for rep in self.file_table.listed()),
+            self.src_path,
+        )
+
+    def _finish_includes(self, index: HeaderIndex) -> None:
+        """
+        fill self.include_dirs once self.include_graph is complete
+        """
+        self.include_dirs = minimal_include_dirs(
+            self.include_graph, sorted(set(self.cxx_dir) | set(self.c_dir))
+        )
+        logger.info(
+            "{} headers indexed, {} directories include headers of others".format(
+                sum(map(len, index.by_name.values())), len(self.include_graph)
+            )
+        )
+
+    @property
+    def include_pathes(self) -> str:
+        """
+        this fonction should be called after search_includes was run
+        return string suitable for use in a template, one dict entry per
+        c/c++ directory giving its include directories
+        """
+        return "\n".join(
+            "    '{}': [{}],".format(
+                self.rel_name(rep),
+                ", ".join("'{}'".format(self.rel_name(i)) for i in inc_dirs),
+            )
+            for rep, inc_dirs in sorted(self.include_dirs.items())
+        )
+
+    @property
+    def resolved_include_pathes(self) -> str:
+        """
+        this fonction should be called after search_includes was run
+        same as include_pathes with absolute include directories, for a
+        SConscript generated with SConsSettings.precomputed, directories
+        including nothing are left out
+        """
+        root = self.src_path.resolve()
+        return "\n".join(
+            "    '{}': [{}],".format(
+                self.rel_name(rep),
+                ", ".join(
+                    repr(str(root / self.rel_name(i))) for i in inc_dirs
+                ),
+            )
+            for rep, inc_dirs in sorted(self.include_dirs.items())
+            if inc_dirs
+        )
+
+    @property
+    def main_objects(self) -> str:
+        """
+        this fonction should be called after scan was run
+        return string suitable for use in a template, one dict entry per
+        program giving the (directory, index) of the objects it is linked
+        with, for a SConscript generated with SConsSettings.precomputed
+        a program gets its own object and those of the sources defining no
+        main in its directory and in the c/c++ directories it includes from,
+        directly or not, index is the position of the source in the objects
+        returned by the SConscript of its directory
+        """
+        mains = set(self.main_pathes)
+        c_cxx_dirs = set(self.cxx_dir) | set(self.c_dir)
+        lines = []
+        for mname in self.main_pathes:
+            rep = (self.src_path / mname).parent
+            deps = {rep} | set(self.include_dirs.get(rep, ()))
+            objects = []
+            for dep in sorted(deps & c_cxx_dirs):
+                rel = self.rel_name(dep)
+                sources = (
+                    name
+                    for name, suf in sorted(self.file_table.entries(dep))
+                    if suf in SOURCE_SUFFIXES
+                )
+                for i, name in enumerate(sources):
+                    path = self.rel_name(dep / name)
+                    if path == mname or path not in mains:
+                        objects.append("('{}', {})".format(rel, i))
+            lines.append("    '{}': [{}],".format(mname, ", ".join(objects)))
+        return "\n".join(lines)
+
+    @property
+    def resolved_cpppath(self) -> str:
+        """
+        this fonction should be called after search_c_cxx_file was run
+        return string suitable for use in a template, the absolute paths of
+        every c/c++ and header only directory
+        """
+        root = self.src_path.resolve()
+        names = sorted(set(self.cxx_dir_name) | set(self.c_dir_name))
+        return "\n".join(
+            "    {},".format(repr(str(root / name)))
+            for name in names + sorted(self.hxx_only_dir_name0)
+        )
 
     def scan(self) -> None:
         """
@@ -289,24 +1203,265 @@ class toscons:
         self.search_c_cxx_file()
         self.scan_macros()
         self.scan_and_search_main()
+        self.classify_dirs()
+        self.search_includes()
+        if self.own_cache:
+            self.cache.save()
 
-    def write_in_SConscript(self) -> None:
+    def iter_directories(self) -> Iterator[DirectoryRecord]:
         """
-        write Sconscripts in src file and all c/c++ dirs below
+        same as scan, directory by directory: each c/c++ or header only
+        directory is yielded, in sorted order, as soon as its files are
+        analysed, so that its SConscript can be rendered with render_dir and
+        the record dropped
+        the analysis of files is not kept in self.file_analysis, results
+        depending on every directory (undefined_tested_kword, main_pathes,
+        lib_pathes, include_dirs, i.e. what render_src needs) are complete
+        once the generator is exhausted
+        an enabled cache still holds the results of every file until it is
+        saved, use_cache=False keeps only the listing of the tree in memory
+        """
+        self.scan_dir_and_file()
+        self._reset_results()
+        self.search_c_cxx_file()
+        index = self._header_index()
+        hits, misses = self.stats.cache_hits, self.stats.cache_misses
+        warned: List[Tuple[Path, int]] = []
+        total = 0
+        pool = self.pool
+        if self.jobs > 1 and pool is None and not self.concurrent_io:
+            # one pool for the whole scan instead of one per directory
+            from concurrent.futures import ProcessPoolExecutor
+
+            pool_class = ThreadPoolExecutor if self.threads else ProcessPoolExecutor
+            self.pool = pool_class(max_workers=self.jobs)
+        try:
+            for rep in self._analysed_dirs():
+                with self.stats.phase("iter_directories"):
+                    record = self._analyse_dir(rep, index, warned)
+                    total += len(record.analysis)
+                yield record
+        finally:
+            if self.pool is not pool and self.pool is not None:
+                self.pool.shutdown()
+                self.pool = pool
+        with self.stats.phase("iter_directories"):
+            self._log_read(total, hits, misses, warned)
+            self._finish_macros()
+            self._log_classified()
+            self._finish_includes(index)
+            if self.own_cache:
+                self.cache.save()
+
+    def _analyse_dir(
+        self, rep: Path, index: HeaderIndex, warned: List[Tuple[Path, int]]
+    ) -> DirectoryRecord:
+        """
+        analyse the files of rep and merge them in the results of the scan,
+        see iter_directories
+        """
+        analysis = self._read_files(self._file_tasks(rep), warned)
+        for fsource, res in analysis.items():
+            self._merge_macros(res)
+            self._merge_mains(fsource, res)
+        kind = "header"
+        if rep in self.cxx_dir or rep in self.c_dir:
+            kind = "c++" if rep in self.cxx_dir else "c"
+            self._classify_dir(rep, list(analysis.values()))
+        role = ""
+        if self.program_dirs[-1:] == [rep]:
+            role = "program"
+        elif self.library_dirs[-1:] == [rep]:
+            role = "library"
+        graph = include_graph(
+            ((fsource, res.includes) for fsource, res in analysis.items()), index
+        )
+        self.include_graph.update(graph)
+        return DirectoryRecord(rep, kind, role, analysis, sorted(graph.get(rep, ())))
+
+    def dir_sources(self, rep: Path) -> str:
         """
-        Scons_src = self.env.get_template("SConscript_src.template")
-        scons1_content = Scons_src.render(datas=self)
-        Scrpath = self.src_path / "SConscript"
-        if Scrpath.exists():
-            existing_scons_content: str = ""
-            with open(Scrpath, "r") as f:
-                existing_scons_content = f.read()
-            res = "\n".join(
-                difflib.unified_diff(existing_scons_content, scons1_content)
+        return string suitable for use in a template, the c/c++ sources of
+        directory rep
+        """
+        return textwrap.fill(
+            ", ".join(
+                "'{}'".format(name)
+                for name, suf in sorted(self.file_table.entries(rep))
+                if suf in SOURCE_SUFFIXES
             )
-            if len(res) != 0:
-                logging.info(res)
+        )
+
+    def render_SConscripts(self) -> Dict[Path, str]:
+        """
+        this fonction should be called after scan was run
+        return the content of the SConscript of src_path and of each c/c++
+        directory
+        """
+        res = {self.src_path / "SConscript": self.render_src()}
+        dir_template = self.env.get_template("SConscript_dir.template")
+        for rep in sorted(set(self.cxx_dir) | set(self.c_dir)):
+            res[rep / "SConscript"] = self.render_dir(rep, dir_template)
+        return res
+
+    def render_src(self) -> str:
+        """
+        this fonction should be called after scan was run, or once
+        iter_directories is exhausted
+        return the content of the SConscript of src_path
+        """
+        return self.env.get_template("SConscript_src.template").render(datas=self)
+
+    def render_dir(self, rep: Path, template: Optional["Template"] = None) -> str:
+        """
+        return the content of the SConscript of the c/c++ directory rep, it
+        only depends on the files listed in rep
+        """
+        if template is None:
+            template = self.env.get_template("SConscript_dir.template")
+        return template.render(datas={"sources": self.dir_sources(rep)})
+
+    @timed
+    def write_in_SConscript(self, update: bool = True) -> int:
+        """
+        write Sconscripts in src file and all c/c++ dirs below
+        a SConscript holding the right content is not written again, an
+        existing one is only replaced if update is True
+        every SConscript is rendered first in this thread, jinja holding the
+        GIL, only the writes go through a pool of jobs threads
+        return the number of files written
+        """
+        contents = self.render_SConscripts()
+        diff = logger.isEnabledFor(logging.INFO)
+
+        def write(item: Tuple[Path, str]) -> WriteResult:
+            return write_if_changed(item[0], item[1], update, diff)
+
+        results: Iterable[WriteResult]
+        if self.jobs > 1 and len(contents) > PARALLEL_WRITE_MIN:
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                results = list(pool.map(write, contents.items()))
         else:
-            with open(Scrpath, "w") as g:
-                g.write(scons1_content)
-            logger.info(f"{Scrpath} writen")
+            results = map(write, contents.items())
+        written = 0
+        for Scrpath, res in zip(contents, results):
+            if res.diff:
+                logger.info(res.diff)
+            if res.written:
+                written += 1
+                logger.info(f"{Scrpath} writen")
+            else:
+                self.stats.sconscripts_skipped += 1
+        self.stats.sconscripts_written += written
+        return written
+
+    def _forget(self, p: Path) -> None:
+        """
+        remove directory p and the directories below it from the model
+        """
+        stack = [p]
+        while stack:
+            q = stack.pop()
+            stack.extend(self.dir_dir.pop(q, []))
+            if q in self.file_table:
+                for name in self.file_table.names_of(q):
+                    self.file_flags.pop(q / name, None)
+                self.file_table.remove_dir(q)
+
+    def _relist(self, p: Path) -> None:
+        """
+        list directory p again, directories appearing below it are walked,
+        directories gone are forgotten, files of p are analysed again
+        """
+        if p != self.src_path:
+            self._forget(p)
+            if p.is_dir() if self.listings is None else p in self.listings:
+                self._walk([p])
+            elif p.parent in self.dir_dir:
+                self.dir_dir[p.parent] = [q for q in self.dir_dir[p.parent] if q != p]
+            return
+        self.stats.dirs_listed += 1
+        entries = self.fs.list_dir(p) if self.listings is None else self.listings[p]
+        old = self.ignore_rules.get(p)
+        entries = self._prune(p, entries)
+        new = self.ignore_rules.get(p)
+        # rules of src_path changed, every directory is walked again
+        changed = (old.rules if old else []) != (new.rules if new else [])
+        tops = [
+            p / name for name, is_dir in entries if is_dir and not name.startswith(".")
+        ]
+        for q in set(self.dir_content) - (set() if changed else set(tops)):
+            if q.parent == p:
+                self._forget(q)
+        self._walk([q for q in tops if q not in self.file_table])
+
+    def _reset_results(self) -> None:
+        """
+        clear everything computed after scan_dir_and_file
+        """
+        self.cxx_dir = []
+        self.c_dir = []
+        self.hxx_only_dir = []
+        self.all_define = set()
+        self.tested_define = set()
+        self.main_pathes = []
+        self.program_dirs = []
+        self.library_dirs = []
+        self.lib_pathes = []
+        self.include_graph = {}
+        self.include_dirs = {}
+        self.analysed = False
+
+    def rescan(self) -> None:
+        """
+        forget the model and scan src_path again, when the changes since the
+        last scan are not known, e.g. watch events were lost
+        every directory is listed and every file checked again, the cache
+        still saves reading the files whose stat is unchanged
+        """
+        self.file_table = FileTable()
+        self.dir_dir = defaultdict(list)
+        self.ignore_rules = {}
+        self.file_analysis = {}
+        self.file_flags = {}
+        self._reset_results()
+        self.scan()
+
+    @timed
+    def update(self, changed: Iterable[Path]) -> None:
+        """
+        update the model after a scan for the paths in changed, which were
+        created, modified or deleted
+        a modified source is read again, any other change lists again the
+        directory holding it, only those directories and files are read
+        with git_index, the index is read again and a path below directories
+        not known yet lists again the nearest one known
+        """
+        self._open_git()
+        relist: Set[Path] = set()
+        for p in changed:
+            if self.listings is not None:
+                while not (p.parent == self.src_path or p.parent in self.dir_content):
+                    if p.parent == p or self.src_path not in p.parent.parents:
+                        break
+                    p = p.parent
+            if p == self.src_path or p in self.dir_content:
+                relist.add(p)
+            elif p.parent == self.src_path or p.parent in self.dir_content:
+                if p in self.file_flags and self._is_file(p):
+                    # content changed, read it again
+                    del self.file_flags[p]
+                else:
+                    relist.add(p.parent)
+        # a directory walked again gets its subdirectories walked too
+        for p in sorted(relist):
+            if not any(q in relist for q in p.parents):
+                self._relist(p)
+        self._reset_results()
+        self.search_c_cxx_file()
+        self.scan_macros()
+        self.scan_and_search_main()
+        self.classify_dirs()
+        self.search_includes()
+        if self.own_cache:
+            self.cache.save()
@@ -0,0 +1,114 @@
+import functools
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class PhaseTime(NamedTuple):
+    """
+    wall and cpu seconds spent in a phase, cpu time is the one of this
+    process, worker processes are not counted
+    """
+
+    wall: float
+    cpu: float
+
+
+class RunStats:
+    """
+    timers and counters of a toscons run
+    a phase run several times, e.g. by watch mode, adds up its times
+    phases may be nested, analyse_files is timed inside the first phase
+    needing file results
+    """
+
+    COUNTERS = (
+        "dirs_listed",
+        "dirs_pruned",
+        "files_pruned",
+        "files_opened",
+        "bytes_read",
+        "directives_parsed",
+        "cache_hits",
+        "cache_misses",
+        "store_hits",
+        "sconscripts_written",
+        "sconscripts_skipped",
+    )
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, PhaseTime] = {}
+        self.dirs_listed = 0
+        self.dirs_pruned = 0
+        self.files_pruned = 0
+        self.files_opened = 0
+        self.bytes_read = 0
+        self.directives_parsed = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.store_hits = 0
+        self.sconscripts_written = 0
+        self.sconscripts_skipped = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            prev = self.phases.get(name, PhaseTime(0.0, 0.0))
+            self.phases[name] = PhaseTime(
+                prev.wall + time.perf_counter() - wall,
+                prev.cpu + time.process_time() - cpu,
+            )
+
+    def add(self, other: "RunStats") -> None:
+        """
+        add counters and phase times of other, e.g. to sum the runs of a batch
+        """
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name, t in other.phases.items():
+            prev = self.phases.get(name, PhaseTime(0.0, 0.0))
+            self.phases[name] = PhaseTime(prev.wall + t.wall, prev.cpu + t.cpu)
+
+    def as_dict(self) -> Dict[str, Any]:
+        res: Dict[str, Any] = {name: getattr(self, name) for name in self.COUNTERS}
+        res["phases"] = {name: t._asdict() for name, t in self.phases.items()}
+        return res
+
+    def dump(self, path: Path, roots: Optional[Dict[str, "RunStats"]] = None) -> None:
+        """
+        write the stats as json in path, the stats of each tree of a batch
+        summed in self are written under 'roots' if given
+        """
+        data = self.as_dict()
+        if roots is not None:
+            data["roots"] = {name: stats.as_dict() for name, stats in roots.items()}
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2)
+            f.write("\n")
+
+    def summary(self) -> str:
+        return ", ".join(
+            "{} {:.3f}s".format(name, t.wall) for name, t in self.phases.items()
+        )
+
+
+def timed(method: F) -> F:
+    """
+    decorator timing a method of an object with a stats attribute as the
+    phase of the same name
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.stats.phase(method.__name__):
+            return method(self, *args, **kwargs)
+
+    return wrapper  # type: ignore
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+from app import __version__
+from app.util.pack import packb, unpackb
+from app.util.write import write_atomic
+
+try:
+    import fcntl
+except ImportError:  # not on windows, trims are not serialized there
+    fcntl = None  # type: ignore
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT = 3
+DEFAULT_MAX_BYTES = 256 << 20
+# a trim removes entries until the store is this fraction of its maximum size,
+# so that it does not trim again after each run
+TRIM_RATIO = 0.8
+# temporary files older than this were left by a process killed while writing
+STALE_SECONDS = 3600
+LOCK_NAME = "lock"
+
+
+class ResultStore:
+    """
+    results of file analyses keyed on a hash of the content of the file and
+    of the flags used, a directory shared by every tree and process using it
+    so that a content is analysed once
+    each entry is a file written atomically, readers never see a partial one
+    the time of the last use of an entry is its mtime, the least recently
+    used entries are removed by trim once the store is above max_bytes
+    a store only holds paths and is sent as is to the workers of a pool
+    values are msgpack data, so that anyone able to write in a shared store
+    can not make its readers run code
+    """
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, buf: Any, flags: Any) -> str:
+        """
+        key of the result of the analysis of content buf with flags, buf is
+        bytes or a memory map
+        """
+        h = hashlib.blake2b(digest_size=20)
+        h.update(repr((STORE_FORMAT, __version__, flags)).encode())
+        h.update(buf)
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / key[2:]
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        stored result of key, None if there is none or it can not be read
+        """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = unpackb(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"store entry {path} unreadable, removed ({e})")
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        try:
+            # the entry is now the most recently used one
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        """
+        store value, which packb can pack, as the result of key
+        """
+        path = self._path(key)
+        data = packb(value)
+        try:
+            try:
+                write_atomic(path, data)
+            except FileNotFoundError:
+                os.makedirs(path.parent, exist_ok=True)
+                write_atomic(path, data)
+        except OSError as e:
+            # a full or read only store only costs the analysis next time
+            logger.warning(f"store entry {path} not written ({e})")
+
+    def _entries(self) -> Tuple[List[Tuple[int, int, str]], List[str]]:
+        """
+        (mtime, size, path) of each entry and the temporary files left by
+        killed writers
+        """
+        entries: List[Tuple[int, int, str]] = []
+        stale: List[str] = []
+        limit = time.time() - STALE_SECONDS
+        with os.scandir(self.directory) as top:
+            subdirs = [e.path for e in top if e.is_dir() and len(e.name) == 2]
+        for subdir in subdirs:
+            try:
+                with os.scandir(subdir) as it:
+                    for e in it:
+                        try:
+                            st = e.stat()
+                        except FileNotFoundError:
+                            continue
+                        if not e.name.startswith("."):
+                            entries.append((st.st_mtime_ns, st.st_size, e.path))
+                        elif st.st_mtime < limit:
+                            stale.append(e.path)
+            except FileNotFoundError:
+                continue
+        return entries, stale
+
+    def trim(self) -> int:
+        """
+        remove the least recently used entries if the store is above
+        max_bytes, return the number of entries removed
+        a process trimming while another one does returns 0 at once
+        """
+        with open(self.directory / LOCK_NAME, "a") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return 0
+            entries, stale = self._entries()
+            for path in stale:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return 0
+            removed = 0
+            target = self.max_bytes * TRIM_RATIO
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+        logger.info(f"{removed} entries removed from store {self.directory}")
+        return removed
@@ -0,0 +1,81 @@
+import re
+from typing import List, NamedTuple
+
+from app.util.directive import Buffer
+
+# comments, literals and directives are matched whole so that the braces
+# inside them are not seen, what lies between them is skipped in one go
+# a lone '/', quote or the end of the buffer are matched too so that no
+# search fails and the scan stays linear
+BRACE_RE = re.compile(
+    rb"[^/\"'#{}]*(?:"
+    rb"/\*[^*]*\*+(?:[^/*][^*]*\*+)*/"
+    rb"|//[^\n]*"
+    rb'|"(?:\\.|[^"\\\n])*"'
+    rb"|'(?:\\.|[^'\\\n])*'"
+    rb"|(#(?:\\\r?\n|[^\n])*)"
+    rb"|([{}])"
+    rb"|[/\"']|\Z)"
+)
+# the end of a function definition head, just before its body: name,
+# parameters with one level of nested parentheses, then qualifiers,
+# attributes or constructor initializers
+HEAD_RE = re.compile(
+    rb"\b([A-Za-z_]\w*)[ \t\r\n]*\((?:[^()]|\([^()]*\))*\)"
+    rb"(?:[^;{}()=\"']|\((?:[^()]|\([^()]*\))*\))*\Z"
+)
+STATIC_RE = re.compile(rb"\bstatic\b")
+
+
+class Definition(NamedTuple):
+    """
+    a function definition found by defined_functions
+    pos: offset of the name in the buffer
+    static: the function is declared static and is not visible to others
+    """
+
+    name: bytes
+    pos: int
+    static: bool
+
+
+# words followed by '(' and '{' which do not define a function
+NOT_FUNCTIONS = frozenset((b"if", b"for", b"while", b"switch", b"catch"))
+
+
+def defined_functions(buf: Buffer) -> List[Definition]:
+    """
+    return the function definitions of buf, in order, in one pass ignoring
+    comments, literals and directives
+    a definition is a name followed by its parameters and a body, outside
+    of any other function body
+
+    >>> [d.name for d in defined_functions(b"static int f(void) { g(1); }\\n"
+    ...     b"/* int h() {} */ int main(int c, char **v) { return 0; }")]
+    [b'f', b'main']
+    """
+    res: List[Definition] = []
+    body_depth = 0
+    # end of the last brace or directive, a declaration never starts before it
+    prev_end = 0
+    for m in BRACE_RE.finditer(buf):
+        directive, brace = m.groups()
+        if brace is None:
+            if directive is not None:
+                # a declaration does not go across a directive
+                prev_end = m.end()
+            continue
+        if body_depth:
+            body_depth += 1 if brace == b"{" else -1
+        elif brace == b"{":
+            start = m.start(2)
+            decl_start = max(buf.rfind(b";", prev_end, start), prev_end)
+            head = HEAD_RE.search(buf, decl_start, start)
+            if head is not None and head.group(1) not in NOT_FUNCTIONS:
+                static = STATIC_RE.search(buf, decl_start, head.start()) is not None
+                res.append(Definition(head.group(1), head.start(1), static))
+                body_depth = 1
+        # otherwise '{' of a namespace, a class or data and '}' closing them
+        # are transparent, their content is read as top level code
+        prev_end = m.end()
+    return res
@@ -0,0 +1,214 @@
+import hashlib
+import sys
+import typing
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Mapping, Set, Tuple
+
+
+def name_suffix(name: str) -> str:
+    """
+    same as "".join(Path(name).suffixes) without building a Path
+
+    >>> name_suffix("a.tar.gz"), name_suffix(".profile"), name_suffix("a.")
+    ('.tar.gz', '', '')
+    """
+    if name.endswith("."):
+        return ""
+    name = name.lstrip(".")
+    pos = name.find(".")
+    return "" if pos == -1 else name[pos:]
+
+
+def shard_of(name: str, count: int) -> int:
+    """
+    shard, among count, of the directory name, the same on every host and
+    python run unlike hash()
+    """
+    digest = hashlib.blake2b(name.encode("utf-8", "surrogateescape"), digest_size=8)
+    return int.from_bytes(digest.digest(), "big") % count
+
+
+class FileTable:
+    """
+    files of a source tree, one row per file held in columns: an interned
+    name and the id of its suffix in the suffix table
+    the files of a listed directory are consecutive rows, rows of a
+    directory listed again or forgotten are left unused until compact
+    """
+
+    __slots__ = (
+        "dirs",
+        "dir_ids",
+        "suffixes",
+        "suffix_ids",
+        "names",
+        "file_suffix",
+        "ranges",
+        "unused",
+    )
+
+    def __init__(self) -> None:
+        self.dirs: List[Path] = []
+        self.dir_ids: Dict[Path, int] = {}
+        self.suffixes: List[str] = []
+        self.suffix_ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.file_suffix = array("I")
+        # rows of each listed directory, in listing order
+        self.ranges: Dict[int, Tuple[int, int]] = {}
+        self.unused = 0
+
+    def dir_id(self, p: Path) -> int:
+        i = self.dir_ids.get(p)
+        if i is None:
+            i = self.dir_ids[p] = len(self.dirs)
+            self.dirs.append(p)
+        return i
+
+    def suffix_id(self, suf: str) -> int:
+        i = self.suffix_ids.get(suf)
+        if i is None:
+            i = self.suffix_ids[suf] = len(self.suffixes)
+            self.suffixes.append(suf)
+        return i
+
+    def add_dir(self, p: Path, names: Iterable[str]) -> None:
+        """
+        set the files of directory p, replacing those of a previous listing
+        """
+        self.remove_dir(p)
+        d = self.dir_id(p)
+        start = len(self.names)
+        for name in names:
+            self.names.append(sys.intern(name))
+            self.file_suffix.append(self.suffix_id(name_suffix(name)))
+        self.ranges[d] = (start, len(self.names))
+
+    def remove_dir(self, p: Path) -> None:
+        d = self.dir_ids.get(p)
+        if d is None or d not in self.ranges:
+            return
+        start, end = self.ranges.pop(d)
+        self.unused += end - start
+        if self.unused > len(self.names) // 2:
+            self.compact()
+
+    def compact(self) -> None:
+        """
+        drop unused rows, listing order is kept
+        """
+        names: List[str] = []
+        file_suffix = array("I")
+        ranges: Dict[int, Tuple[int, int]] = {}
+        for d, (start, end) in self.ranges.items():
+            ranges[d] = (len(names), len(names) + end - start)
+            names.extend(self.names[start:end])
+            file_suffix.extend(self.file_suffix[start:end])
+        self.names = names
+        self.file_suffix = file_suffix
+        self.ranges = ranges
+        self.unused = 0
+
+    def __contains__(self, p: object) -> bool:
+        d = self.dir_ids.get(p) if isinstance(p, Path) else None
+        return d is not None and d in self.ranges
+
+    def __len__(self) -> int:
+        return len(self.ranges)
+
+    def listed(self) -> Iterator[Path]:
+        """
+        listed directories, in listing order
+        """
+        return (self.dirs[d] for d in self.ranges)
+
+    def with_files(self) -> Iterator[Path]:
+        """
+        listed directories holding files, in listing order
+        """
+        return (self.dirs[d] for d, (s, e) in self.ranges.items() if s != e)
+
+    def has_files(self, p: Path) -> bool:
+        if p not in self:
+            return False
+        start, end = self.ranges[self.dir_ids[p]]
+        return start != end
+
+    def entries(self, p: Path) -> Iterator[Tuple[str, str]]:
+        """
+        (name, suffix) of the files of directory p
+        """
+        start, end = self.ranges[self.dir_ids[p]]
+        suffixes = self.suffixes
+        for row in range(start, end):
+            yield self.names[row], suffixes[self.file_suffix[row]]
+
+    def names_of(self, p: Path) -> List[str]:
+        start, end = self.ranges[self.dir_ids[p]]
+        return self.names[start:end]
+
+    def suffix_set(self, p: Path) -> Set[str]:
+        start, end = self.ranges[self.dir_ids[p]]
+        return {self.suffixes[s] for s in set(self.file_suffix[start:end])}
+
+    def suffix_counts(self) -> "typing.Counter[str]":
+        """
+        number of files of each suffix, suffixes in order of first occurrence
+        """
+        counts: typing.Counter[int] = Counter()
+        for start, end in self.ranges.values():
+            counts.update(self.file_suffix[start:end])
+        return Counter({self.suffixes[i]: n for i, n in sorted(counts.items())})
+
+
+class DirContentView(Mapping[Path, List[Path]]):
+    """
+    read only view of a FileTable giving the files of each listed directory
+    as paths, built on access
+    """
+
+    def __init__(self, table: FileTable) -> None:
+        self.table = table
+
+    def __getitem__(self, p: Path) -> List[Path]:
+        if p not in self.table:
+            raise KeyError(p)
+        return [p / name for name in self.table.names_of(p)]
+
+    def __contains__(self, p: object) -> bool:
+        return p in self.table
+
+    def __iter__(self) -> Iterator[Path]:
+        return self.table.listed()
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+
+class DirSuffixesView(Mapping[Path, Dict[str, List[Path]]]):
+    """
+    read only view of a FileTable giving the files of each directory holding
+    files, grouped by suffix
+    """
+
+    def __init__(self, table: FileTable) -> None:
+        self.table = table
+
+    def __getitem__(self, p: Path) -> Dict[str, List[Path]]:
+        if not self.table.has_files(p):
+            raise KeyError(p)
+        res: Dict[str, List[Path]] = {}
+        for name, suf in self.table.entries(p):
+            res.setdefault(suf, []).append(p / name)
+        return res
+
+    def __contains__(self, p: object) -> bool:
+        return isinstance(p, Path) and self.table.has_files(p)
+
+    def __iter__(self) -> Iterator[Path]:
+        return self.table.with_files()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
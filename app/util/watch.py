@@ -0,0 +1,283 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from app.util.gitindex import GitTree
+from app.util.scan import toscons
+
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+)
+# struct inotify_event without its name: wd, mask, cookie, len
+EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """
+    directory watcher built on linux inotify through ctypes
+    raise OSError when inotify is not available, see make_watcher
+    """
+
+    def __init__(self) -> None:
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self.libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self.wds: Dict[int, Path] = {}
+
+    def watch_dirs(self, dirs: Iterable[Path]) -> None:
+        """
+        add a watch on each directory, directories already watched are kept
+        inotify gives back the same descriptor for them
+        """
+        for p in dirs:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(p), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                logger.warning("can not watch {}: {}".format(p, os.strerror(err)))
+                continue
+            self.wds[wd] = p
+
+    def read(self, timeout: Optional[float]) -> Optional[Set[Path]]:
+        """
+        wait up to timeout seconds, None meaning forever, and return the
+        paths changed, an empty set if nothing happened
+        None is returned when the kernel queue overflowed and events were
+        lost, the whole tree must be scanned again
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed: Set[Path] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, pos)
+                pos += EVENT.size
+                name = data[pos : pos + length].rstrip(b"\0")
+                pos += length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & IN_IGNORED:
+                    self.wds.pop(wd, None)
+                    continue
+                p = self.wds.get(wd)
+                if p is None:
+                    continue
+                changed.add(p / os.fsdecode(name) if name else p)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollWatcher:
+    """
+    portable watcher comparing the stat of every watched directory and of
+    the files they hold every interval seconds
+    """
+
+    def __init__(self, interval: float = 1.0) -> None:
+        self.interval = interval
+        self.state: Dict[Path, Tuple[int, int]] = {}
+        self.dirs: Set[Path] = set()
+
+    def _snapshot(self) -> Dict[Path, Tuple[int, int]]:
+        state: Dict[Path, Tuple[int, int]] = {}
+        for p in self.dirs:
+            try:
+                with os.scandir(p) as it:
+                    for e in it:
+                        try:
+                            st = e.stat(follow_symlinks=False)
+                        except OSError:
+                            # removed since the directory was read, it is
+                            # seen as gone
+                            continue
+                        state[Path(e.path)] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+        return state
+
+    def _changes(self) -> Set[Path]:
+        state = self._snapshot()
+        changed = {
+            p
+            for p in state.keys() | self.state.keys()
+            if state.get(p) != self.state.get(p)
+        }
+        self.state = state
+        return changed
+
+    def watch_dirs(self, dirs: Iterable[Path]) -> None:
+        self.dirs.update(dirs)
+        self.dirs = {p for p in self.dirs if p.is_dir()}
+        self.state = self._snapshot()
+
+    def read(self, timeout: Optional[float]) -> Optional[Set[Path]]:
+        """
+        same as InotifyWatcher.read, a poll never overflows
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = self._changes()
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, max(deadline - time.monotonic(), 0))
+            time.sleep(delay)
+
+    def close(self) -> None:
+        pass
+
+
+class GitIndexWatcher(PollWatcher):
+    """
+    watcher polling the files tracked by the git index of a source tree every
+    interval seconds, no directory is listed, see GitTree.refresh
+    """
+
+    def __init__(self, tree: GitTree, interval: float = 1.0) -> None:
+        super().__init__(interval)
+        self.tree = tree
+        # files already different from the index when watching starts were
+        # read by the scan
+        tree.refresh()
+
+    def _changes(self) -> Set[Path]:
+        return self.tree.refresh()
+
+    def watch_dirs(self, dirs: Iterable[Path]) -> None:
+        pass
+
+
+def make_watcher(
+    poll: bool = False, interval: float = 1.0, tree: Optional[GitTree] = None
+):
+    """
+    inotify watcher when available, a polling one otherwise or if poll is True
+    with poll, tree polls the files of a git index instead of the directories
+    """
+    if poll and tree is not None:
+        return GitIndexWatcher(tree, interval)
+    if not poll:
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError) as e:
+            logger.info("inotify not available ({}), polling instead".format(e))
+    return PollWatcher(interval)
+
+
+def is_output(T: toscons, p: Path) -> bool:
+    """
+    tell if p is written by the tool itself or hidden, and must not trigger
+    an update, ignore files are hidden but change the directories listed
+    """
+    if p.name == "SConscript" and (
+        p.parent == T.src_path or p.parent in T.cxx_dir or p.parent in T.c_dir
+    ):
+        return True
+    parts = p.relative_to(T.src_path).parts
+    if p.name in T.ignore_files:
+        parts = parts[:-1]
+    return any(part.startswith(".") for part in parts)
+
+
+def watch(
+    T: toscons,
+    debounce: float = 0.5,
+    max_cycles: Optional[int] = None,
+    watcher=None,
+    update: bool = True,
+) -> None:
+    """
+    keep SConscripts up to date with the sources of T, which must have been
+    scanned, until interrupted or after max_cycles updates
+    changes are collected until nothing happened for debounce seconds, then
+    only the directories and files changed are read again and SConscripts
+    are written if their content changed, existing ones only replaced if
+    update is True
+    """
+    if watcher is None:
+        watcher = make_watcher()
+    watcher.watch_dirs([T.src_path] + list(T.dir_content))
+    logger.info("watching {} directories".format(len(T.dir_content) + 1))
+    cycles = 0
+    try:
+        while max_cycles is None or cycles < max_cycles:
+            changed = watcher.read(None)
+            # wait for the burst of events of an editor or a checkout to end
+            while changed is not None:
+                more = watcher.read(debounce)
+                if more is None:
+                    changed = None
+                elif not more:
+                    break
+                else:
+                    changed |= more
+            if changed is not None:
+                changed = {p for p in changed if not is_output(T, p)}
+                if not changed:
+                    continue
+            cycles += 1
+            start = time.perf_counter()
+            if changed is None:
+                # any directory or file may have changed
+                logger.warning("events lost, scanning {} again".format(T.src_path))
+                T.rescan()
+                changed = {T.src_path}
+            else:
+                T.update(changed)
+            watcher.watch_dirs(list(T.dir_content))
+            written = T.write_in_SConscript(update=update)
+            logger.info(
+                "{} changes handled in {:.3f}s, {} SConscripts written".format(
+                    len(changed), time.perf_counter() - start, written
+                )
+            )
+    finally:
+        watcher.close()
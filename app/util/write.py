@@ -0,0 +1,95 @@
+import difflib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+
+# os.umask can only be read by setting it, writers of other threads must not
+# see the value set meanwhile
+_umask_lock = threading.Lock()
+
+
+def current_umask() -> int:
+    with _umask_lock:
+        mask = os.umask(0o022)
+        os.umask(mask)
+    return mask
+
+
+class WriteResult(NamedTuple):
+    """
+    written: the file was created or replaced
+    diff: line diff between the previous content and the new one, empty if
+    the file is new, unchanged or if no diff was asked
+    """
+
+    written: bool
+    diff: str
+
+
+def line_diff(old: str, new: str, name: str) -> str:
+    """
+    unified diff of the lines of old and new
+    """
+    return "".join(
+        difflib.unified_diff(
+            old.splitlines(keepends=True),
+            new.splitlines(keepends=True),
+            fromfile=name,
+            tofile=name,
+        )
+    )
+
+
+def write_atomic(path: Path, data: bytes, mode: Optional[int] = None) -> None:
+    """
+    write data in a temporary file next to path and rename it to path, a
+    reader never sees a partly written file
+    the file gets mode, or the mode open gives a new file, 0o666 less the
+    umask, when mode is None
+    the temporary name starts with '.' so that scans ignore it
+    """
+    if mode is None:
+        mode = 0o666 & ~current_umask()
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_name, mode)
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def write_if_changed(
+    path: Path, content: str, update: bool = True, diff: bool = False
+) -> WriteResult:
+    """
+    write content in path unless path already holds it, so that unchanged
+    files keep their timestamp, an existing file is only replaced if update
+    is True
+    the old content is compared first, the diff is only computed if asked
+    """
+    data = content.encode()
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        write_atomic(path, data)
+        return WriteResult(True, "")
+    old: Optional[bytes] = None
+    # files of another size differ, they are only read for the diff
+    if st.st_size == len(data) or diff:
+        with open(path, "rb") as f:
+            old = f.read()
+        if old == data:
+            return WriteResult(False, "")
+    res = ""
+    if diff and old is not None:
+        res = line_diff(old.decode(errors="replace"), content, str(path))
+    if not update:
+        return WriteResult(False, res)
+    write_atomic(path, data, st.st_mode & 0o7777)
+    return WriteResult(True, res)
@@ -0,0 +1,54 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture
+def create_repo(request):
+    """
+    request allow to retrive markers applied to a test function
+    i.e. introspection
+    """
+    dir_name = tempfile.mkdtemp()
+    #   src_test_dir = Path("tests") / Path("data") / Path("repo1")
+    src_test_dir = request.node.get_closest_marker("src_test_dir").args[0]
+    if src_test_dir is None:
+        shutil.rmtree(dir_name)
+        assert 0
+    else:
+        try:
+            shutil.copytree(src_test_dir, dir_name, dirs_exist_ok=True)
+            yield Path(dir_name)
+        finally:
+            shutil.rmtree(dir_name)
+
+
+@pytest.fixture(scope="session")
+def template_cache(tmp_path_factory):
+    return tmp_path_factory.mktemp("template_cache")
+
+
+@pytest.fixture(autouse=True)
+def no_user_cache(template_cache, monkeypatch):
+    """
+    compiled templates go to a directory of the test session, not to the
+    cache directory of the user, processes run by the tests inherit it
+    """
+    monkeypatch.setenv("TOSCONS_TEMPLATE_CACHE", str(template_cache))
+
+
+@pytest.fixture
+def copy_src(tmp_path):
+    """
+    function copying the src directory of a test repository at name below
+    tmp_path, it returns the copy
+    """
+
+    def copy(name: str = "src", repo: str = "repo2") -> Path:
+        src = tmp_path / name
+        shutil.copytree(Path("tests") / Path("data") / Path(repo) / Path("src"), src)
+        return src
+
+    return copy
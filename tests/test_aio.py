@@ -0,0 +1,100 @@
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+
+from app.bench.synthetic import TreeSpec, generate
+from app.main import main
+from app.util.cache import LocalFS
+from app.util.scan import toscons
+
+# seconds a network file system may take for each call
+LATENCY = 0.01
+
+
+class SlowFS(LocalFS):
+    """
+    local file system where every call takes LATENCY seconds, as on NFS
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self.lock:
+            self.calls += 1
+        time.sleep(LATENCY)
+
+    def list_dir(self, dir_path):
+        self.wait()
+        return super().list_dir(dir_path)
+
+    def stat(self, p):
+        self.wait()
+        return super().stat(p)
+
+    def open(self, p):
+        self.wait()
+        return super().open(p)
+
+
+def make_src(tmp_path: Path) -> Path:
+    spec = TreeSpec(dirs=8, files=4, lines=30, depth=2, outliers=0, mains=0.2)
+    return generate(tmp_path, spec)
+
+
+def timed_scan(src: Path, concurrent_io: int, use_cache: bool = False):
+    fs = SlowFS()
+    T = toscons(src, use_cache=use_cache, fs=fs, concurrent_io=concurrent_io)
+    start = time.perf_counter()
+    T.scan()
+    return T, time.perf_counter() - start, fs.calls
+
+
+def test_async_scan_matches_serial(tmp_path):
+    src = make_src(tmp_path)
+    T1, serial, calls1 = timed_scan(src, 0)
+    T2, overlapped, calls2 = timed_scan(src, 16)
+    assert calls1 == calls2
+    assert dict(T2.dir_content) == dict(T1.dir_content)
+    assert list(T2.file_table.listed()) == list(T1.file_table.listed())
+    assert T2.dir_dir == T1.dir_dir
+    assert T2.main_pathes == T1.main_pathes
+    assert T2.file_analysis == T1.file_analysis
+    assert T2.render_SConscripts() == T1.render_SConscripts()
+    # every call waits LATENCY serially, calls overlap in the async scan
+    assert serial >= calls1 * LATENCY
+    assert overlapped < serial / 3
+
+
+def test_async_scan_with_cache(tmp_path):
+    src = make_src(tmp_path)
+    for p in [src] + list(src.rglob("*")):
+        os.utime(p, ns=(0, 10 ** 18))
+    T1, _, _ = timed_scan(src, 16, use_cache=True)
+    T2, _, _ = timed_scan(src, 16, use_cache=True)
+    assert T2.stats.cache_hits == len(T1.file_analysis)
+    assert T2.stats.files_opened == 0
+    assert T2.file_analysis == T1.file_analysis
+
+
+def test_main_async(tmp_path):
+    src = make_src(tmp_path)
+    assert main([str(src), "--no-cache", "--async", "8"]) == 0
+    assert (src / "SConscript").exists()
+
+
+def test_scan_from_running_loop(tmp_path):
+    src = make_src(tmp_path)
+    T1, _, _ = timed_scan(src, 0)
+
+    async def scan():
+        return timed_scan(src, 8)
+
+    # as from an application already running an event loop
+    T2, _, _ = asyncio.run(scan())
+    assert dict(T2.dir_content) == dict(T1.dir_content)
+    assert T2.file_analysis == T1.file_analysis
+    assert T2.render_SConscripts() == T1.render_SConscripts()
@@ -0,0 +1,44 @@
+from pathlib import Path
+
+from app.bench.runner import PHASES, PhaseResult, compare, run
+from app.bench.synthetic import SPECS, TreeSpec, generate
+from app.util.scan import toscons
+
+
+def tree_content(src: Path):
+    return {
+        p.relative_to(src): p.read_bytes() for p in src.rglob("*") if p.is_file()
+    }
+
+
+def test_generate_deterministic(tmp_path):
+    spec = SPECS["tiny"]
+    src1 = generate(tmp_path / "a", spec)
+    src2 = generate(tmp_path / "b", spec)
+    assert tree_content(src1) == tree_content(src2)
+    src3 = generate(tmp_path / "c", spec._replace(seed=1))
+    assert tree_content(src1) != tree_content(src3)
+
+
+def test_generate_shape(tmp_path):
+    spec = TreeSpec(dirs=6, files=2, lines=40, depth=2, outliers=1, mains=1.0)
+    src = generate(tmp_path, spec)
+    T = toscons(src, use_cache=False)
+    T.scan()
+    assert len(T.dir_content) == 6
+    assert all(len(p.relative_to(src).parts) <= 2 for p in T.dir_content)
+    assert sum(len(files) for files in T.dir_content.values()) == 6 * 2 * 2
+    assert len(T.main_pathes) == 6 * 2 - 1
+
+
+def test_run_and_compare(tmp_path):
+    src = generate(tmp_path, SPECS["tiny"])
+    res = run(src, repeat=1, use_cache=False)
+    assert list(res) == PHASES
+    assert all(r.seconds >= 0 and r.peak > 0 for r in res.values())
+    assert (src / "SConscript").exists()
+    baseline = {p: {"seconds": r.seconds, "peak": r.peak} for p, r in res.items()}
+    assert compare(res, baseline, 0.25) == []
+    slow = dict(res, scan_macros=PhaseResult(10.0, 0))
+    failures = compare(slow, baseline, 0.25)
+    assert len(failures) == 1 and failures[0].startswith("scan_macros")
@@ -0,0 +1,132 @@
+import logging
+import os
+import pickle
+from pathlib import Path
+
+from app import __version__
+from app.util.cache import CACHE_FORMAT, CACHE_NAME, ScanCache
+from app.util.pack import packb
+from app.util.scan import toscons
+
+
+def backdate(root: Path) -> None:
+    """
+    move mtimes out of the racy window so that entries are kept in the cache
+    """
+    for p in [root] + list(root.rglob("*")):
+        os.utime(p, ns=(0, 10 ** 18))
+
+
+def test_cache_reuse(caplog, copy_src):
+    caplog.set_level(logging.INFO)
+    src = copy_src()
+    backdate(src)
+    T = toscons(src)
+    T.scan()
+    assert (src / CACHE_NAME).exists()
+    assert T.stats.cache_hits == 0
+    first_warnings = [r for r in caplog.record_tuples if r[1] == logging.WARNING]
+    caplog.clear()
+    T2 = toscons(src)
+    T2.scan()
+    assert T2.stats.cache_misses == 0
+    assert T2.stats.cache_hits == T.stats.cache_misses
+    assert T2.main_pathes == T.main_pathes
+    assert T2.undefined_tested_kword == T.undefined_tested_kword
+    assert set(T2.dir_content) == set(T.dir_content)
+    assert [r for r in caplog.record_tuples if r[1] == logging.WARNING] == (
+        first_warnings
+    )
+
+
+def test_cache_invalidation(copy_src):
+    src = copy_src()
+    backdate(src)
+    toscons(src).scan()
+    changed = src / "rep11" / "src_11_1.cxx"
+    changed.write_bytes(b"#ifdef new_kword\n#endif\n")
+    T = toscons(src)
+    T.scan()
+    assert T.stats.cache_misses == 1
+    assert "new_kword" in T.undefined_tested_kword
+    assert "rep11/src_11_1.cxx" not in T.main_pathes
+
+
+def test_cache_new_directory(copy_src):
+    src = copy_src()
+    backdate(src)
+    toscons(src).scan()
+    (src / "rep40").mkdir()
+    (src / "rep40" / "src_40.c").write_bytes(b"int main() {\n}\n")
+    T = toscons(src)
+    T.scan()
+    assert "rep40/src_40.c" in T.main_pathes
+
+
+def test_cache_version(monkeypatch, copy_src):
+    src = copy_src()
+    backdate(src)
+    toscons(src).scan()
+    assert len(ScanCache(src / CACHE_NAME).files) != 0
+    monkeypatch.setattr("app.util.cache.__version__", "0.0.0")
+    assert len(ScanCache(src / CACHE_NAME).files) == 0
+
+
+class Payload:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __reduce__(self):
+        # unpickling this creates path
+        return (open, (self.path, "w"))
+
+
+def test_cache_is_data_only(tmp_path, copy_src):
+    src = copy_src()
+    backdate(src)
+    marker = tmp_path / "run"
+    # a cache file committed in the tree is never unpickled
+    (src / CACHE_NAME).write_bytes(pickle.dumps(Payload(str(marker))))
+    T = toscons(src)
+    T.scan()
+    assert not marker.exists()
+    assert T.stats.cache_hits == 0
+    # listings of another layout are dropped
+    key = [CACHE_FORMAT, __version__]
+    (src / CACHE_NAME).write_bytes(packb([key, {"src": [1, [[2, 3]]]}, {}]))
+    assert ScanCache(src / CACHE_NAME).dirs == {}
+    # a file result of another layout is read again
+    T = toscons(src)
+    T.scan()
+    cache = ScanCache(src / CACHE_NAME)
+    name = str(src / "rep11" / "src_11_1.cxx")
+    sig, flags, res = cache.files[name]
+    cache.files[name] = (sig, flags, dict(res, guards=[["rm", 1]]))
+    (src / CACHE_NAME).write_bytes(packb([key, cache.dirs, cache.files]))
+    T2 = toscons(src)
+    T2.scan()
+    assert (T2.stats.cache_hits, T2.stats.cache_misses) == (len(cache.files) - 1, 1)
+    assert T2.main_pathes == T.main_pathes
+
+
+def test_no_cache(copy_src):
+    src = copy_src()
+    backdate(src)
+    T = toscons(src, use_cache=False)
+    T.scan()
+    assert not (src / CACHE_NAME).exists()
+
+
+def test_symlink_loop(copy_src):
+    src = copy_src()
+    backdate(src)
+    os.symlink("..", src / "rep11" / "up")
+    os.symlink(src / "rep30", src / "rep30_link")
+    (src / "rep11" / "self.c").symlink_to(src / "rep11" / "src_11_1.cxx")
+    T = toscons(src, use_cache=False)
+    T.scan()
+    assert src / "rep11" / "up" not in T.dir_content
+    assert src / "rep30_link" not in T.dir_content
+    # links to files are still sources
+    assert src / "rep11" / "self.c" in T.dir_content[src / "rep11"]
+    assert T.write_in_SConscript()
@@ -0,0 +1,138 @@
+import json
+from pathlib import Path
+
+from app.main import main
+from app.util.condition import (
+    UNKNOWN,
+    active_mask,
+    evaluate,
+    parse_condition,
+    parse_defines,
+)
+from app.util.scan import analyse_buffer, toscons
+
+CONFIGS = [{}, {b"A": 1}, {b"A": 1, b"B": 3}, {b"B": 1}]
+
+
+def values(expr: bytes):
+    return evaluate(parse_condition(expr), CONFIGS, {})
+
+
+def test_parse_condition():
+    assert parse_condition(b"defined A && !defined(B)") == (
+        "&&",
+        ("defined", b"A"),
+        ("!", ("defined", b"B")),
+    )
+    assert parse_condition(b"(1 + 2) * 3 == 9 && 0x10 >> 4 == 01") == 1
+    assert parse_condition(b"-1 / 2 == 0 && 7 % -3 == 1 && 'a' == 97") == 1
+    assert parse_condition(b"0 && defined(A)") == 0
+    assert parse_condition(b"defined(A) || 1") == 1
+    assert parse_condition(b"A ? B : 2") == ("?", ("macro", b"A"), ("macro", b"B"), 2)
+
+
+def test_parse_condition_unknown():
+    assert parse_condition(b"defined(A") == UNKNOWN
+    assert parse_condition(b"A +") == UNKNOWN
+    assert parse_condition(b"VERSION(1, 2) > 3") == UNKNOWN
+    # an unknown operand does not matter when the other one decides
+    assert parse_condition(b"0 && F(1)") == 0
+
+
+def test_evaluate():
+    assert values(b"defined(A)") == [0, 1, 1, 0]
+    assert values(b"B > 2") == [0, 0, 1, 0]
+    assert values(b"!defined A || B == 1") == [1, 0, 0, 1]
+    assert values(b"A ? B : 5") == [5, 0, 3, 5]
+    assert values(b"F(1)") == [1, 1, 1, 1]
+
+
+def test_evaluate_memo():
+    memo = {}
+    shared = parse_condition(b"defined(A)")
+    guards = [shared, parse_condition(b"defined(A) && B")]
+    assert active_mask(guards, CONFIGS, memo) == 0b0110
+    assert memo[shared] == [0, 1, 1, 0]
+    assert active_mask([], CONFIGS, memo) == 0
+
+
+def test_parse_defines():
+    assert parse_defines(["-DA", "-DB=2", "C=x", "-DD=0x10"]) == {
+        b"A": 1,
+        b"B": 2,
+        b"C": 0,
+        b"D": 16,
+    }
+
+
+def guards(buf: bytes):
+    return analyse_buffer(Path("a.c"), buf).guards
+
+
+def test_guards():
+    assert guards(b"int a;\n#ifdef A\nint b;\n#endif\n") == [1]
+    assert guards(b"/* empty */\n#ifdef A\nint b;\n#endif\n") == [("defined", b"A")]
+    assert guards(b"#if A\n// no code\n#else\n\n#endif\n") == []
+    # the text of a directive found in code is not taken for it
+    assert guards(b"#ifdef FOO\nint a; // #endif\n#endif\n") == [("defined", b"FOO")]
+    assert guards(b"#if A\n#elif B\nint b;\n#else\nint c;\n#endif\n") == [
+        ("&&", ("!", ("macro", b"A")), ("macro", b"B")),
+        ("&&", ("!", ("macro", b"A")), ("!", ("macro", b"B"))),
+    ]
+
+
+def test_guards_nested_and_local_defines():
+    buf = b"#define X 2\n#ifdef A\n#if X > 1 && defined(B)\nint b;\n#endif\n#endif\n"
+    assert guards(buf) == [("&&", ("defined", b"A"), ("defined", b"B"))]
+    # a macro defined in a block is not known after it
+    buf = b"#ifdef A\n#define Y\n#endif\n#ifdef Y\nint y;\n#endif\n"
+    assert guards(buf) == [UNKNOWN]
+    buf = b"#undef B\n#if defined(B)\nint b;\n#endif\n"
+    assert guards(buf) == []
+
+
+def make_src(tmp_path: Path) -> Path:
+    src = tmp_path / "src"
+    (src / "lib").mkdir(parents=True)
+    (src / "lib" / "always.c").write_bytes(b"int always(void) { return 0; }\n")
+    (src / "lib" / "debug.c").write_bytes(
+        b"#ifdef DEBUG\nint trace(void) { return 1; }\n#endif\n"
+    )
+    (src / "lib" / "level.c").write_bytes(
+        b"#if LEVEL >= 2 && !defined(DEBUG)\nint fast(void) { return 2; }\n#endif\n"
+    )
+    return src
+
+
+def test_active_sources(tmp_path):
+    src = make_src(tmp_path)
+    T = toscons(src, use_cache=False)
+    T.scan()
+    res = T.active_sources(
+        {
+            "default": {},
+            "debug": {b"DEBUG": 1, b"LEVEL": 3},
+            "fast": {b"LEVEL": 2},
+        }
+    )
+    lib = src / "lib"
+    assert res == {
+        "default": [lib / "always.c"],
+        "debug": [lib / "always.c", lib / "debug.c"],
+        "fast": [lib / "always.c", lib / "level.c"],
+    }
+
+
+def test_main_config_report(tmp_path):
+    src = make_src(tmp_path)
+    configs = tmp_path / "configs.txt"
+    configs.write_text("# name and flags\ndefault\ndebug -DDEBUG -DLEVEL=3\n")
+    report = tmp_path / "report.json"
+    argv = [str(src), "--no-cache", "--configs", str(configs)]
+    assert main(argv + ["--config-report", str(report)]) == 0
+    assert json.loads(report.read_text()) == {
+        str(src): {
+            "default": ["lib/always.c"],
+            "debug": ["lib/always.c", "lib/debug.c"],
+        }
+    }
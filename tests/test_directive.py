@@ -0,0 +1,59 @@
+from app.util.directive import defined_in_expr, iter_directives
+
+
+def names(buf: bytes):
+    return [(d.name, d.args) for d in iter_directives(buf)]
+
+
+def test_spacing():
+    assert names(b"#if(A)\n# if B\n  #\tifdef C\n#  define D 1\r\n") == [
+        (b"if", b"(A)"),
+        (b"if", b"B"),
+        (b"ifdef", b"C"),
+        (b"define", b"D 1"),
+    ]
+
+
+def test_continuation():
+    buf = b"#if defined(A) || \\\n    defined(B)\n#define C \\\r\n  1\n#endif\n"
+    res = list(iter_directives(buf))
+    assert [d.name for d in res] == [b"if", b"define", b"endif"]
+    assert defined_in_expr(res[0].args) == [b"A", b"B"]
+    assert res[0].text == b"#if defined(A) || \\\n    defined(B)"
+    assert res[1].macro == b"C"
+    assert [buf[d.start : d.start + len(d.text)] for d in res] == [d.text for d in res]
+
+
+def test_block_comment():
+    buf = (
+        b"/* #define A\n#define B\n*/\n#define C /* multi\n#define D\n*/\n"
+        b"// not a comment opening /*\n#define E\n"
+        b'const char *s = "/*";\n#define F\n'
+    )
+    assert [d.macro for d in iter_directives(buf)] == [b"C", b"E", b"F"]
+
+
+def test_comment_in_args():
+    res = list(iter_directives(b"#ifdef A // B\n#if defined(C) /* defined(D) */\n"))
+    assert res[0].macro == b"A"
+    assert defined_in_expr(res[1].args) == [b"C"]
+
+
+def test_unterminated_comment():
+    assert names(b"#define A\n/* never closed\n#define B\n") == [(b"define", b"A")]
+
+
+def test_defined_without_parenthesis():
+    assert defined_in_expr(b"defined A && !defined( B ) || defined_C") == [
+        b"A",
+        b"B",
+    ]
+
+
+def test_defined_errors():
+    warnings = []
+    assert defined_in_expr(b"defined(A && defined B", warnings.append) == [b"B"]
+    assert warnings == [
+        "in 'defined(A && defined B'",
+        "error closing ')' is missing",
+    ]
@@ -0,0 +1,160 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app.main import main
+from app.util.gitindex import parse_index
+from app.util.scan import toscons
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git not found")
+
+
+def git(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=repo, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def make_repo(copy_src) -> Path:
+    """
+    work tree holding the sources of repo2 in src, with untracked build
+    outputs next to them
+    """
+    repo = copy_src("repo/src").parent
+    git(repo, "init", "-q")
+    git(repo, "add", ".")
+    build = repo / "src" / "rep11" / "build"
+    build.mkdir()
+    (build / "gen.c").write_text("int main(void) { return 0; }\n")
+    (repo / "src" / "rep11" / "moc_gen.cxx").write_text("int generated;\n")
+    return repo
+
+
+def ls_files(repo: Path):
+    res = {}
+    for line in git(repo, "ls-files", "-s").splitlines():
+        info, name = line.split("\t")
+        mode, sha, _ = info.split()
+        res[name] = (int(mode, 8), bytes.fromhex(sha))
+    return res
+
+
+@pytest.mark.parametrize("version", ["2", "3", "4"])
+def test_parse_index(copy_src, version):
+    repo = make_repo(copy_src)
+    # an intent to add entry has extended flags
+    git(repo, "add", "-N", "src/rep11/moc_gen.cxx")
+    git(repo, "update-index", "--index-version", version)
+    entries = parse_index((repo / ".git" / "index").read_bytes())
+    assert {name: (e.mode, e.sha) for name, e in entries.items()} == ls_files(repo)
+
+
+def test_parse_index_errors():
+    with pytest.raises(ValueError):
+        parse_index(b"DIRC")
+    with pytest.raises(ValueError):
+        parse_index(b"XXXX" + bytes(40))
+
+
+def test_scan_git_index(copy_src):
+    repo = make_repo(copy_src)
+    src = repo / "src"
+    T = toscons(src, use_cache=False, git_index=True)
+    T.scan()
+    assert T.git is not None
+    assert "rep11/build/gen.c" not in T.main_pathes
+    assert src / "rep11" / "build" not in T.dir_content
+    # without build outputs the walk gives the same tree
+    shutil.rmtree(src / "rep11" / "build")
+    (src / "rep11" / "moc_gen.cxx").unlink()
+    W = toscons(src, use_cache=False)
+    W.scan()
+    assert dict(T.dir_content) == dict(W.dir_content)
+    assert T.dir_dir == W.dir_dir
+    assert T.main_pathes == W.main_pathes
+    assert T.render_SConscripts() == W.render_SConscripts()
+
+
+def test_git_index_fallback(copy_src):
+    src = copy_src()
+    W = toscons(src, use_cache=False)
+    W.scan()
+    T = toscons(src, use_cache=False, git_index=True)
+    T.scan()
+    assert T.git is None and T.listings is None
+    assert dict(T.dir_content) == dict(W.dir_content)
+    # an index that can not be parsed is ignored too
+    repo = make_repo(copy_src)
+    (repo / ".git" / "index").write_bytes(b"DIRC\0\0\0\x09" + bytes(40))
+    T = toscons(repo / "src", use_cache=False, git_index=True)
+    T.scan()
+    assert T.git is None
+    # the walk sees the build outputs
+    assert repo / "src" / "rep11" / "build" in T.dir_content
+
+
+def test_git_refresh_update(copy_src):
+    repo = make_repo(copy_src)
+    src = repo / "src"
+    T = toscons(src, use_cache=False, git_index=True)
+    T.scan()
+    tree = T.git
+    assert tree.refresh() == set()
+    main_file = src / "rep11" / "src_11_1.cxx"
+    with open(main_file, "a") as f:
+        f.write("\nint main(int argc, char **argv)\n{\n}\n")
+    new_dir = src / "rep13"
+    new_dir.mkdir()
+    (new_dir / "lib.c").write_text("int lib(void) { return 1; }\n")
+    git(repo, "add", "src/rep13")
+    # untracked files are not changes
+    (src / "rep11" / "build" / "other.c").write_text("int other;\n")
+    changed = tree.refresh()
+    assert changed == {main_file, new_dir / "lib.c"}
+    assert tree.refresh() == set()
+    T.update(changed)
+    assert "rep11/src_11_1.cxx" in T.main_pathes
+    assert new_dir in T.c_dir
+    assert ("rep13", "rep13") in T.lib_pathes
+    W = toscons(src, use_cache=False, git_index=True)
+    W.scan()
+    assert dict(T.dir_content) == dict(W.dir_content)
+    assert T.main_pathes == W.main_pathes
+    assert T.render_SConscripts() == W.render_SConscripts()
+    # a file removed from the index is forgotten, not read again
+    git(repo, "rm", "-q", "--cached", "src/rep13/lib.c")
+    changed = tree.refresh()
+    assert changed == {new_dir / "lib.c"}
+    T.update(changed)
+    assert new_dir not in T.dir_content
+
+
+def test_git_index_deleted_file(copy_src):
+    repo = make_repo(copy_src)
+    src = repo / "src"
+    # a tracked symbolic link to a directory is not a source
+    (src / "rep11" / "link.c").symlink_to(src / "rep30")
+    git(repo, "add", "src/rep11/link.c")
+    T = toscons(src, use_cache=False, git_index=True)
+    T.scan()
+    assert src / "rep11" / "link.c" not in T.dir_content[src / "rep11"]
+    # deleted without being staged, as 'git status' shows it
+    gone = src / "rep11" / "src_11_1.cxx"
+    gone.unlink()
+    assert T.git.refresh() == {gone}
+    T.update([gone])
+    assert gone not in T.dir_content[src / "rep11"]
+    W = toscons(src, use_cache=False, git_index=True)
+    W.scan()
+    assert dict(T.dir_content) == dict(W.dir_content)
+    assert T.render_SConscripts() == W.render_SConscripts()
+    assert main([str(src), "--git-index"]) == 0
+    assert main([str(src), "--git-index"]) == 0
+
+
+def test_main_git_index(copy_src):
+    repo = make_repo(copy_src)
+    assert main([str(repo / "src"), "--no-cache", "--git-index"]) == 0
+    assert not (repo / "src" / "rep11" / "build" / "SConscript").exists()
@@ -0,0 +1,160 @@
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from app.main import main
+from app.util.ignore import IGNORE_NAME, IgnoreRules, parse_rules, translate
+from app.util.scan import toscons
+from app.util.watch import is_output
+
+RULES = """\
+# build outputs
+build/
+*.o
+!keep.o
+/out
+doc/*.txt
+**/gen/*.c
+third_party/**
+a?c
+[!x]y.h
+trail\\ \n\
+"""
+
+PATHS = [
+    ("build", True),
+    ("build", False),
+    ("src/build", True),
+    ("src/x.o", False),
+    ("src/keep.o", False),
+    ("out", True),
+    ("src/out", True),
+    ("doc/a.txt", False),
+    ("src/doc/a.txt", False),
+    ("doc/sub/a.txt", False),
+    ("gen/a.c", False),
+    ("src/deep/gen/a.c", False),
+    ("src/gen/a.h", False),
+    ("third_party/zlib", True),
+    ("third_party", True),
+    ("abc", False),
+    ("src/a/c", False),
+    ("ay.h", False),
+    ("xy.h", False),
+    ("trail ", False),
+]
+
+
+def test_translate():
+    assert translate("a/**") == "a/.*"
+    assert translate("**/b") == "(?:.*/)?b"
+    assert translate("a**b") == "a[^/]*b"
+    assert translate("[a-c]") == "[a-c]"
+
+
+def test_rules_like_git(tmp_path):
+    if shutil.which("git") is None:
+        pytest.skip("git not found")
+    subprocess.run(["git", "init", "-q"], cwd=tmp_path, check=True)
+    (tmp_path / ".gitignore").write_text(RULES)
+    for path, is_dir in PATHS:
+        p = tmp_path / path
+        if is_dir:
+            p.mkdir(parents=True, exist_ok=True)
+        elif not p.parent.is_dir() or not p.exists():
+            p.parent.mkdir(parents=True, exist_ok=True)
+            p.write_text("")
+    rules = IgnoreRules(parse_rules(RULES))
+    for path, is_dir in PATHS:
+        if path == "build" and not is_dir:
+            # a file of the same name can not be made next to the directory
+            assert not rules.ignored(path, is_dir)
+            continue
+        # git tells directories from files by looking at the tree
+        res = subprocess.run(
+            ["git", "check-ignore", "-q", "--no-index", path], cwd=tmp_path
+        )
+        assert rules.ignored(path, is_dir) == (res.returncode == 0), path
+
+
+def test_nested_rules():
+    rules = IgnoreRules(parse_rules("*.tmp\n/gen\n"))
+    rules = rules.extend(parse_rules("!a.tmp\ngen\n/local.c\n", "src"))
+    assert rules.ignored("x.tmp", False)
+    assert not rules.ignored("src/a.tmp", False)
+    assert rules.ignored("src/b.tmp", False)
+    assert rules.ignored("gen", True)
+    assert rules.ignored("src/sub/gen", False)
+    assert rules.ignored("src/local.c", False)
+    assert not rules.ignored("src/sub/local.c", False)
+    assert rules.filter("src", [("a.tmp", False), ("gen", True), ("x", True)]) == (
+        [("a.tmp", False), ("x", True)],
+        1,
+        0,
+    )
+
+
+def add_ignored(src: Path) -> Path:
+    for name in ("build", "third_party/zlib"):
+        (src / "rep11" / name).mkdir(parents=True)
+        (src / "rep11" / name / "gen.c").write_text("int main(void) { return 0; }\n")
+    (src / "vendor").mkdir()
+    (src / "vendor" / "v.cxx").write_text("#ifdef VENDOR\nint v;\n#endif\n")
+    (src / "rep11" / "moc_a.cxx").write_text("int moc;\n")
+    return src
+
+
+def scan(src: Path, **kwargs) -> toscons:
+    T = toscons(src, use_cache=False, **kwargs)
+    T.scan()
+    return T
+
+
+@pytest.mark.parametrize("concurrent_io", [0, 4])
+def test_scan_prunes(concurrent_io, copy_src):
+    src = add_ignored(copy_src())
+    full = scan(src, concurrent_io=concurrent_io)
+    (src / IGNORE_NAME).write_text("/vendor\nbuild/\n")
+    (src / "rep11" / IGNORE_NAME).write_text("third_party\nmoc_*.cxx\n")
+    T = scan(src, concurrent_io=concurrent_io)
+    assert (T.stats.dirs_pruned, T.stats.files_pruned) == (3, 1)
+    assert T.stats.dirs_listed == full.stats.dirs_listed - 4
+    assert T.stats.files_opened == full.stats.files_opened - 4
+    assert src / "vendor" not in T.dir_content
+    assert "VENDOR" not in T.undefined_tested_kword
+    # the sources left give the SConscripts of a tree without the others
+    for p in (src / "vendor", src / "rep11" / "build", src / "rep11" / "third_party"):
+        shutil.rmtree(p)
+    (src / "rep11" / "moc_a.cxx").unlink()
+    assert T.render_SConscripts() == scan(src, ignore_files=()).render_SConscripts()
+
+
+def test_update_ignore_file(copy_src):
+    src = add_ignored(copy_src())
+    T = scan(src)
+    assert src / "vendor" in T.dir_content
+    (src / IGNORE_NAME).write_text("vendor/\n")
+    assert not is_output(T, src / IGNORE_NAME)
+    T.update([src / IGNORE_NAME])
+    assert src / "vendor" not in T.dir_content
+    assert src / "rep11" / "build" in T.dir_content
+    (src / "rep11" / IGNORE_NAME).write_text("build\n")
+    T.update([src / "rep11" / IGNORE_NAME])
+    assert src / "rep11" / "build" not in T.dir_content
+    (src / IGNORE_NAME).unlink()
+    T.update([src / IGNORE_NAME])
+    assert src / "vendor" in T.dir_content
+    assert src / "rep11" / "build" not in T.dir_content
+    assert T.render_SConscripts() == scan(src).render_SConscripts()
+
+
+def test_main_gitignore(copy_src):
+    src = add_ignored(copy_src())
+    (src / ".gitignore").write_text("vendor/\n")
+    assert main([str(src), "--no-cache"]) == 0
+    assert (src / "vendor" / "SConscript").exists()
+    (src / "vendor" / "SConscript").unlink()
+    assert main([str(src), "--no-cache", "--gitignore"]) == 0
+    assert not (src / "vendor" / "SConscript").exists()
@@ -0,0 +1,242 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from app.util.include import (
+    HeaderIndex,
+    include_graph,
+    include_name,
+    minimal_include_dirs,
+)
+from app.util.scan import SConsSettings, toscons
+
+
+def test_include_name():
+    assert include_name(b'"a.h"') == (b"a.h", False)
+    assert include_name(b" <sys/types.h> // comment") == (b"sys/types.h", True)
+    assert include_name(b"CONFIG_HEADER") is None
+
+
+def test_header_index():
+    src = Path("src")
+    index = HeaderIndex(
+        {
+            src / "a": [src / "a" / "a.h", src / "a" / "a.c"],
+            src / "b" / "sub": [src / "b" / "sub" / "a.h"],
+        }
+    )
+    assert index.resolve(b"a.h") == [src / "a", src / "b" / "sub"]
+    assert index.resolve(b"sub/a.h") == [src / "b"]
+    assert index.resolve(b"a.c") == []
+    assert index.resolve(b"stdio.h") == []
+    # the parent of src is not a directory of the tree
+    rooted = HeaderIndex({src / "inc": [src / "inc" / "a.h"]}, src)
+    assert rooted.resolve(b"inc/a.h") == [src]
+    assert rooted.resolve(b"src/inc/a.h") == []
+
+
+def test_include_above_tree(tmp_path):
+    src = tmp_path / "src"
+    (src / "inc").mkdir(parents=True)
+    (src / "app").mkdir()
+    (src / "inc" / "a.h").write_bytes(b"#define A\n")
+    (src / "app" / "m.c").write_bytes(b'#include "src/inc/a.h"\nint m(void);\n')
+    T = toscons(src, use_cache=False)
+    T.scan()
+    assert T.include_dirs == {src / "app": []}
+    T.write_in_SConscript()
+    assert "'app': []," in (src / "SConscript").read_text()
+
+
+def test_minimal_include_dirs():
+    src = Path("src")
+    index = HeaderIndex(
+        {
+            src / "a": [src / "a" / "a.h", src / "a" / "a.c"],
+            src / "b": [src / "b" / "b.h", src / "b" / "b.c"],
+            src / "c": [src / "c" / "c.h"],
+            src / "d": [src / "d" / "d.c"],
+        }
+    )
+    graph = include_graph(
+        [
+            (src / "a" / "a.c", [(b"a.h", False), (b"b.h", False)]),
+            (src / "b" / "b.h", [(b"c.h", True), (b"stdio.h", True)]),
+            (src / "b" / "b.c", [(b"b.h", True)]),
+            (src / "d" / "d.c", [(b"stdio.h", True)]),
+        ],
+        index,
+    )
+    assert graph == {src / "a": {src / "b"}, src / "b": {src / "b", src / "c"}}
+    res = minimal_include_dirs(graph, [src / "a", src / "b", src / "d"])
+    assert res == {
+        src / "a": [src / "b", src / "c"],
+        src / "b": [src / "b", src / "c"],
+        src / "d": [],
+    }
+
+
+def make_includes(tmp_path):
+    src = tmp_path / "src"
+    (src / "app").mkdir(parents=True)
+    (src / "lib").mkdir()
+    (src / "inc").mkdir()
+    (src / "app" / "main.cxx").write_bytes(
+        b'#include "lib.hxx"\n#include <vector>\nint main() {\n}\n'
+    )
+    (src / "lib" / "lib.hxx").write_bytes(b"#include <inc.hxx>\n")
+    (src / "lib" / "lib.cxx").write_bytes(b'#include "lib.hxx"\n')
+    (src / "inc" / "inc.hxx").write_bytes(b"#define INC\n")
+    return src
+
+
+@pytest.mark.parametrize("minimal_cpppath", [True, False])
+def test_toscons_includes(tmp_path, minimal_cpppath):
+    src = make_includes(tmp_path)
+    T = toscons(src, use_cache=False, minimal_cpppath=minimal_cpppath)
+    T.scan()
+    assert T.include_dirs == {
+        src / "app": [src / "inc", src / "lib"],
+        src / "lib": [src / "inc"],
+    }
+    T.write_in_SConscript()
+    content = (src / "SConscript").read_text()
+    assert ("'app': ['inc', 'lib']," in content) == minimal_cpppath
+    assert ("for sub_src in subdirs + include_only_dirs:" in content) != (
+        minimal_cpppath
+    )
+
+
+class FakeEnv:
+    """
+    records the calls a SConscript makes on its environment
+    """
+
+    def __init__(self, calls, cpppath=()):
+        self.calls = calls
+        self.cpppath = list(cpppath)
+
+    def __getitem__(self, key):
+        return "build"
+
+    def Clone(self):
+        self.calls.append("Clone")
+        return FakeEnv(self.calls, self.cpppath)
+
+    def AppendUnique(self, CPPPATH):
+        self.calls.append("AppendUnique")
+        self.cpppath += [p for p in CPPPATH if p not in self.cpppath]
+
+    def Decider(self, name):
+        self.calls.append(f"Decider {name}")
+
+
+def run_sconscript(src, content, objects=None):
+    """
+    CPPPATH given to each directory, targets returned and calls made by the
+    SConscript of src run the way scons does, from src
+    the SConscript of a directory returns its objects as given by objects,
+    one named after the directory by default
+    """
+    calls = []
+    res = {}
+
+    def SConscript(dirs, exports):
+        env = exports["env"] if isinstance(exports, dict) else namespace["env"]
+        res[dirs] = env.cpppath
+        return (objects or {}).get(dirs, [dirs + ".o"])
+
+    def Return(name, stop=True):
+        res["return"] = namespace[name]
+
+    namespace = {
+        "env": FakeEnv(calls),
+        "Import": lambda name: None,
+        "Dir": lambda path: path,
+        "SConscript": SConscript,
+        "Program": lambda name, objs: ("program", name, tuple(objs)),
+        "Library": lambda name, objs: ("library", name, tuple(objs)),
+        "Return": Return,
+        "CacheDir": lambda path: calls.append(f"CacheDir {path}"),
+        "SetOption": lambda name, value: calls.append(f"SetOption {name} {value}"),
+    }
+    cwd = os.getcwd()
+    os.chdir(src)
+    try:
+        exec(content, namespace)
+    finally:
+        os.chdir(cwd)
+    return res, calls
+
+
+@pytest.mark.parametrize("minimal_cpppath", [True, False])
+def test_precomputed_sconscript(tmp_path, minimal_cpppath):
+    src = make_includes(tmp_path)
+    (src / "tool").mkdir()
+    (src / "tool" / "tool.c").write_bytes(b"int tool(void) { return 0; }\n")
+    T = toscons(src, use_cache=False, minimal_cpppath=minimal_cpppath)
+    T.scan()
+    plain, plain_calls = run_sconscript(src, T.render_src())
+    T.scons = SConsSettings(
+        precomputed=True,
+        decider="MD5-timestamp",
+        implicit_cache=True,
+        max_drift=1,
+    )
+    content = T.render_src()
+    assert "resolve()" not in content
+    tuned, calls = run_sconscript(tmp_path, content)
+    # the same include paths, without depending on the current directory
+    assert {k: v for k, v in tuned.items() if k != "return"} == {
+        k: v for k, v in plain.items() if k != "return"
+    }
+    # every target instead of the last one, tool is not included from app
+    assert tuned["return"] == [
+        ("program", "app/main.cxx", ("app.o", "lib.o")),
+        ("library", "tool", ("tool.o",)),
+    ]
+    assert plain["return"] == tuned["return"][-1]
+    assert calls[:3] == [
+        "Decider MD5-timestamp",
+        "SetOption implicit_cache 1",
+        "SetOption max_drift 1",
+    ]
+    if minimal_cpppath:
+        # tool includes nothing and shares env
+        assert calls.count("Clone") == 2 < plain_calls.count("Clone")
+        assert calls.count("AppendUnique") == 3 < plain_calls.count("AppendUnique")
+    else:
+        assert calls.count("AppendUnique") == 1
+
+
+def test_precomputed_main_objects(tmp_path):
+    src = make_includes(tmp_path)
+    (src / "app" / "args.cxx").write_bytes(b"int args() { return 0; }\n")
+    (src / "app" / "other.cxx").write_bytes(b"int main() {\n}\n")
+    (src / "tool").mkdir()
+    (src / "tool" / "tool.c").write_bytes(b"int tool(void) { return 0; }\n")
+    T = toscons(src, use_cache=False)
+    T.scan()
+    T.scons = SConsSettings(precomputed=True)
+    objects = {
+        "app": ["args.o", "main.o", "other.o"],
+        "lib": ["lib.o"],
+        "tool": ["tool.o"],
+    }
+    res, _ = run_sconscript(src, T.render_src(), objects)
+    # the other program and directories not included from are left out
+    assert res["return"] == [
+        ("program", "app/main.cxx", ("args.o", "main.o", "lib.o")),
+        ("program", "app/other.cxx", ("args.o", "other.o", "lib.o")),
+        ("library", "tool", ("tool.o",)),
+    ]
+
+
+def test_sconscript_settings_quoted(tmp_path):
+    src = make_includes(tmp_path)
+    T = toscons(src, use_cache=False)
+    T.scan()
+    T.scons = SConsSettings(decider="it's", cache_dir=r"C:\new\tmp")
+    _, calls = run_sconscript(src, T.render_src())
+    assert calls[:2] == ["Decider it's", r"CacheDir C:\new\tmp"]
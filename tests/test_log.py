@@ -0,0 +1,66 @@
+import io
+import logging
+from pathlib import Path
+
+from app.core import log_config
+from app.util.scan import MAX_WARNED_FILES, toscons
+
+
+def make_src(tmp_path: Path, nfiles: int) -> Path:
+    src = tmp_path / "src"
+    (src / "rep").mkdir(parents=True)
+    for i in range(nfiles):
+        (src / "rep" / f"f{i:02}.c").write_text("#foo\n" * (i + 1))
+    return src
+
+
+def test_warnings_per_line(tmp_path, caplog):
+    src = make_src(tmp_path, 3)
+    toscons(src, use_cache=False).scan()
+    warnings = [r for r in caplog.records if r.levelno == logging.WARNING]
+    assert len(warnings) == 2 * (1 + 2 + 3)
+
+
+def test_warnings_aggregated(tmp_path, caplog):
+    src = make_src(tmp_path, MAX_WARNED_FILES + 2)
+    T = toscons(src, use_cache=False, aggregate_warnings=True)
+    T.scan()
+    warnings = [r.getMessage() for r in caplog.records if r.levelno == logging.WARNING]
+    nfiles = MAX_WARNED_FILES + 2
+    total = 2 * sum(range(1, nfiles + 1))
+    assert warnings[0] == f"{total} warnings in {nfiles} files"
+    assert warnings[1] == f"{2 * nfiles} warnings in 'rep/f{nfiles - 1:02}.c'"
+    assert warnings[-1] == "and 2 more files"
+    assert len(warnings) == MAX_WARNED_FILES + 2
+
+
+def test_summaries_skipped_when_quiet(tmp_path, caplog, monkeypatch):
+    src = make_src(tmp_path, 1)
+    caplog.set_level(logging.WARNING, logger="app")
+    calls = []
+    monkeypatch.setattr("app.util.scan.textwrap.fill", lambda s: calls.append(s))
+    T = toscons(src, use_cache=False, aggregate_warnings=True)
+    T.scan()
+    assert calls == []
+    assert T.c_dir_name == ["rep"]
+
+
+def test_queue_listener(monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setattr(log_config.ch, "stream", stream)
+    # importing the module starts no thread, records are written at once
+    assert log_config.listener._thread is None
+    logging.getLogger("app.test").warning("direct")
+    assert "direct" in stream.getvalue()
+    log_config.start_listener()
+    log_config.set_quiet()
+    try:
+        logging.getLogger("app.test").info("hidden")
+        logging.getLogger("app.test").warning("shown %s", "late")
+    finally:
+        log_config.set_quiet(False)
+        # stop writes the records still queued
+        log_config.stop_listener()
+    assert log_config.listener._thread is None
+    assert "shown late" in stream.getvalue()
+    assert "hidden" not in stream.getvalue()
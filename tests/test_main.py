@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+from typing import List
+
+import pytest
+
+import app.util.scan
+from app.main import main, parse_args
+from app.util.cache import CACHE_NAME
+
+
+def make_roots(copy_src) -> List[Path]:
+    return [copy_src(repo, repo) for repo in ["repo1", "repo2"]]
+
+
+def test_parse_args_manifest(tmp_path):
+    (tmp_path / "list.txt").write_text("# roots\na/src\n\n/abs/src  # comment\n")
+    args = parse_args(["x", "--manifest", str(tmp_path / "list.txt")])
+    assert args.src_path == [Path("x"), tmp_path / "a" / "src", Path("/abs/src")]
+    with pytest.raises(SystemExit):
+        parse_args([])
+    with pytest.raises(SystemExit):
+        parse_args(["a", "b", "--watch"])
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_main_batch(tmp_path, copy_src, jobs):
+    roots = make_roots(copy_src)
+    cache_file = tmp_path / "shared.cache"
+    stats_file = tmp_path / "stats.json"
+    argv = [str(roots[0]), str(roots[1]), "-j", str(jobs), "--threads"]
+    argv += ["--cache-file", str(cache_file), "--stats", str(stats_file)]
+    assert main(argv) == 0
+    for root in roots:
+        assert (root / "SConscript").exists()
+        assert not (root / CACHE_NAME).exists()
+    assert cache_file.exists()
+    data = json.loads(stats_file.read_text())
+    assert set(data["roots"]) == set(map(str, roots))
+    assert data["sconscripts_written"] == len(roots) + sum(
+        len(list(root.rglob("*/SConscript"))) for root in roots
+    )
+    assert data["files_opened"] == sum(
+        r["files_opened"] for r in data["roots"].values()
+    )
+
+
+def test_main_template_env_lazy(tmp_path, copy_src, monkeypatch):
+    roots = make_roots(copy_src)
+    made = []
+    template_env = app.util.scan.template_env
+
+    def counted():
+        made.append(1)
+        return template_env()
+
+    monkeypatch.setattr("app.util.scan.template_env", counted)
+    part = tmp_path / "part.msgpack"
+    argv = [str(roots[1]), "--no-cache", "--shard", "0/1", "--export-index"]
+    assert main(argv + [str(part)]) == 0
+    assert made == []
+    assert main([str(roots[0]), str(roots[1]), "--no-cache"]) == 0
+    assert made == [1]
+
+
+def test_main_missing_root(tmp_path, copy_src):
+    roots = make_roots(copy_src)
+    (tmp_path / "list.txt").write_text("repo2\nmissing\n")
+    assert main([str(roots[0]), "--manifest", str(tmp_path / "list.txt")]) == 1
+    assert (roots[0] / "SConscript").exists()
+    assert (roots[1] / "SConscript").exists()
+
+
+def test_main_tuned_sconscript(copy_src):
+    root = make_roots(copy_src)[1]
+    argv = [str(root), "--no-cache", "--precompute-paths", "--decider"]
+    argv += ["MD5-timestamp", "--scons-cache-dir", "/tmp/scons-cache"]
+    argv += ["--implicit-cache", "--max-drift", "1"]
+    assert main(argv) == 0
+    content = (root / "SConscript").read_text()
+    assert "env.Decider('MD5-timestamp')" in content
+    assert "CacheDir('/tmp/scons-cache')" in content
+    assert "SetOption('implicit_cache', 1)" in content
+    assert "SetOption('max_drift', 1)" in content
+    assert "Path(" not in content
@@ -0,0 +1,121 @@
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from app.main import main
+from app.util.pack import packb, unpackb
+from app.util.project import (
+    dump_analysis,
+    export_index,
+    load_analysis,
+    load_index,
+    read_index,
+    write_index,
+)
+from app.util.scan import toscons
+
+
+def add_cond(src: Path) -> Path:
+    # non utf-8 names and conditions survive the round trip
+    (src / "rep11" / "cond.cxx").write_bytes(
+        b"#if defined(A\xe9) && LEVEL > 2\nint f() { return 0; }\n#endif\n"
+    )
+    return src
+
+
+def assert_same_model(T: toscons, L: toscons) -> None:
+    assert dict(L.dir_content) == dict(T.dir_content)
+    assert L.dir_dir == T.dir_dir
+    assert list(L.file_table.listed()) == list(T.file_table.listed())
+    assert L.file_table.suffix_counts() == T.file_table.suffix_counts()
+    assert L.file_analysis == T.file_analysis
+    assert L.file_flags == T.file_flags
+    assert L.main_pathes == T.main_pathes
+    assert L.undefined_tested_kword == T.undefined_tested_kword
+    assert L.include_dirs == T.include_dirs
+    assert L.lib_pathes == T.lib_pathes
+    assert L.render_SConscripts() == T.render_SConscripts()
+
+
+@pytest.mark.parametrize("name", ["index.json", "index.msgpack"])
+def test_index_round_trip(tmp_path, name, copy_src):
+    src = add_cond(copy_src())
+    T = toscons(src, use_cache=False)
+    T.scan()
+    data = export_index(T)
+    # the index only holds json types
+    assert json.loads(json.dumps(data)) == data
+    write_index(data, tmp_path / name)
+    assert read_index(tmp_path / name) == data
+    L = toscons(src, use_cache=False)
+    load_index(L, read_index(tmp_path / name))
+    assert L.stats.dirs_listed == L.stats.files_opened == 0
+    assert_same_model(T, L)
+
+
+def test_index_moved_tree(tmp_path, copy_src):
+    src = add_cond(copy_src())
+    T = toscons(src, use_cache=False)
+    T.scan()
+    data = export_index(T)
+    moved = tmp_path / "moved"
+    shutil.move(str(src), moved)
+    L = toscons(moved, use_cache=False)
+    load_index(L, data)
+    M = toscons(moved, use_cache=False)
+    M.scan()
+    assert_same_model(M, L)
+
+
+def test_index_errors(tmp_path, copy_src):
+    src = add_cond(copy_src())
+    with pytest.raises(ValueError):
+        load_index(toscons(src, use_cache=False), {"magic": "other"})
+    (tmp_path / "bad.msgpack").write_bytes(b"\x82\xa1a")
+    with pytest.raises(ValueError):
+        read_index(tmp_path / "bad.msgpack")
+
+
+def test_analysis_round_trip(copy_src):
+    src = add_cond(copy_src())
+    T = toscons(src, use_cache=False)
+    T.scan()
+    for res in T.file_analysis.values():
+        assert load_analysis(unpackb(packb(dump_analysis(res)))) == res
+    data = dump_analysis(T.file_analysis[src / "rep11" / "cond.cxx"])
+    for bad in (
+        dict(data, guards=[["rm", 1]]),
+        dict(data, guards=[["!", 1, 2]]),
+        dict(data, mains=[["1", "main"]]),
+        dict(data, defines="A"),
+        {"defines": []},
+        [],
+    ):
+        with pytest.raises(ValueError):
+            load_analysis(bad)
+
+
+def test_pack():
+    obj = {
+        "a": [0, 127, 300, 1 << 40, -1, -1000, None, True, False],
+        "s": ["x" * 40, "y" * 300, "\udce9"],
+        "b": b"\0\1",
+        "m": {str(i): list(range(i)) for i in range(20)},
+    }
+    assert unpackb(packb(obj)) == obj
+    with pytest.raises(ValueError):
+        unpackb(packb(obj) + b"\0")
+
+
+def test_main_index(tmp_path, copy_src):
+    src = add_cond(copy_src())
+    index = tmp_path / "index.msgpack"
+    assert main([str(src), "--no-cache", "--export-index", str(index)]) == 0
+    sconscript = (src / "SConscript").read_text()
+    (src / "SConscript").unlink()
+    assert main([str(src), "--no-cache", "--from-index", str(index)]) == 0
+    assert (src / "SConscript").read_text() == sconscript
+    index.write_bytes(b"{}")
+    assert main([str(src), "--no-cache", "--from-index", str(index)]) == 1
@@ -0,0 +1,87 @@
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict
+
+import pytest
+
+from app.bench.synthetic import TreeSpec, generate
+from app.main import main
+from app.util.project import export_index, load_index, merge_indexes
+from app.util.scan import toscons
+from app.util.tree import shard_of
+
+
+def make_synthetic(tmp_path: Path) -> Path:
+    spec = TreeSpec(dirs=12, files=3, lines=40, depth=3, outliers=0, mains=0.2)
+    return generate(tmp_path, spec)
+
+
+def sconscripts(src: Path) -> Dict[str, str]:
+    return {str(p.relative_to(src)): p.read_text() for p in src.rglob("SConscript")}
+
+
+def test_shard_of_stable():
+    assert [shard_of(f"dir{i}", 3) for i in range(8)] == [
+        shard_of(f"dir{i}", 3) for i in range(8)
+    ]
+    assert {shard_of(f"dir{i}", 3) for i in range(30)} == {0, 1, 2}
+
+
+@pytest.mark.parametrize("name", ["repo2", "synthetic"])
+def test_merge_same_as_scan(tmp_path, name, copy_src):
+    src = copy_src() if name == "repo2" else make_synthetic(tmp_path)
+    T = toscons(src, use_cache=False)
+    T.scan()
+    parts = []
+    for k in range(3):
+        S = toscons(src, use_cache=False, shard=(k, 3))
+        S.scan()
+        parts.append(export_index(S))
+    M = toscons(src, use_cache=False)
+    load_index(M, merge_indexes(parts[::-1]))
+    assert M.main_pathes == T.main_pathes
+    assert M.undefined_tested_kword == T.undefined_tested_kword
+    assert M.lib_pathes == T.lib_pathes
+    assert M.include_dirs == T.include_dirs
+    assert M.render_SConscripts() == T.render_SConscripts()
+
+
+def test_merge_errors(copy_src):
+    src = copy_src()
+    parts = []
+    for k in range(2):
+        S = toscons(src, use_cache=False, shard=(k, 2))
+        S.scan()
+        parts.append(export_index(S))
+    with pytest.raises(ValueError):
+        merge_indexes(parts[:1])
+    with pytest.raises(ValueError):
+        merge_indexes([parts[0], parts[0]])
+    T = toscons(src, use_cache=False)
+    T.scan()
+    with pytest.raises(ValueError):
+        merge_indexes(parts + [export_index(T)])
+
+
+def test_main_shards_in_processes(tmp_path):
+    src = make_synthetic(tmp_path)
+    assert main([str(src), "--no-cache"]) == 0
+    expected = sconscripts(src)
+    for p in src.rglob("SConscript"):
+        p.unlink()
+    parts = [str(tmp_path / f"part{k}.msgpack") for k in range(3)]
+    procs = [
+        subprocess.Popen(
+            [sys.executable, "-m", "app.main", str(src), "--no-cache", "-q"]
+            + ["--shard", f"{k}/3", "--export-index", parts[k]],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        for k in range(3)
+    ]
+    assert [proc.wait() for proc in procs] == [0, 0, 0]
+    assert sconscripts(src) == {}
+    assert main([str(src), "--no-cache", "--merge"] + parts) == 0
+    assert sconscripts(src) == expected
+    assert main([str(src), "--no-cache", "--merge"] + parts[1:]) == 1
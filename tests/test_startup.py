@@ -0,0 +1,50 @@
+import subprocess
+import sys
+
+from app.bench.startup import run
+from app.util.scan import template_cache_dir, template_env, toscons
+
+
+def test_scan_without_jinja(tmp_path):
+    code = (
+        "import sys\nfrom pathlib import Path\nimport app.util.scan\n"
+        "app.util.scan.toscons(Path(sys.argv[1]), use_cache=False).scan()\n"
+        "print('jinja2' in sys.modules, 'multiprocessing' in sys.modules)\n"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code, str(tmp_path)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    assert out.split() == ["False", "False"]
+
+
+def test_template_bytecode_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("TOSCONS_TEMPLATE_CACHE", str(tmp_path / "cache"))
+    (tmp_path / "src").mkdir()
+    T = toscons(tmp_path / "src", use_cache=False)
+    T.scan()
+    T.render_SConscripts()
+    # both templates are compiled once
+    assert len(list((tmp_path / "cache").iterdir())) == 2
+    # a new environment loads the compiled template
+    env = template_env()
+    assert env.bytecode_cache is not None
+    assert env.get_template("SConscript_src.template").render(datas=T) == (
+        T.render_SConscripts()[tmp_path / "src" / "SConscript"]
+    )
+
+
+def test_template_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("TOSCONS_TEMPLATE_CACHE", "")
+    assert template_cache_dir() is None
+    monkeypatch.delenv("TOSCONS_TEMPLATE_CACHE")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "xdg"))
+    assert template_cache_dir() == tmp_path / "xdg" / "toscons"
+
+
+def test_startup_run(tmp_path):
+    res = run(tmp_path, repeat=1)
+    assert set(res) == {"import", "render_cold", "render_warm", "process"}
+    assert all(r.seconds > 0 for r in res.values())
@@ -0,0 +1,89 @@
+import json
+import os
+import pstats
+import subprocess
+import sys
+
+from app.util.scan import toscons
+from app.util.stats import RunStats
+
+
+def test_stats_counters(copy_src):
+    src = copy_src()
+    T = toscons(src, use_cache=False)
+    T.scan()
+    T.write_in_SConscript()
+    T.write_in_SConscript()
+    stats = T.stats
+    assert stats.dirs_listed == 4
+    assert stats.files_opened == len(T.file_analysis)
+    assert stats.cache_misses == stats.files_opened
+    assert stats.cache_hits == 0
+    assert stats.bytes_read == sum(p.stat().st_size for p in T.file_analysis)
+    assert stats.directives_parsed > 0
+    # the SConscript of src and the ones of rep11 and rep30
+    assert stats.sconscripts_written == 3
+    assert stats.sconscripts_skipped == 3
+    assert set(stats.phases) >= {
+        "scan_dir_and_file",
+        "search_c_cxx_file",
+        "analyse_files",
+        "scan_macros",
+        "scan_and_search_main",
+        "classify_dirs",
+        "search_includes",
+        "write_in_SConscript",
+    }
+    # analyse_files runs within the first phase needing its results
+    assert stats.phases["scan_macros"].wall >= stats.phases["analyse_files"].wall
+
+
+def test_stats_cache_hits(copy_src):
+    src = copy_src()
+    for p in [src] + list(src.rglob("*")):
+        os.utime(p, ns=(0, 10 ** 18))
+    T = toscons(src)
+    T.scan()
+    T2 = toscons(src)
+    T2.scan()
+    assert T2.stats.cache_hits == T.stats.cache_misses
+    assert T2.stats.cache_misses == T2.stats.files_opened == 0
+
+
+def test_stats_dump(tmp_path):
+    stats = RunStats()
+    with stats.phase("a"):
+        stats.bytes_read += 3
+    with stats.phase("a"):
+        pass
+    stats.dump(tmp_path / "stats.json")
+    data = json.loads((tmp_path / "stats.json").read_text())
+    assert data["bytes_read"] == 3
+    assert set(data["phases"]["a"]) == {"wall", "cpu"}
+    assert set(data) == set(RunStats.COUNTERS) | {"phases"}
+    stats.dump(tmp_path / "stats.json", {"src": stats})
+    data = json.loads((tmp_path / "stats.json").read_text())
+    assert data["roots"]["src"]["bytes_read"] == 3
+
+
+def test_main_stats_and_profile(tmp_path, copy_src):
+    src = copy_src()
+    subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "app.main",
+            str(src),
+            "--no-cache",
+            "--stats",
+            str(tmp_path / "stats.json"),
+            "--profile",
+            str(tmp_path / "run.pstats"),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    data = json.loads((tmp_path / "stats.json").read_text())
+    assert data["sconscripts_written"] == 3
+    assert "scan_macros" in data["phases"]
+    assert pstats.Stats(str(tmp_path / "run.pstats")).total_calls > 0
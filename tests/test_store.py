@@ -0,0 +1,131 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from app.main import main
+from app.util.pack import packb
+from app.util.scan import toscons
+from app.util.store import ResultStore
+
+
+def scan(src: Path, store=None) -> toscons:
+    T = toscons(src, use_cache=False, store=store)
+    T.scan()
+    return T
+
+
+def test_store_shared_by_trees(tmp_path, copy_src):
+    store = ResultStore(tmp_path / "store")
+    src1 = copy_src("src1")
+    src2 = copy_src("src2")
+    (src2 / "rep11" / "extra.cxx").write_text("int extra() { return 1; }\n")
+    T1 = scan(src1, store)
+    # files of the same content in a tree are analysed once too
+    assert T1.stats.store_hits < T1.stats.files_opened
+    T2 = scan(src2, store)
+    # only the file not in the first tree is analysed
+    assert T2.stats.store_hits == T2.stats.files_opened - 1
+    assert T2.stats.directives_parsed == 0
+    W = scan(src2)
+    assert T2.file_analysis == W.file_analysis
+    assert T2.main_pathes == W.main_pathes
+    assert T2.render_SConscripts() == W.render_SConscripts()
+
+
+def test_store_warnings_path(tmp_path):
+    store = ResultStore(tmp_path / "store")
+    buf = b"#pragma once\n#weird directive\nint a;\n"
+    for name in ("src1", "src2"):
+        (tmp_path / name / "lib").mkdir(parents=True)
+        (tmp_path / name / "lib" / "a.c").write_bytes(buf)
+    T1 = scan(tmp_path / "src1", store)
+    T2 = scan(tmp_path / "src2", store)
+    assert T2.stats.store_hits == 1
+    warnings = T2.file_analysis[tmp_path / "src2" / "lib" / "a.c"].warnings
+    assert warnings == scan(tmp_path / "src2").file_analysis[
+        tmp_path / "src2" / "lib" / "a.c"
+    ].warnings
+    assert str(tmp_path / "src1") not in "".join(warnings)
+    assert T1.file_analysis != T2.file_analysis
+
+
+def test_store_flags_and_corrupt_entry(tmp_path):
+    store = ResultStore(tmp_path / "store")
+    assert store.key(b"int a;", (True, True)) != store.key(b"int a;", (True, False))
+    key = store.key(b"int a;", (True, True))
+    store.put(key, "result")
+    assert store.get(key) == "result"
+    store._path(key).write_bytes(b"not msgpack")
+    assert store.get(key) is None
+    assert not store._path(key).exists()
+
+
+class Payload:
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __reduce__(self):
+        # unpickling this creates path
+        return (open, (self.path, "w"))
+
+
+def test_store_entries_are_data_only(tmp_path, copy_src):
+    store = ResultStore(tmp_path / "store")
+    src = copy_src()
+    T = scan(src, store)
+    keys = list((tmp_path / "store").glob("*/*"))
+    assert keys
+    marker = tmp_path / "run"
+    # an entry anyone wrote in the shared store is never unpickled
+    keys[0].write_bytes(pickle.dumps(Payload(str(marker))))
+    for path in keys[1:]:
+        # and one of another layout is a miss, not a crash
+        path.write_bytes(packb(["name", {"guards": [["rm"]]}]))
+    T2 = scan(src, store)
+    assert not marker.exists()
+    # every content is analysed again once, as in the first scan
+    assert T2.stats.store_hits == T.stats.store_hits
+    assert T2.main_pathes == T.main_pathes
+    assert T2.render_SConscripts() == T.render_SConscripts()
+
+
+def test_store_trim_lru(tmp_path):
+    store = ResultStore(tmp_path / "store", max_bytes=0)
+    keys = [store.key(bytes([i]), None) for i in range(10)]
+    for i, key in enumerate(keys):
+        store.put(key, bytes(100))
+        os.utime(store._path(key), ns=(i * 10 ** 9, i * 10 ** 9))
+    size = store._path(keys[0]).stat().st_size
+    # the oldest entry is used again
+    assert store.get(keys[0]) is not None
+    store.max_bytes = 5 * size
+    assert store.trim() == 6
+    kept = [key for key in keys if store._path(key).exists()]
+    assert kept == [keys[0]] + keys[7:]
+    assert store.trim() == 0
+
+
+def scan_copy(args):
+    src, store_dir = args
+    T = scan(src, ResultStore(store_dir, max_bytes=4096))
+    T.store.trim()
+    return T.main_pathes, T.undefined_tested_kword
+
+
+def test_store_concurrent_processes(tmp_path, copy_src):
+    srcs = [copy_src(f"src{i}") for i in range(6)]
+    expected = scan_copy((copy_src("ref"), tmp_path / "other"))
+    # a small store is trimmed by some processes while others use it
+    with ProcessPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(scan_copy, [(src, tmp_path / "store") for src in srcs]))
+    assert results == [expected] * len(srcs)
+
+
+def test_main_store(tmp_path, copy_src):
+    src1 = copy_src("src1")
+    src2 = copy_src("src2")
+    store = tmp_path / "store"
+    argv = ["--no-cache", "--store", str(store), "--store-size", "1"]
+    assert main([str(src1), str(src2)] + argv) == 0
+    assert any(store.iterdir())
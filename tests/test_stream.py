@@ -0,0 +1,78 @@
+from pathlib import Path
+
+from app.bench.synthetic import TreeSpec, generate
+from app.util.scan import toscons
+
+
+def scanned(src: Path, **kwargs) -> toscons:
+    T = toscons(src, use_cache=False, **kwargs)
+    T.scan()
+    return T
+
+
+def streamed(src: Path, **kwargs):
+    T = toscons(src, use_cache=False, **kwargs)
+    rendered = {}
+    records = []
+    for record in T.iter_directories():
+        if record.kind != "header":
+            rendered[record.path / "SConscript"] = T.render_dir(record.path)
+        records.append(record)
+    rendered[src / "SConscript"] = T.render_src()
+    return T, records, rendered
+
+
+def assert_same_results(T1: toscons, T2: toscons, rendered) -> None:
+    assert T2.undefined_tested_kword == T1.undefined_tested_kword
+    assert T2.main_pathes == T1.main_pathes
+    assert T2.program_dirs == T1.program_dirs
+    assert T2.lib_pathes == T1.lib_pathes
+    assert T2.include_graph == T1.include_graph
+    assert T2.include_dirs == T1.include_dirs
+    assert rendered == T1.render_SConscripts()
+
+
+def test_iter_directories_matches_scan(copy_src):
+    src = copy_src()
+    T1 = scanned(src)
+    T2, records, rendered = streamed(src)
+    assert_same_results(T1, T2, rendered)
+    assert [r.path for r in records] == sorted(
+        set(T1.cxx_dir) | set(T1.c_dir) | set(T1.hxx_only_dir)
+    )
+    for record in records:
+        assert record.analysis == {
+            f: res for f, res in T1.file_analysis.items() if f.parent == record.path
+        }
+    # file results are not kept once yielded
+    assert T2.file_analysis == {}
+
+
+def test_iter_directories_jobs(tmp_path):
+    spec = TreeSpec(dirs=12, files=4, lines=30, depth=2, outliers=1, mains=0.3)
+    src = generate(tmp_path, spec)
+    T1 = scanned(src)
+    T2, records, rendered = streamed(src, jobs=2, threads=True)
+    assert_same_results(T1, T2, rendered)
+    assert T2.pool is None
+    roles = {r.path: r.role for r in records}
+    assert [p for p, role in sorted(roles.items()) if role == "program"] == (
+        T1.program_dirs
+    )
+    assert [p for p, role in sorted(roles.items()) if role == "library"] == (
+        T1.library_dirs
+    )
+
+
+def test_iter_directories_is_lazy(tmp_path):
+    spec = TreeSpec(dirs=6, files=3, lines=20, depth=1, outliers=0, mains=0.5)
+    src = generate(tmp_path, spec)
+    T = toscons(src, use_cache=False)
+    it = T.iter_directories()
+    first = next(it)
+    # only the first directory was read
+    assert T.stats.files_opened == len(first.analysis)
+    assert T.include_dirs == {}
+    rest = list(it)
+    assert T.stats.files_opened == sum(len(r.analysis) for r in [first] + rest)
+    assert "iter_directories" in T.stats.phases
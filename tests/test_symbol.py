@@ -0,0 +1,64 @@
+from app.util.scan import analyse_source, toscons
+from app.util.symbol import defined_functions
+
+
+def names(buf):
+    return [(d.name, d.static) for d in defined_functions(buf)]
+
+
+def test_defined_functions():
+    assert names(b"int f(int a) { if (a) { return 1; } return g(a); }") == [
+        (b"f", False)
+    ]
+    assert names(b"static int s(void) {}\nstatic\nint s2() {}\nint l(char *p) {}") == [
+        (b"s", True),
+        (b"s2", True),
+        (b"l", False),
+    ]
+    # declarations, calls and data are not definitions
+    assert names(b"int x = f(1);\nint a[] = { g(2) };\nint d(int);\nvoid h() {}") == [
+        (b"h", False)
+    ]
+
+
+def test_defined_functions_skip_comments_and_literals():
+    buf = (
+        b"// int no() {}\n/* int no2() { */\n#define X(a) { a }\n"
+        b'int f(void) { const char *s = "}{"; return \'}\'; }\n'
+        b"int g() {}\n"
+    )
+    assert names(buf) == [(b"f", False), (b"g", False)]
+
+
+def test_defined_functions_cxx():
+    buf = (
+        b'extern "C" {\nint c_api(void) {}\n}\n'
+        b"namespace n {\nclass A {\n  A() : x(1), y(f(2)) {}\n"
+        b"  int get() const { return x; }\n};\n}\nvoid n::A::m() {}\n"
+    )
+    assert [name for name, _ in names(buf)] == [b"c_api", b"A", b"get", b"m"]
+
+
+def test_analyse_source_symbols(tmp_path):
+    fsource = tmp_path / "src.c"
+    fsource.write_bytes(
+        b"#ifdef X\nstatic int helper(void) { return 0; }\n#endif\n"
+        b"/* int main() {} */\nint api(int a) { return helper(); }\n"
+        b"int main() {\n  return api(1);\n}\n"
+    )
+    res = analyse_source(fsource)
+    assert res.symbols == [b"api", b"main"]
+    assert res.mains == [(6, b"int main() {")]
+    assert analyse_source(fsource, main=False).symbols == []
+
+
+def test_classify_dirs(copy_src):
+    src = copy_src()
+    T = toscons(src, use_cache=False)
+    T.scan()
+    assert T.program_dirs == [src / "rep30"]
+    # rep11 defines toto and no main
+    assert T.library_dirs == [src / "rep11"]
+    assert T.lib_pathes == [("rep11", "rep11")]
+    content = T.render_SConscripts()[src / "SConscript"]
+    assert "L = Library('rep11', dir_objs['rep11'])" in content
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+import pytest
+
+from app.util.include import HeaderIndex
+from app.util.tree import DirContentView, DirSuffixesView, FileTable, name_suffix
+
+
+@pytest.mark.parametrize(
+    "name", ["a.c", "a.tar.gz", "a", ".a", ".a.h", "a.", "a..b", "a.C++", "..x.y"]
+)
+def test_name_suffix(name):
+    assert name_suffix(name) == "".join(Path(name).suffixes)
+
+
+def test_file_table_views():
+    src = Path("src")
+    table = FileTable()
+    table.add_dir(src / "a", ["a.c", "a.h", "b.h"])
+    table.add_dir(src / "empty", [])
+    table.add_dir(src / "b", ["b.cpp"])
+    content = DirContentView(table)
+    assert list(content) == [src / "a", src / "empty", src / "b"]
+    a = src / "a"
+    assert content[a] == [a / "a.c", a / "a.h", a / "b.h"]
+    assert content[src / "empty"] == []
+    assert src / "c" not in content and "src/a" not in content
+    with pytest.raises(KeyError):
+        content[src / "c"]
+    suffixes = DirSuffixesView(table)
+    assert list(suffixes) == [src / "a", src / "b"]
+    assert suffixes[src / "a"] == {
+        ".c": [src / "a" / "a.c"],
+        ".h": [src / "a" / "a.h", src / "a" / "b.h"],
+    }
+    assert src / "empty" not in suffixes
+    assert table.suffix_counts() == {".c": 1, ".h": 2, ".cpp": 1}
+    # names and suffixes are interned
+    table.add_dir(src / "c", ["a" + ".h"])
+    assert table.names_of(src / "c")[0] is table.names_of(src / "a")[1]
+    assert len(table.suffixes) == 3
+
+
+def test_file_table_relist_and_compact():
+    src = Path("src")
+    table = FileTable()
+    table.add_dir(src / "a", ["a.c", "a.h"])
+    table.add_dir(src / "b", ["b.c"])
+    table.add_dir(src / "a", ["a.c"])
+    # more than half of the rows were unused, the table was compacted
+    assert table.names == ["b.c", "a.c"] and table.unused == 0
+    assert table.names_of(src / "a") == ["a.c"]
+    assert list(table.listed()) == [src / "b", src / "a"]
+    table.remove_dir(src / "b")
+    assert table.unused == 1 and sum(table.suffix_counts().values()) == 1
+    assert table.names_of(src / "a") == ["a.c"]
+    table.remove_dir(src / "b")
+    assert sum(table.suffix_counts().values()) == 1
+
+
+def test_header_index_from_names():
+    src = Path("src")
+    index = HeaderIndex.from_names(
+        [(src / "a", ["a.h", "a.c"]), (src / "b" / "sub", ["a.h", ".h"])]
+    )
+    assert index.resolve(b"a.h") == [src / "a", src / "b" / "sub"]
+    assert index.resolve(b"a.c") == []
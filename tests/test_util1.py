@@ -1,13 +1,11 @@
 import logging
-import shutil
-import tempfile
 from itertools import product
 from pathlib import Path
 from typing import Dict, List
 
 import pytest
 
-from app.util.scan import search_defined_in_if, toscons
+from app.util.scan import analyse_source, search_defined_in_if, toscons
 
 
 def test_search_defined():
@@ -55,26 +53,6 @@ def test_search_define3(caplog):
     ]
 
 
-@pytest.fixture
-def create_repo(request):
-    """
-    request allow to retrive markers applied to a test function
-    i.e. introspection
-    """
-    dir_name = tempfile.mkdtemp()
-    #   src_test_dir = Path("tests") / Path("data") / Path("repo1")
-    src_test_dir = request.node.get_closest_marker("src_test_dir").args[0]
-    if src_test_dir is None:
-        shutil.rmtree(dir_name)
-        assert 0
-    else:
-        try:
-            dst_name = Path(shutil.copytree(src_test_dir, dir_name, dirs_exist_ok=True))
-            yield Path(dir_name)
-        finally:
-            shutil.rmtree(dir_name)
-
-
 def assert_dir_content(
     dir_repo: Path, T: toscons, repo_content: Dict[str, List[str]]
 ) -> None:
@@ -108,15 +86,7 @@ def test_toscons1(create_repo, caplog):
     T = toscons(create_repo / Path("src"))
     # test
     T.scan()
-    assert caplog.record_tuples == [
-        (
-            "app.util.scan",
-            logging.WARNING,
-            "directory {} contains 1 nested directory".format(
-                create_repo / Path("src") / Path("rep11")
-            ),
-        )
-    ]
+    assert caplog.record_tuples == []
     # test dir_dir
     assert len(T.dir_dir.keys()) == 1
     res = list(T.dir_dir.items())
@@ -132,6 +102,7 @@ def test_toscons1(create_repo, caplog):
         "rep11": ["src_11_{}.{}xx".format(n, m) for n, m in product("12", "ch")],
         "rep30": ["src_30_4.lxx",]
         + ["src_30_{}.{}xx".format(n, m) for n, m in product("123", "ch")],
+        "rep11/rep11_1": [],
     }
     assert_dir_content(create_repo, T, repo_content)
     # test dir_suffixes
@@ -268,14 +239,77 @@ def test_toscons3(create_repo, caplog):
     caplog.set_level(logging.WARNING)
     T = toscons(create_repo / Path("src"))
     T.scan()
-    assert caplog.record_tuples == [
-        (
-            "app.util.scan",
-            logging.WARNING,
-            "directory {} contains 1 nested directory".format(
-                create_repo / Path("src") / Path("rep11")
-            ),
-        )
-    ]
+    assert caplog.record_tuples == []
     # test
     T.write_in_SConscript()
+
+
+def test_analyse_source(tmp_path):
+    fsource = tmp_path / "src.cxx"
+    fsource.write_bytes(
+        b"#define toto 1\n#ifdef titi\n#if defined(tutu)\n#endif\n#endif\n"
+        b"int main() {\n  return 0;\n}\n"
+    )
+    res = analyse_source(fsource)
+    assert res.defines == [b"toto"]
+    assert res.tested == [b"titi", b"tutu"]
+    assert res.mains == [(6, b"int main() {")]
+    res = analyse_source(fsource, macros=False)
+    assert res.defines == [] and res.tested == []
+    assert res.mains == [(6, b"int main() {")]
+    res = analyse_source(fsource, main=False)
+    assert res.mains == []
+
+
+@pytest.mark.src_test_dir(Path("tests") / Path("data") / Path("repo2"))
+@pytest.mark.parametrize("threads", [False, True])
+def test_toscons_jobs(create_repo, caplog, threads):
+    caplog.set_level(logging.INFO)
+    T = toscons(create_repo / Path("src"), use_cache=False)
+    T.scan()
+    serial_records = caplog.record_tuples
+    caplog.clear()
+    T2 = toscons(create_repo / Path("src"), jobs=3, threads=threads, use_cache=False)
+    T2.scan()
+    assert caplog.record_tuples == serial_records
+    assert T2.main_pathes == T.main_pathes
+    assert T2.all_define == T.all_define
+    assert T2.tested_define == T.tested_define
+
+
+@pytest.mark.parametrize("threshold", [0, 1 << 16])
+def test_analyse_source_mmap(tmp_path, monkeypatch, threshold):
+    monkeypatch.setattr("app.util.scan.MMAP_THRESHOLD", threshold)
+    monkeypatch.setattr("app.util.scan.COUNT_CHUNK", 7)
+    fsource = tmp_path / "table.c"
+    content = (
+        b"#ifndef guard\r\n#define guard\r\n"
+        + b"static int table[] = {1, 2, 3};\r\n" * 50
+        + b"int main(void) {\r\n  return table[0];\r\n}\r\n#endif"
+    )
+    fsource.write_bytes(content)
+    res = analyse_source(fsource)
+    assert res.defines == [b"guard"]
+    assert res.tested == [b"guard"]
+    assert res.mains == [(53, b"int main(void) {")]
+    lines = content.splitlines()
+    assert res.mains[0][1] == lines[res.mains[0][0] - 1]
+
+
+@pytest.mark.src_test_dir(Path("tests") / Path("data") / Path("repo1"))
+def test_toscons_nested(create_repo):
+    nested = create_repo / Path("src") / Path("rep11") / Path("rep11_1")
+    deeper = nested / Path("deep")
+    deeper.mkdir()
+    (deeper / Path("src_deep.c")).write_bytes(b"int main() {\n}\n")
+    (nested / Path("src_nested.hxx")).write_bytes(b"#ifdef nested_kword\n#endif\n")
+    (create_repo / Path("src") / Path(".git")).mkdir()
+    T = toscons(create_repo / Path("src"), use_cache=False)
+    T.scan()
+    assert create_repo / Path("src") / Path(".git") not in T.dir_content
+    assert T.dir_content[deeper] == [deeper / Path("src_deep.c")]
+    assert T.dir_dir[nested] == [deeper]
+    assert T.c_dir_name == ["rep11/rep11_1/deep"]
+    assert T.hxx_only_dir_name0 == ["rep11/rep11_1"]
+    assert "rep11/rep11_1/deep/src_deep.c" in T.main_pathes
+    assert "nested_kword" in T.undefined_tested_kword
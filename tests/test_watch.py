@@ -0,0 +1,190 @@
+import contextlib
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from app.main import main
+from app.util.cache import CACHE_NAME
+from app.util.scan import toscons
+from app.util.watch import InotifyWatcher, PollWatcher, is_output, watch
+
+
+def make_poll():
+    return PollWatcher(0.05)
+
+
+def make_inotify():
+    try:
+        return InotifyWatcher()
+    except OSError:
+        pytest.skip("inotify not available")
+
+
+def run_watch(T: toscons, watcher, change, update: bool = True) -> None:
+    """
+    run one watch cycle in a thread while change modifies the tree
+    """
+    th = threading.Thread(
+        target=watch,
+        args=(T,),
+        kwargs=dict(debounce=0.2, max_cycles=1, watcher=watcher, update=update),
+    )
+    th.start()
+    # let the watcher take its first snapshot
+    time.sleep(0.3)
+    change()
+    th.join(timeout=10)
+    assert not th.is_alive()
+
+
+@pytest.mark.parametrize("make_watcher", [make_poll, make_inotify])
+def test_watch_new_main(make_watcher, copy_src):
+    src = copy_src()
+    T = toscons(src, use_cache=False)
+    T.scan()
+    assert T.write_in_SConscript()
+    before = (src / "SConscript").read_text()
+    assert "rep11/src_11_1.cxx" not in T.main_pathes
+
+    def change():
+        with open(src / "rep11" / "src_11_1.cxx", "a") as f:
+            f.write("\nint main(int argc, char **argv)\n{\n}\n")
+
+    run_watch(T, make_watcher(), change)
+    assert "rep11/src_11_1.cxx" in T.main_pathes
+    assert (src / "SConscript").read_text() != before
+
+
+def test_watch_keep_existing(copy_src, monkeypatch):
+    src = copy_src()
+    T = toscons(src, use_cache=False)
+    T.scan()
+    T.write_in_SConscript()
+    (src / "SConscript").write_text("# edited\n")
+
+    def change():
+        with open(src / "rep11" / "src_11_1.cxx", "a") as f:
+            f.write("\nint main(int argc, char **argv)\n{\n}\n")
+
+    run_watch(T, make_poll(), change, update=False)
+    assert "rep11/src_11_1.cxx" in T.main_pathes
+    assert (src / "SConscript").read_text() == "# edited\n"
+    # main passes --keep-existing to the watch
+    calls = []
+    monkeypatch.setattr("app.util.watch.watch", lambda T, **kw: calls.append(kw))
+    assert main([str(src), "--no-cache", "--watch", "--keep-existing"]) == 0
+    assert calls[0]["update"] is False
+    assert (src / "SConscript").read_text() == "# edited\n"
+
+
+@pytest.mark.parametrize("make_watcher", [make_poll, make_inotify])
+def test_watch_new_dir(make_watcher, copy_src):
+    src = copy_src()
+    T = toscons(src, use_cache=False)
+    T.scan()
+    T.write_in_SConscript()
+
+    def change():
+        (src / "rep4" / "sub").mkdir(parents=True)
+        (src / "rep4" / "sub" / "a.c").write_text("#define A\n")
+        shutil.rmtree(src / "rep30")
+
+    run_watch(T, make_watcher(), change)
+    assert T.c_dir_name == ["rep4/sub"]
+    assert "rep30" not in T.cxx_dir_name
+    assert b"A" in T.all_define
+    assert all(not p.is_relative_to(src / "rep30") for p in T.file_analysis)
+    assert "rep4/sub" in (src / "SConscript").read_text()
+
+
+def test_update_matches_scan(copy_src):
+    src = copy_src()
+    T = toscons(src, use_cache=False)
+    T.scan()
+    with open(src / "rep11" / "src_11_2.cxx", "a") as f:
+        f.write("\n#ifdef NEW_MACRO\n#endif\nint main()\n")
+    (src / "rep2" / "src_2_1.hxx").unlink()
+    T.update([src / "rep11" / "src_11_2.cxx", src / "rep2" / "src_2_1.hxx"])
+    T2 = toscons(src, use_cache=False)
+    T2.scan()
+    assert T.main_pathes == T2.main_pathes
+    assert T.undefined_tested_kword == T2.undefined_tested_kword
+    assert T.include_dirs == T2.include_dirs
+    assert set(T.file_analysis) == set(T2.file_analysis)
+    assert T2.write_in_SConscript()
+    assert not T.write_in_SConscript(update=True)
+
+
+class LostEvents:
+    """
+    watcher whose kernel queue overflowed: the changes are not known
+    """
+
+    def __init__(self):
+        self.events = [None, set()]
+
+    def watch_dirs(self, dirs):
+        pass
+
+    def read(self, timeout):
+        return self.events.pop(0) if self.events else set()
+
+    def close(self):
+        pass
+
+
+def test_watch_lost_events(tmp_path):
+    src = tmp_path / "src"
+    (src / "a").mkdir(parents=True)
+    (src / "a" / "x.c").write_text("int x(void) { return 0; }\n")
+    T = toscons(src, use_cache=False)
+    T.scan()
+    with open(src / "a" / "x.c", "a") as f:
+        f.write("int main(void) { return x(); }\n")
+    (src / "a" / "sub").mkdir()
+    (src / "a" / "sub" / "y.c").write_text("int y(void) { return 1; }\n")
+    watch(T, debounce=0, max_cycles=1, watcher=LostEvents())
+    T2 = toscons(src, use_cache=False)
+    T2.scan()
+    assert T.main_pathes == T2.main_pathes == ["a/x.c"]
+    assert T.c_dir_name == T2.c_dir_name == ["a", "a/sub"]
+    assert T.render_SConscripts() == T2.render_SConscripts()
+
+
+def test_is_output(tmp_path):
+    T = toscons(tmp_path, use_cache=False)
+    assert is_output(T, tmp_path / "SConscript")
+    assert is_output(T, tmp_path / CACHE_NAME)
+    assert is_output(T, tmp_path / ".git" / "index")
+    assert not is_output(T, tmp_path / "rep" / "SConscript")
+    assert not is_output(T, tmp_path / "rep" / "a.c")
+
+
+def test_poll_snapshot_entry_removed(tmp_path, monkeypatch):
+    (tmp_path / "a.c").write_text("int a;\n")
+    (tmp_path / "b.c").write_text("int b;\n")
+    scandir = os.scandir
+
+    class Gone:
+        """
+        entry removed between the listing and its stat
+        """
+
+        def __init__(self, e):
+            self.path = e.path
+
+        def stat(self, follow_symlinks=True):
+            raise FileNotFoundError(self.path)
+
+    @contextlib.contextmanager
+    def racy_scandir(p):
+        with scandir(p) as it:
+            yield [Gone(e) if e.name == "a.c" else e for e in it]
+
+    monkeypatch.setattr(os, "scandir", racy_scandir)
+    watcher = PollWatcher()
+    watcher.dirs = {tmp_path}
+    assert list(watcher._snapshot()) == [tmp_path / "b.c"]
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from app.util.scan import toscons
+from app.util.write import current_umask, line_diff, write_if_changed
+
+
+def test_write_if_changed(tmp_path):
+    path = tmp_path / "SConscript"
+    assert write_if_changed(path, "a\nb\n") == (True, "")
+    os.utime(path, ns=(0, 10 ** 18))
+    # same content, the file is not touched
+    assert write_if_changed(path, "a\nb\n", diff=True) == (False, "")
+    assert path.stat().st_mtime_ns == 10 ** 18
+    res = write_if_changed(path, "a\nc\n", update=False, diff=True)
+    assert not res.written
+    assert "-b\n+c\n" in res.diff
+    assert path.read_text() == "a\nb\n"
+    assert write_if_changed(path, "a\nc\n").written
+    assert path.read_text() == "a\nc\n"
+    assert path.stat().st_mtime_ns != 10 ** 18
+    assert os.listdir(tmp_path) == ["SConscript"]
+
+
+def test_write_mode(tmp_path):
+    mask = os.umask(0o027)
+    try:
+        assert write_if_changed(tmp_path / "new", "a\n").written
+    finally:
+        os.umask(mask)
+    # a new file gets the mode open gives it
+    assert (tmp_path / "new").stat().st_mode & 0o777 == 0o640
+    os.chmod(tmp_path / "new", 0o600)
+    assert write_if_changed(tmp_path / "new", "b\n").written
+    # a file replaced keeps its mode
+    assert (tmp_path / "new").stat().st_mode & 0o777 == 0o600
+    assert current_umask() == mask
+
+
+def test_line_diff():
+    diff = line_diff("x = 1\ny = 2\n", "x = 1\ny = 3\n", "SConscript")
+    assert diff.splitlines() == [
+        "--- SConscript",
+        "+++ SConscript",
+        "@@ -1,2 +1,2 @@",
+        " x = 1",
+        "-y = 2",
+        "+y = 3",
+    ]
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_write_component_sconscripts(monkeypatch, jobs, copy_src):
+    monkeypatch.setattr("app.util.scan.PARALLEL_WRITE_MIN", 0)
+    src = copy_src()
+    T = toscons(src, jobs=jobs, threads=True, use_cache=False)
+    T.scan()
+    assert T.write_in_SConscript() == 3
+    content = (src / "rep11" / "SConscript").read_text()
+    assert "'src_11_1.cxx', 'src_11_2.cxx'" in content
+    assert "hxx" not in content
+    # header only directories get no SConscript
+    assert not (src / "rep2" / "SConscript").exists()
+    assert T.write_in_SConscript() == 0
+    assert T.stats.sconscripts_skipped == 3
+    # a new source changes the SConscript of its directory only
+    (src / "rep30" / "new.cxx").write_text("int f();\n")
+    T2 = toscons(src, jobs=jobs, threads=True, use_cache=False)
+    T2.scan()
+    assert T2.write_in_SConscript() == 1
+    assert "'new.cxx'" in (src / "rep30" / "SConscript").read_text()